@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+from savedata_manager import SaveDataManager, format_bytes
+
+# Synthetic save-tree shapes. Every shape gets a live save dir plus two checkpoints
+# (the initial tree and a lightly edited copy) so replace always has work to do.
+SHAPES = ('game_data', 'many_small', 'large')
+OPERATIONS = ('backup_savedata', 'replace_savedata', 'recover_savedata', 'list_backups', 'list_checkpoints')
+BLOCK = 1024 * 1024
+
+def write_random(path, size, rng):
+    """Write size pseudo-random (incompressible, non-repeating) bytes to path"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            n = min(BLOCK, remaining)
+            f.write(rng.randbytes(n))
+            remaining -= n
+
+def make_tree(root, shape, rng, args):
+    """Generate one of SHAPES under root. Returns (file_count, total_bytes)."""
+    if shape == 'game_data':
+        # Same size range as the shipped chapter checkpoints
+        sizes = {'GAME_DATA': rng.randint(3 * 1024, 26 * 1024)}
+    elif shape == 'many_small':
+        sizes = {f"d{i % 50:02d}/f{i:05d}.dat": rng.randint(256, 16 * 1024) for i in range(args.small_files)}
+    else:
+        sizes = {f"large{i}.bin": args.large_mb * BLOCK for i in range(args.large_files)}
+    for rel_path, size in sizes.items():
+        write_random(os.path.join(root, rel_path), size, rng)
+    return len(sizes), sum(sizes.values())
+
+def touch_tree(root, rng):
+    """Overwrite a few bytes of one file so the next backup is a real new snapshot"""
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        files.extend(os.path.join(dirpath, name) for name in filenames)
+    path = rng.choice(sorted(files))
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.seek(rng.randrange(max(size - 64, 1)))
+        f.write(rng.randbytes(min(64, size)))
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+def summarize(samples, tree_bytes=None):
+    """p50/p95 latency in seconds, plus throughput in bytes/s of the logical save tree"""
+    result = {
+        'runs': len(samples),
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'mean': sum(samples) / len(samples),
+    }
+    if tree_bytes is not None:
+        result['throughput'] = tree_bytes / result['p50'] if result['p50'] else None
+    return result
+
+def run_shape(shape, args):
+    """Benchmark every operation on one shape inside a fresh temp root"""
+    rng = random.Random(args.seed)
+    root = tempfile.mkdtemp(prefix=f'savedata-bench-{shape}-', dir=args.tmp_dir)
+    try:
+        save_dir = os.path.join(root, 'LocalLow', 'WomanCommunication')
+        checkpoints_dir = os.path.join(root, 'checkpoints')
+        file_count, tree_bytes = make_tree(save_dir, shape, rng, args)
+        shutil.copytree(save_dir, os.path.join(checkpoints_dir, 'chapter-a'))
+        shutil.copytree(save_dir, os.path.join(checkpoints_dir, 'chapter-b'))
+        touch_tree(os.path.join(checkpoints_dir, 'chapter-b'), rng)
+
+        # Retention is off so a background prune never lands inside a timed call
+        manager = SaveDataManager(game_save_dir=save_dir, checkpoints_dir=checkpoints_dir,
+                                  store_dir=os.path.join(root, 'store'), checkpoint_archives=[],
+                                  retention=False, quiet=True, copy_workers=args.workers)
+        samples = {name: [] for name in OPERATIONS}
+
+        def timed(name, call):
+            start = time.perf_counter()
+            ok = call()
+            samples[name].append(time.perf_counter() - start)
+            if ok is False:
+                raise RuntimeError(f"{name} failed: {manager.last_error}")
+            return ok
+
+        snapshot_ids = []
+        for _ in range(args.runs):
+            touch_tree(save_dir, rng)
+            timed('backup_savedata', lambda: manager.backup_savedata(silent=True))
+            snapshot_ids.append(manager.last_snapshot_id)
+        for i in range(args.runs):
+            # Alternate so every call has to copy
+            timed('replace_savedata', lambda: manager.replace_savedata(('chapter-a', 'chapter-b')[i % 2]))
+        for i in range(args.runs):
+            timed('recover_savedata', lambda: manager.recover_savedata(snapshot_ids[i % len(snapshot_ids)]))
+        for _ in range(args.runs):
+            timed('list_backups', manager.list_backups)
+            timed('list_checkpoints', manager.list_checkpoints)
+
+        copies = ('backup_savedata', 'replace_savedata', 'recover_savedata')
+        return {
+            'shape': shape,
+            'files': file_count,
+            'bytes': tree_bytes,
+            'operations': {name: summarize(values, tree_bytes if name in copies else None)
+                           for name, values in samples.items()},
+            'peak_rss': peak_rss(),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def run_isolated(shape, args):
+    """Run one shape in a child process so its peak RSS is its own"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', shape,
+               '--runs', str(args.runs), '--seed', str(args.seed),
+               '--small-files', str(args.small_files),
+               '--large-files', str(args.large_files), '--large-mb', str(args.large_mb)]
+    if args.tmp_dir:
+        command += ['--tmp-dir', args.tmp_dir]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output)
+
+def compare(results, baseline, tolerance):
+    """Return (shape, operation, baseline p50, current p50) for every p50 slower than tolerance allows"""
+    regressions = []
+    for shape, current in results['shapes'].items():
+        previous = baseline.get('shapes', {}).get(shape)
+        if not previous:
+            continue
+        for name, stats in current['operations'].items():
+            old = previous['operations'].get(name)
+            if old and stats['p50'] > old['p50'] * (1 + tolerance):
+                regressions.append((shape, name, old['p50'], stats['p50']))
+    return regressions
+
+def print_report(result):
+    print(f"\n{result['shape']}: {result['files']} file(s), {format_bytes(result['bytes'])}, "
+          f"peak RSS {format_bytes(result['peak_rss']) if result['peak_rss'] else 'n/a'}")
+    for name, stats in result['operations'].items():
+        throughput = stats.get('throughput')
+        rate = f"  {format_bytes(throughput)}/s" if throughput else ''
+        print(f"  {name:<18} p50 {stats['p50'] * 1000:9.2f} ms  p95 {stats['p95'] * 1000:9.2f} ms{rate}")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark SaveDataManager on synthetic save trees")
+    parser.add_argument('--shape', action='append', choices=SHAPES,
+                        help="shape to run (repeatable, default: all)")
+    parser.add_argument('--runs', type=int, default=10, help="timed calls per operation (default 10)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--small-files', type=int, default=5000, help="file count for many_small")
+    parser.add_argument('--large-files', type=int, default=2, help="file count for large")
+    parser.add_argument('--large-mb', type=int, default=2048, help="size of each large file in MiB")
+    parser.add_argument('--workers', type=int, help="copy workers passed to SaveDataManager (default: auto)")
+    parser.add_argument('--tmp-dir', help="where to create the temp roots (default: system temp)")
+    parser.add_argument('--output', help="write the results as a JSON baseline")
+    parser.add_argument('--baseline', help="compare p50 latencies against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p50 slowdown against the baseline (default 0.2 = 20%%)")
+    parser.add_argument('--child', choices=SHAPES, help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.child:
+        print(json.dumps(run_shape(args.child, args)))
+        return 0
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'runs': args.runs,
+        'workers': args.workers,
+        'shapes': {},
+    }
+    for shape in args.shape or SHAPES:
+        result = run_isolated(shape, args)
+        results['shapes'][shape] = result
+        print_report(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for shape, name, old, new in regressions:
+            print(f"REGRESSION {shape}/{name}: p50 {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            return 1
+        print("\nNo regressions against the baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import os
 import shutil
 import subprocess
+import sys
+import time
+import statistics
 
 def clean_build_dirs():
     """Clean up build and dist directories"""
@@ -13,14 +16,60 @@ def clean_build_dirs():
     if os.path.exists('savedata_manager.spec'):
         os.remove('savedata_manager.spec')
 
-def build_exe():
-    """Build the executable"""
+EXE_NAME = 'SavedataManager.exe'
+# Checkpoint library shipped next to the exe, see build_checkpoint_pack
+PACK_NAME = 'checkpoints.wcpack'
+# onefile unpacks the whole bundle to a temp dir on every launch and UPX adds
+# decompression on top; the fast profile ships a folder and starts straight away
+VARIANTS = ('onefile', 'fast')
+
+# Compact instead of appending once this share of the pack is unreachable
+PACK_COMPACT_RATIO = 0.5
+
+def build_checkpoint_pack(pack_path=PACK_NAME, checkpoints_dir='checkpoints', keep_removed=False, compact=False):
+    """
+    Pack the checkpoint folders and the shipped checkpoint zip into one .wcpack with
+    precomputed hashes. An existing pack is appended to: only new or changed checkpoints
+    are written, and checkpoints no longer in the sources are dropped unless keep_removed.
+    The pack is rewritten without unreachable bytes when compact is set or they make up
+    more than PACK_COMPACT_RATIO of it.
+    """
+    from savedata_manager import (HashCache, DirCheckpoint, ZipCheckpointArchive, write_checkpoint_pack,
+                                  pack_dead_bytes, get_app_path, CHECKPOINT_ZIP_NAME)
+    # Never saved: digests are only needed for this one run
+    hash_cache = HashCache(os.path.join('build', 'pack-hashcache.json'))
+    sources = {}
+    # Only the known archive: a stray zip next to the script must not end up in the shipped pack
+    zip_path = os.path.join(get_app_path(), CHECKPOINT_ZIP_NAME)
+    if os.path.isfile(zip_path):
+        sources.update(ZipCheckpointArchive(zip_path, hash_cache).load())
+    # Folders win over zip members of the same name, as at runtime
+    if os.path.isdir(checkpoints_dir):
+        for name in sorted(os.listdir(checkpoints_dir)):
+            path = os.path.join(checkpoints_dir, name)
+            if os.path.isdir(path):
+                sources[name] = DirCheckpoint(name, path, hash_cache)
+    written, dropped = write_checkpoint_pack(pack_path, sources, keep_removed=keep_removed)
+    print(f"Checkpoint pack {pack_path}: {len(sources)} checkpoint(s), "
+          f"{len(written)} written{': ' + ', '.join(written) if written else ''}"
+          f"{', dropped: ' + ', '.join(dropped) if dropped else ''}")
+    dead = pack_dead_bytes(pack_path)
+    if dead and (compact or dead > os.path.getsize(pack_path) * PACK_COMPACT_RATIO):
+        write_checkpoint_pack(pack_path, sources, keep_removed=keep_removed, compact=True)
+        print(f"Compacted {pack_path}: reclaimed {dead} bytes")
+    return pack_path
+
+def build_exe(variant='onefile', keep_removed=False, compact_pack=False):
+    """Build the executable. 'fast' produces a onedir build in ./SavedataManager/"""
     print("Cleaning previous build files...")
     clean_build_dirs()
+
+    print("\nPacking checkpoints...")
+    build_checkpoint_pack(keep_removed=keep_removed, compact=compact_pack)
     
-    print("\nCreating .spec file...")
+    print(f"\nCreating .spec file ({variant})...")
     with open('savedata_manager.spec', 'w', encoding='utf-8') as f:
-        f.write(SPEC_CONTENT)
+        f.write(make_spec(variant))
     
     print("\nBuilding executable...")
     subprocess.run(['pyinstaller', 'savedata_manager.spec'], check=True)
@@ -30,18 +79,109 @@ def build_exe():
     shutil.rmtree('build')
     os.remove('savedata_manager.spec')
     
-    # Move executable to current directory
-    exe_name = 'SavedataManager.exe'
-    src_path = os.path.join('dist', exe_name)
-    if os.path.exists(exe_name):
-        os.remove(exe_name)
-    shutil.move(src_path, exe_name)
+    if variant == 'fast':
+        # Move the whole onedir folder to the current directory
+        out_name = 'SavedataManager'
+        if os.path.exists(out_name):
+            shutil.rmtree(out_name)
+        shutil.move(os.path.join('dist', out_name), out_name)
+        created = os.path.join(out_name, EXE_NAME)
+    else:
+        # Move executable to current directory
+        if os.path.exists(EXE_NAME):
+            os.remove(EXE_NAME)
+        shutil.move(os.path.join('dist', EXE_NAME), EXE_NAME)
+        created = EXE_NAME
     shutil.rmtree('dist')
+
+    # The pack is never bundled into the exe (see SPEC_ANALYSIS), whatever the variant
+    pack_path = os.path.join(os.path.dirname(created), PACK_NAME)
+    if os.path.abspath(pack_path) != os.path.abspath(PACK_NAME):
+        shutil.copy2(PACK_NAME, pack_path)
     
-    print(f"\nBuild complete! Created: {exe_name}")
+    print(f"\nBuild complete! Created: {created}")
+    print(f"Checkpoints: {pack_path} (ship it in the same folder as {EXE_NAME}, "
+          f"the exe reads the checkpoints from next to itself)")
+    return created
+
+def startup_command(target):
+    """Command line that launches target, a built exe or the savedata_manager.py script"""
+    if target.endswith('.py'):
+        # -B so the script is compiled on every launch like a fresh checkout
+        return [sys.executable, '-B', target]
+    return [target]
+
+def time_launch(command, env):
+    """Seconds from spawn until the menu is drawn and the probe exits"""
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def evict_file_cache(target):
+    """
+    Drop target's files from the OS file cache so the next launch reads them from disk:
+    the exe (or script), and for a onedir build its whole folder. Returns False where
+    this isn't possible (no posix_fadvise, e.g. Windows); the interpreter of a .py
+    target and shared system libraries are never evicted.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    folder = os.path.dirname(os.path.abspath(target))
+    paths = [target]
+    if os.path.isdir(os.path.join(folder, '_internal')):
+        paths = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(folder) for name in names]
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+def summarize_launches(label, times):
+    if len(times) == 1:
+        print(f"  {label:<10} {times[0] * 1000:8.1f} ms")
+    else:
+        print(f"  {label:<10} {min(times) * 1000:8.1f} ms min  "
+              f"{statistics.median(times) * 1000:8.1f} ms median  {statistics.mean(times) * 1000:8.1f} ms mean")
+
+def bench_startup(target, launches=5):
+    """
+    Launch target with the startup probe set and report startup times: N cold launches,
+    each after evicting target's files from the OS file cache (see evict_file_cache), then
+    N warm launches. Where the cache can't be evicted only the first launch is reported
+    separately, as "first run": it is not necessarily cold, since the files may still be
+    cached from the build or an earlier run.
+    """
+    env = dict(os.environ, SAVEDATA_MANAGER_STARTUP_PROBE='1')
+    command = startup_command(target)
+    results = {}
+    if evict_file_cache(target):
+        cold = []
+        for _ in range(launches):
+            evict_file_cache(target)
+            cold.append(time_launch(command, env))
+        results['cold'] = cold
+    else:
+        results['first_run'] = [time_launch(command, env)]
+    results['warm'] = [time_launch(command, env) for _ in range(launches)]
+    print(f"\nStartup time for {target} ({sum(map(len, results.values()))} launches):")
+    for label, times in results.items():
+        summarize_launches(label.replace('_', ' ') + ':', times)
+    return results
+
+def make_spec(variant='onefile'):
+    """PyInstaller spec for the chosen variant"""
+    if variant == 'fast':
+        return SPEC_ANALYSIS + SPEC_FAST
+    return SPEC_ANALYSIS + SPEC_ONEFILE
 
 # Spec file content
-SPEC_CONTENT = '''# -*- mode: python ; coding: utf-8 -*-
+SPEC_ANALYSIS = '''# -*- mode: python ; coding: utf-8 -*-
 
 block_cipher = None
 
@@ -49,12 +189,16 @@ a = Analysis(
     ['savedata_manager.py'],
     pathex=[],
     binaries=[],
-    datas=[('checkpoints', 'checkpoints')],
+    # Checkpoints are read from next to the exe (checkpoints.wcpack, checkpoints/ or
+    # 各章节存档.zip), so they are not bundled and nothing is extracted at launch;
+    # build_exe puts checkpoints.wcpack next to the exe for every variant
+    datas=[],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Stdlib modules the manager never uses but which hooks would otherwise pull in
+    excludes=['tkinter', 'unittest', 'pydoc', 'doctest', 'email', 'http', 'xml', 'pdb', 'sqlite3'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -62,7 +206,9 @@ a = Analysis(
 )
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+'''
 
+SPEC_ONEFILE = '''
 exe = EXE(
     pyz,
     a.scripts,
@@ -86,5 +232,58 @@ exe = EXE(
 )
 '''
 
+SPEC_FAST = '''
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='SavedataManager',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+    icon='blue-male-gender-symbol-free-vector.ico'
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='SavedataManager',
+)
+'''
+
 if __name__ == '__main__':
-    build_exe()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Build SavedataManager.exe")
+    parser.add_argument('--variant', choices=VARIANTS, default='onefile',
+                        help="onefile: single exe (default); fast: onedir folder without UPX, quicker to start")
+    parser.add_argument('--bench-startup', type=int, metavar='N',
+                        help="launch the build N times cold and N times warm and report startup time")
+    parser.add_argument('--target', help="exe or .py to benchmark instead of building first")
+    parser.add_argument('--pack-only', action='store_true',
+                        help=f"only create or append to {PACK_NAME}, without building the exe")
+    parser.add_argument('--keep-removed', action='store_true',
+                        help="keep checkpoints no longer in checkpoints/ in the pack (append-only history)")
+    parser.add_argument('--compact-pack', action='store_true',
+                        help=f"rewrite {PACK_NAME} without dropped checkpoints and superseded indexes")
+    args = parser.parse_args()
+    if args.pack_only:
+        build_checkpoint_pack(keep_removed=args.keep_removed, compact=args.compact_pack)
+        sys.exit(0)
+    if args.target:
+        target = args.target
+    else:
+        target = build_exe(args.variant, args.keep_removed, args.compact_pack)
+    if args.bench_startup:
+        bench_startup(target, args.bench_startup)
@@ -1,12 +1,18 @@
 import os
 import shutil
 from datetime import datetime
-import glob
-from pathlib import Path
-import re
 import time
 import sys
 import threading
+import hashlib
+import json
+import struct
+import zlib
+import io
+import functools
+import errno
+import contextlib
+import collections
 
 # ANSI escape codes for colors and formatting
 GREEN = '\033[32m'
@@ -18,76 +24,3552 @@ CLEAR_SCREEN = '\033[2J\033[H'
 CURSOR_UP = '\033[F'
 CLEAR_LINE = '\033[K'
 
+def format_bytes(num_bytes):
+    """Format a byte count using binary units, e.g. 25.8 KB"""
+    size = float(num_bytes)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_duration(seconds):
+    """Format seconds as M:SS (or H:MM:SS for long runs)"""
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+class TerminalSize:
+    """
+    Cached terminal size. Where the platform has SIGWINCH the cache is only
+    refreshed after a resize signal; elsewhere it is re-queried at most every poll_interval.
+    """
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self.size = None
+        self.dirty = True
+        self.checked = 0.0
+        self.signal_driven = False
+
+    def install(self):
+        """Listen for SIGWINCH. Only possible from the main thread; harmless to call twice."""
+        if self.signal_driven:
+            return
+        import signal
+        if not hasattr(signal, 'SIGWINCH'):
+            return
+        try:
+            previous = signal.getsignal(signal.SIGWINCH)
+
+            def on_resize(signum, frame):
+                self.dirty = True
+                if callable(previous):
+                    previous(signum, frame)
+
+            signal.signal(signal.SIGWINCH, on_resize)
+        except ValueError:
+            return  # not the main thread
+        self.signal_driven = True
+
+    def get(self):
+        now = time.monotonic()
+        if self.dirty or (not self.signal_driven and now - self.checked >= self.poll_interval):
+            self.dirty = False
+            self.checked = now
+            self.size = shutil.get_terminal_size()
+        return self.size
+
+TERMINAL = TerminalSize()
+
+def char_width(ch):
+    """Terminal columns taken by a character: 2 for CJK and other wide characters"""
+    if ch < 'ᄀ':
+        return 1
+    import unicodedata
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+# File-system audit events (see sys.addaudithook) counted per span while tracing
+TRACE_AUDIT_EVENTS = {
+    'open': 'open', 'os.listdir': 'listdir', 'os.scandir': 'scandir', 'os.mkdir': 'mkdir',
+    'os.rename': 'rename', 'os.remove': 'remove', 'os.rmdir': 'rmdir', 'os.utime': 'utime',
+    'os.chmod': 'chmod', 'os.link': 'link', 'os.truncate': 'truncate', 'mmap.__new__': 'mmap',
+    'shutil.copyfile': 'copyfile', 'shutil.rmtree': 'rmtree',
+}
+
+class NullSpan:
+    """What Tracer.span hands out while tracing is off: a reusable context that records nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    """One timed block: its args, byte/file counts and audit event counts, including its children's"""
+    def __init__(self, tracer, name, parent, args):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.args = args
+        self.counts = {}
+        self.start = 0.0
+
+    def add(self, **counts):
+        """Add to this span's counters, e.g. span.add(bytes=n, files=1)"""
+        with self.tracer.lock:
+            for key, value in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self.tracer.stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.tracer.stack().pop()
+        self.tracer.finish(self, end, exc_type)
+        return False
+
+class Tracer:
+    """
+    Span recorder behind --profile. While disabled span() returns NULL_SPAN, so
+    instrumented code costs an attribute check. Enabled, every span becomes a Chrome
+    trace "complete" event (chrome://tracing or ui.perfetto.dev) carrying its bytes,
+    files and the file-system audit events raised inside it. A span's parent is the
+    span open on the same thread, or the one passed in for work handed to a pool.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.origin = 0.0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread_names = {}
+        self.hooked = False
+
+    def enable(self):
+        self.events = []
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+        if not self.hooked:
+            # Audit hooks can't be removed again; audit() returns at once while disabled
+            sys.addaudithook(self.audit)
+            self.hooked = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def current(self):
+        """Innermost open span on this thread, or None"""
+        if not self.enabled:
+            return None
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def span(self, name, parent=None, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, parent or self.current(), args)
+
+    def add(self, **counts):
+        """Add counters to the innermost open span on this thread"""
+        span = self.current()
+        if span is not None:
+            span.add(**counts)
+
+    def audit(self, event, args):
+        if not self.enabled:
+            return
+        kind = TRACE_AUDIT_EVENTS.get(event)
+        if kind is None:
+            return
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            counts = stack[-1].counts
+            with self.lock:
+                counts[kind] = counts.get(kind, 0) + 1
+
+    def finish(self, span, end, exc_type):
+        with self.lock:
+            if span.parent is not None:
+                for key, value in span.counts.items():
+                    span.parent.counts[key] = span.parent.counts.get(key, 0) + value
+            args = {**span.args, **span.counts}
+            if exc_type is not None:
+                args['error'] = exc_type.__name__
+            tid = threading.get_ident()
+            if tid not in self.thread_names:
+                self.thread_names[tid] = threading.current_thread().name
+            self.events.append({
+                'name': span.name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                'ts': (span.start - self.origin) * 1e6, 'dur': (end - span.start) * 1e6, 'args': args,
+            })
+
+    def summary(self):
+        """Per span name: count, wall seconds and summed counters, the slowest first"""
+        totals = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            total = totals.setdefault(event['name'], {'count': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['seconds'] += event['dur'] / 1e6
+            for key, value in event['args'].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+        return dict(sorted(totals.items(), key=lambda item: -item[1]['seconds']))
+
+    def write_chrome_trace(self, path):
+        """Write the recorded spans as Chrome trace JSON, with thread names"""
+        with self.lock:
+            events = list(self.events)
+            names = dict(self.thread_names)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in names.items()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+
+TRACER = Tracer()
+
+def traced(func):
+    """Record every call of func as a span named after it while tracing is on"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not TRACER.enabled:
+            return func(*args, **kwargs)
+        with TRACER.span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+class FrameRenderer:
+    """
+    Draws a block of lines at the bottom of the terminal and keeps it updated.
+    A frame is a list of lines, a line a list of (style, text) segments. Each frame
+    rewrites only the cells that changed since the last one, goes out as a single
+    write, and frames come at most fps times a second.
+    """
+    # Unchanged cells shorter than this between two changes are rewritten rather than skipped over
+    RUN_GAP = 6
+
+    def __init__(self, fps=20, stream=None, terminal=TERMINAL):
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.stream = stream or sys.stdout
+        self.terminal = terminal
+        self.cells = []
+        self.columns = None
+        self.last_frame = float('-inf')
+        self.bytes_written = 0
+
+    def due(self, now=None):
+        """True when the frame-rate cap allows another frame"""
+        now = time.perf_counter() if now is None else now
+        return now - self.last_frame >= self.frame_interval
+
+    def layout(self, line, columns):
+        """Cells (style, char) of a line, cut to fit so it never wraps; wide chars are followed by a (style, '') cell"""
+        cells = []
+        for style, text in line:
+            for ch in text:
+                width = char_width(ch)
+                if len(cells) + width > columns - 1:
+                    return cells
+                cells.append((style, ch))
+                if width == 2:
+                    cells.append((style, ''))
+        return cells
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+        self.bytes_written += len(data.encode('utf-8', 'replace'))
+
+    def start(self, frame):
+        """Print the first frame below the cursor. The cursor is parked at the start of its last line."""
+        self.columns = self.terminal.get().columns
+        self.cells = [self.layout(line, self.columns) for line in frame]
+        self.last_frame = time.perf_counter()
+        out = []
+        for i, cells in enumerate(self.cells):
+            if i:
+                out.append('\n')
+            out.append(self.paint(cells, 0, len(cells)))
+        out.append(RESET + '\r')
+        self.write(''.join(out))
+
+    def paint(self, cells, start, end, style=None):
+        """Text for cells[start:end], switching style only where it changes"""
+        out = []
+        for cell_style, ch in cells[start:end]:
+            if cell_style != style:
+                out.append(cell_style)
+                style = cell_style
+            out.append(ch)
+        return ''.join(out)
+
+    def changed_runs(self, old, new):
+        """[start, end) cell ranges that differ, merged across short unchanged gaps"""
+        runs = []
+        for i in range(max(len(old), len(new))):
+            if i < len(old) and i < len(new) and old[i] == new[i]:
+                continue
+            if runs and i - runs[-1][1] <= self.RUN_GAP:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+        for run in runs:
+            # Never start on the right half of a wide character or end on its left half
+            if run[0] < len(new) and new[run[0]][1] == '' and run[0] > 0:
+                run[0] -= 1
+            if run[1] < len(new) and new[run[1]][1] == '':
+                run[1] += 1
+        return runs
+
+    def render(self, frame, now=None, force=False):
+        """Draw frame if the frame-rate cap allows (or force). Returns True when something was drawn."""
+        now = time.perf_counter() if now is None else now
+        if not force and not self.due(now):
+            return False
+        with TRACER.span('render') as span:
+            drawn = self.draw(frame, now)
+            span.add(frames=int(drawn))
+        return drawn
+
+    def draw(self, frame, now):
+        """Write the cells of frame that differ from the last one drawn"""
+        self.last_frame = now
+        columns = self.terminal.get().columns
+        last_row = len(self.cells) - 1
+        if columns != self.columns:
+            # The terminal reflowed the old block; redraw it whole from its first line
+            self.columns = columns
+            old_cells = [[] for _ in frame]
+            out = [f"\033[{last_row}A" if last_row > 0 else '', '\r\033[J']
+            row = 0
+        else:
+            old_cells = self.cells
+            out = []
+            row = last_row
+        new_cells = [self.layout(line, columns) for line in frame]
+        for target, (old, new) in enumerate(zip(old_cells, new_cells)):
+            runs = self.changed_runs(old, new)
+            if not runs:
+                continue
+            if row != target:
+                out.append(f"\033[{row - target}A" if row > target else f"\033[{target - row}B")
+                row = target
+            for start, end in runs:
+                out.append(f"\033[{start + 1}G")
+                out.append(self.paint(new, start, min(end, len(new))))
+                if end > len(new):
+                    out.append(RESET + CLEAR_LINE)
+        self.cells = new_cells
+        if not out:
+            return False
+        if row != last_row:
+            out.append(f"\033[{last_row - row}B")
+        out.append(RESET + '\r')
+        data = ''.join(out)
+        TRACER.add(bytes=len(data))
+        self.write(data)
+        return True
+
+    def finish(self):
+        """Leave the block in place and move below it"""
+        self.write('\n')
+
 class ProgressDisplay:
-    def __init__(self, total_steps=50, interval=0.05):
+    def __init__(self, interval=0.05):
         """
         Initialize progress display
-        total_steps: number of steps to complete the bar
-        interval: time between updates in seconds
+        interval: minimum time between redraws in seconds (the copy itself never waits on it),
+        i.e. the frame rate is 1 / interval
         """
-        self.total_steps = total_steps
         self.interval = interval
-        self.current_step = 0
+        self.message = ""
+        self.total_bytes = 0
+        self.total_files = 0
+        self.start_time = 0.0
+        self.renderer = None
         
-    def start(self, ui, message=""):
-        """Start the progress display"""
-        self.current_step = 0
-        print(f"{GREEN}> {message}{RESET}")
-        print(f"{GREEN}> 0.0% [>{'-' * (os.get_terminal_size().columns - 20)}] 0.0 PB/s{RESET}")
+    def start(self, ui, message="", total_bytes=0, total_files=0):
+        """Start the progress display for a job of known size"""
+        self.message = message
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.start_time = time.perf_counter()
+        TERMINAL.install()
+        self.renderer = FrameRenderer(fps=1.0 / self.interval if self.interval else 0)
+        self.renderer.start(ui.progress_lines(0.0, message, "0 B/s", TERMINAL.get().columns))
         
-    def update(self, ui, message=""):
-        """Update progress display"""
-        self.current_step += 1
-        progress = (self.current_step / self.total_steps) * 100
-        speed = f"{(self.current_step / self.total_steps) * 9.2:.1f} PB/s"
-        ui.draw_progress_bar(progress, message, speed)
-        time.sleep(self.interval)
+    def update(self, ui, bytes_done, files_done, force=False):
+        """Redraw with real byte/file counts, at most once per interval unless forced"""
+        now = time.perf_counter()
+        if not force:
+            if not self.renderer.due(now):
+                return
+            # On slow SSH/serial consoles the bar must not cost more bytes than the copy itself
+            if self.renderer.bytes_written > bytes_done:
+                return
+
+        elapsed = max(now - self.start_time, 1e-9)
+        if self.total_bytes:
+            progress = bytes_done / self.total_bytes * 100
+        elif self.total_files:
+            progress = files_done / self.total_files * 100
+        else:
+            progress = 100.0
+        rate = bytes_done / elapsed
+        status = f"{format_bytes(rate)}/s {files_done}/{self.total_files}"
+        if bytes_done < self.total_bytes and rate > 0:
+            status += f" ETA {format_duration((self.total_bytes - bytes_done) / rate)}"
+        frame = ui.progress_lines(min(progress, 100.0), self.message, status, TERMINAL.get().columns)
+        self.renderer.render(frame, now, force)
+
+    def finish(self, ui, bytes_done, files_done):
+        """Draw the final state and report the elapsed time"""
+        self.update(ui, bytes_done, files_done, force=True)
+        self.renderer.finish()
+        return time.perf_counter() - self.start_time
+
+    def handle(self, ui, event):
+        """Operation event subscriber: draws the visible copies, ignores everything else"""
+        if event['type'] == 'copy':
+            if event['visible']:
+                self.start(ui, event['message'], event['total_bytes'], event['total_files'])
+        elif self.renderer is None:
+            return
+        elif event['type'] == 'progress':
+            self.update(ui, event['bytes'], event['files'])
+        elif event['type'] == 'copy_end':
+            if event['aborted']:
+                # Keep the error message off the progress line
+                print()
+            else:
+                self.finish(ui, event['bytes'], event['files'])
+            self.renderer = None
+
+class TerminalUI:
+    @staticmethod
+    def clear_screen():
+        """Clear the terminal screen"""
+        print(CLEAR_SCREEN, end='')
+
+    @staticmethod
+    def draw_header(text):
+        """Draw a decorated header with animated bars"""
+        width = TERMINAL.get().columns
+        print(GREEN + "=" * width + RESET)
         
-    def is_complete(self):
-        """Check if progress is complete"""
-        return self.current_step >= self.total_steps
+        # Center the text
+        padding = (width - len(text)) // 2
+        print(GREEN + " " * padding + BRIGHT_GREEN + text + RESET)
+        print(GREEN + "=" * width + RESET)
+
+    @staticmethod
+    def progress_lines(progress, message, speed, columns):
+        """The two progress lines as a FrameRenderer frame"""
+        width = max(columns - 20, 10)  # Leave space for percentage
+        filled = int(width * progress / 100)
+        return [
+            [(GREEN, f"> {message}")],
+            [(GREEN, f"> {progress:5.1f}% [>"), (BRIGHT_GREEN, '=' * filled),
+             (GREEN, '-' * (width - filled) + f"] {speed}")],
+        ]
+
+    @staticmethod
+    def print_menu():
+        """Print the main menu"""
+        print(f"\n{GREEN}Game Savedata Manager")
+        print(f"{BRIGHT_GREEN}1. 替换现有存档为指定存档")
+        print("2. 备份当前存档")
+        print("3. 恢复备份存档")
+        print(f"4. 退出{RESET}")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Files this big are hashed through a memory map, a window at a time, instead of read() copies
+HASH_MMAP_MIN_SIZE = 16 * 1024 * 1024
+HASH_MMAP_WINDOW = 64 * 1024 * 1024
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file, read in chunks (large files through mmap windows)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= HASH_MMAP_MIN_SIZE:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), HASH_MMAP_WINDOW):
+                        digest.update(view[offset:offset + HASH_MMAP_WINDOW])
+                finally:
+                    view.release()
+            return digest.hexdigest()
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def move_file(src, dst):
+    """Rename src to dst, falling back to copy and delete across filesystems"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+        os.remove(src)
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a copy where links aren't possible"""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def fsync_file(path):
+    """Flush a file's data to disk"""
+    with open(path, 'r+b') as f:
+        os.fsync(f.fileno())
+
+def write_json_atomic(path, data, durable=False):
+    """Write JSON to a temp file next to path and rename it into place"""
+    write_text_atomic(path, json.dumps(data, ensure_ascii=False, indent=1), durable)
+
+def write_text_atomic(path, text, durable=False):
+    """Write text to a temp file next to path and rename it into place; durable=True fsyncs it first"""
+    # Named per process and thread, so concurrent writers of one path never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(text)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class HashCache:
+    """
+    Persistent sha256 cache keyed by (path, size, mtime_ns, inode).
+    A file whose key is unchanged is never read again to learn its digest.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def _key(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def lookup(self, path, st=None):
+        """Cached digest of path, or None when the file changed or was never hashed"""
+        st = st or os.stat(path)
+        return self.lookup_stamp(os.path.abspath(path), self._key(st))
+
+    def record(self, path, digest, st=None):
+        st = st or os.stat(path)
+        self.record_stamp(os.path.abspath(path), self._key(st), digest)
+
+    def lookup_stamp(self, key, stamp):
+        """Cached digest for any keyed item (e.g. a zip member) whose stamp list is unchanged"""
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry[-1] if entry[:-1] == stamp else None
+
+    def record_stamp(self, key, stamp, digest):
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            self.entries[key] = list(stamp) + [digest]
+            self.dirty = True
+
+    def digest(self, path):
+        """Digest of path, hashing it only on a cache miss"""
+        st = os.stat(path)
+        digest = self.lookup(path, st)
+        if digest is None:
+            digest = hash_file(path)
+            self.record(path, digest, st)
+        return digest
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_json_atomic(self.path, self.entries)
+            self.dirty = False
+
+class MemorySource:
+    """CopyPlan source that serves bytes already in memory"""
+    strategy = 'memory'
+
+    def __init__(self, data):
+        self.data = data
+
+    def __call__(self):
+        return io.BytesIO(self.data)
+
+class ContentCache:
+    """
+    Bounded LRU of file contents keyed by sha256 digest, warmed in the background so
+    a restore can write small files straight from memory. Keying by content means an
+    entry is never stale: a checkpoint file whose mtime changed gets a new digest from
+    the hash cache, misses here, and its old content simply ages out.
+    """
+    def __init__(self, max_bytes, max_file_size=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, digest):
+        with self.lock:
+            return digest in self.entries
+
+    def get(self, digest):
+        with self.lock:
+            data = self.entries.get(digest)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            return data
+
+    def put(self, digest, data):
+        """Cache data under its digest, evicting the least recently used entries over max_bytes"""
+        if len(data) > min(self.max_file_size, self.max_bytes):
+            return
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                return
+            self.entries[digest] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def wants(self, size):
+        return size <= min(self.max_file_size, self.max_bytes)
+
+    def apply(self, plan, dst_dir, digests):
+        """
+        Point the files of a CopyPlan into dst_dir at cached content where there is
+        some. digests: relative path -> digest of the tree being written.
+        """
+        if not self.entries:
+            return plan
+        files = []
+        for src, dst, size, mtime in plan.files:
+            rel_path = os.path.relpath(dst, dst_dir).replace(os.sep, '/')
+            data = self.get(digests.get(rel_path))
+            if data is not None and len(data) == size:
+                if mtime is None and not callable(src):
+                    # A path source would have had its mtime copied
+                    mtime = os.stat(src).st_mtime
+                src = MemorySource(data)
+            files.append((src, dst, size, mtime))
+        plan.files = files
+        return plan
+
+def scan_tree(src_dir):
+    """
+    Walk a directory once.
+    Returns (dirs, files) where dirs are relative '/' paths and files are
+    (rel_path, abs_path, size, mtime) tuples, both in a stable sorted order.
+    """
+    dirs = []
+    files = []
+    for root, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        rel_root = os.path.relpath(root, src_dir)
+        if rel_root != '.':
+            dirs.append(rel_root.replace(os.sep, '/'))
+        for name in sorted(filenames):
+            file_path = os.path.join(root, name)
+            st = os.stat(file_path)
+            rel_path = os.path.relpath(file_path, src_dir).replace(os.sep, '/')
+            files.append((rel_path, file_path, st.st_size, st.st_mtime))
+    return dirs, files
+
+class CopyPlan:
+    """Directories to create and files to copy, with totals known before the copy starts"""
+    def __init__(self):
+        self.dirs = []
+        # (src, dst, size, mtime): src is a path or a callable returning a readable binary stream
+        self.files = []
+        self.total_bytes = 0
+
+    def add_dir(self, path):
+        self.dirs.append(path)
+
+    def add_file(self, src, dst, size, mtime=None):
+        self.files.append((src, dst, size, mtime))
+        self.total_bytes += size
+
+    @classmethod
+    def from_tree(cls, src_dir, dst_dir, skip=()):
+        """Plan a copytree(src_dir, dst_dir, dirs_exist_ok=True) equivalent, leaving out the relative paths in skip"""
+        plan = cls()
+        plan.add_dir(dst_dir)
+        dirs, files = scan_tree(src_dir)
+        for rel_dir in dirs:
+            plan.add_dir(os.path.join(dst_dir, *rel_dir.split('/')))
+        for rel_path, file_path, size, _ in files:
+            if rel_path in skip:
+                continue
+            plan.add_file(file_path, os.path.join(dst_dir, *rel_path.split('/')), size)
+        return plan
+
+# Zero-copy strategies, cheapest first. 'stream' (read/write through userspace) always works.
+FICLONE = 0x40049409  # linux/fs.h: share the source's extents (btrfs, XFS, bcachefs)
+ZERO_COPY_CHUNK = 64 * 1024 * 1024
+# errno values meaning "this strategy is not available here", not "the copy failed".
+# EPERM/EACCES/EBADF are real errors and are raised, not hidden behind a fallback.
+ZERO_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                         errno.ENOTTY}
+
+def release_dst(path):
+    """
+    Unlink path if it is hardlinked or read-only (e.g. a save linked to a checkpoint
+    by an earlier version), so writing it never touches another copy. Mode bits are
+    shared by every link, so they are never changed here.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if os.name != 'nt' and (st.st_nlink > 1 or not st.st_mode & 0o200):
+        os.remove(path)
+
+class CopyEngine:
+    """
+    Chunked copy engine that reports real progress.
+    The callback is called as callback(bytes_done, files_done) after every chunk and file.
+    Plans with many files are copied on a thread pool: files of large_file bytes or
+    more get a worker each, smaller ones are batched up to batch_bytes/batch_files per task.
+    workers=None picks the pool size from the plan, workers=1 always copies serially.
+    Path-to-path copies try reflink, copy_file_range and sendfile before streaming.
+    Copies are never hardlinks and never read-only: the game writes its save in
+    place, so every copy must be a writable file of its own.
+    """
+    def __init__(self, chunk_size=HASH_CHUNK_SIZE, workers=None, large_file=8 * 1024 * 1024,
+                 batch_bytes=4 * 1024 * 1024, batch_files=64, zero_copy=True):
+        self.chunk_size = chunk_size
+        self.zero_copy = zero_copy
+        # (strategy, source device, destination device) combinations that turned out unsupported
+        self.unsupported = set()
+        self.workers = workers
+        self.large_file = large_file
+        self.batch_bytes = batch_bytes
+        self.batch_files = batch_files
+        self.progress_lock = threading.Lock()
+
+    def copy_stream(self, src_stream, dst_path, on_chunk=None, hasher=None):
+        """Copy a readable binary stream into dst_path, optionally hashing it on the way. Returns bytes copied."""
+        copied = 0
+        with open(dst_path, 'wb') as dst:
+            while True:
+                chunk = src_stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                copied += len(chunk)
+                if on_chunk:
+                    on_chunk(len(chunk))
+        return copied
+
+    def strategies(self):
+        """Zero-copy strategies this platform may support, in the order they are tried"""
+        names = []
+        if self.zero_copy and sys.platform.startswith('linux'):
+            names += ['reflink', 'copy_file_range', 'sendfile']
+        return names
+
+    def copy_path(self, src, dst, on_chunk=None):
+        """Copy a file between two paths with the cheapest strategy that works. Returns its name."""
+        on_chunk = on_chunk or (lambda n: None)
+        src_st = os.stat(src)
+        dst_dev = os.stat(os.path.dirname(dst)).st_dev
+        for name in self.strategies():
+            key = (name, src_st.st_dev, dst_dev)
+            if key in self.unsupported:
+                continue
+            if getattr(self, f"copy_via_{name}")(src, dst, src_st, on_chunk):
+                return name
+            self.unsupported.add(key)
+        with open(src, 'rb') as src_stream:
+            self.copy_stream(src_stream, dst, on_chunk)
+        return 'stream'
+
+    def copy_via_reflink(self, src, dst, src_st, on_chunk):
+        import fcntl
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            except OSError as e:
+                if e.errno in ZERO_COPY_UNSUPPORTED:
+                    return False
+                raise
+        on_chunk(src_st.st_size)
+        return True
+
+    def copy_via_copy_file_range(self, src, dst, src_st, on_chunk):
+        return self.copy_in_kernel(src, dst, src_st, on_chunk, os.copy_file_range)
+
+    def copy_via_sendfile(self, src, dst, src_st, on_chunk):
+        return self.copy_in_kernel(src, dst, src_st, on_chunk,
+                                   lambda src_fd, dst_fd, count, offset: os.sendfile(dst_fd, src_fd, offset, count))
+
+    def copy_in_kernel(self, src, dst, src_st, on_chunk, copy_chunk):
+        """Loop copy_chunk(src_fd, dst_fd, count, offset) until EOF. False if unsupported before any byte moved."""
+        copied = 0
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            while True:
+                try:
+                    n = copy_chunk(src_file.fileno(), dst_file.fileno(), ZERO_COPY_CHUNK, copied)
+                except OSError as e:
+                    if copied == 0 and e.errno in ZERO_COPY_UNSUPPORTED:
+                        return False
+                    raise
+                if n == 0:
+                    break
+                copied += n
+                on_chunk(n)
+        # Some filesystems report 0 bytes instead of failing; let the next strategy do it
+        return copied > 0 or src_st.st_size == 0
+
+    def copy_file(self, src, dst, mtime=None, on_chunk=None):
+        """Copy one CopyPlan entry. Returns the strategy used."""
+        release_dst(dst)
+        if callable(src):
+            with src() as src_stream:
+                self.copy_stream(src_stream, dst, on_chunk)
+            strategy = getattr(src, 'strategy', 'stream')
+        else:
+            strategy = self.copy_path(src, dst, on_chunk)
+            if mtime is None:
+                shutil.copystat(src, dst)
+                # A read-only source (e.g. a checkpoint file) must not make the save read-only
+                mode = os.stat(dst).st_mode
+                if not mode & 0o200:
+                    os.chmod(dst, mode | 0o200)
+        if mtime is not None:
+            os.utime(dst, (mtime, mtime))
+        return strategy
+
+    def batches(self, sized_items):
+        """
+        Group (size, item) pairs into tasks, largest first so big files start early:
+        a large item is a task of its own, small items share a task.
+        """
+        tasks = []
+        batch, batch_size = [], 0
+        for size, item in sorted(sized_items, key=lambda pair: pair[0], reverse=True):
+            if size >= self.large_file:
+                tasks.append([item])
+                continue
+            batch.append(item)
+            batch_size += size
+            if batch_size >= self.batch_bytes or len(batch) >= self.batch_files:
+                tasks.append(batch)
+                batch, batch_size = [], 0
+        if batch:
+            tasks.append(batch)
+        return tasks
+
+    def pool_size(self, tasks):
+        """Configured worker count, or one per task up to an I/O-bound default (like ThreadPoolExecutor's)"""
+        if self.workers is not None:
+            return max(1, min(self.workers, len(tasks)))
+        return max(1, min(len(tasks), (os.cpu_count() or 1) + 4, 32))
+
+    def run_tasks(self, tasks, work, workers=None):
+        """
+        Call work(item) for every item of every task, one task per pool job
+        (workers=1 runs them all on the calling thread).
+        The first failure cancels the jobs not started yet and is re-raised.
+        """
+        workers = workers or self.pool_size(tasks)
+        if workers == 1:
+            for task in tasks:
+                for item in task:
+                    work(item)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+        parent = TRACER.current()
+
+        def run_task(task):
+            with TRACER.span('copy_task', parent=parent, items=len(task)):
+                for item in task:
+                    work(item)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy') as pool:
+            futures = [pool.submit(run_task, task) for task in tasks]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            for future in done:
+                future.result()
+
+    def run(self, plan, callback=None):
+        """
+        Execute a CopyPlan. Returns a stats dict with bytes, files, seconds, workers,
+        the strategy used per destination file and a count per strategy.
+        """
+        start = time.perf_counter()
+        bytes_done = 0
+        files_done = 0
+        strategy_by_file = {}
+
+        def on_chunk(n):
+            nonlocal bytes_done
+            with self.progress_lock:
+                bytes_done += n
+                if callback:
+                    callback(bytes_done, files_done)
+
+        def copy_entry(entry):
+            nonlocal files_done
+            src, dst, _, mtime = entry
+            strategy = self.copy_file(src, dst, mtime, on_chunk)
+            with self.progress_lock:
+                strategy_by_file[dst] = strategy
+                files_done += 1
+                if callback:
+                    callback(bytes_done, files_done)
+
+        # Directories first, so workers never race to create them
+        with TRACER.span('mkdirs', dirs=len(plan.dirs)):
+            for path in plan.dirs:
+                os.makedirs(path, exist_ok=True)
+        tasks = self.batches([(entry[2], entry) for entry in plan.files])
+        self.run_tasks(tasks, copy_entry)
+
+        return {
+            'bytes': bytes_done,
+            'files': files_done,
+            'seconds': time.perf_counter() - start,
+            'workers': self.pool_size(tasks),
+            'strategy_by_file': strategy_by_file,
+            'strategies': {name: list(strategy_by_file.values()).count(name)
+                           for name in set(strategy_by_file.values())},
+        }
+
+# Compressed objects: the first chunk is test-compressed and data that doesn't shrink by
+# at least COMPRESS_MIN_SAVING (encrypted GAME_DATA, media) is stored raw
+COMPRESS_PROBE_SIZE = 64 * 1024
+COMPRESS_MIN_SAVING = 0.1
+
+class InflatingReader:
+    """Readable stream that inflates a zlib stream read from another stream, a chunk at a time"""
+    def __init__(self, raw):
+        self.raw = raw
+        self.inflater = zlib.decompressobj()
+        self.eof = False
+
+    def read(self, size=-1):
+        want = -1 if size is None or size < 0 else size
+        parts = []
+        while want != 0:
+            data = self.inflater.unconsumed_tail
+            if not data:
+                if self.eof:
+                    break
+                data = self.raw.read(HASH_CHUNK_SIZE)
+                if not data:
+                    self.eof = True
+                    parts.append(self.inflater.flush())
+                    break
+            out = self.inflater.decompress(data, max(want, 0))
+            parts.append(out)
+            if want > 0:
+                want -= len(out)
+        return b''.join(parts)
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Delta objects: rsync-style COPY/LITERAL ops against a base object
+DELTA_MAGIC = b'WCD1'
+DELTA_HEADER = struct.Struct('<HII')  # chain depth, block size, delta bytes in the chain
+DELTA_COPY = struct.Struct('<II')     # first base block, block count
+DELTA_LITERAL = struct.Struct('<I')   # literal length
+
+def delta_block_size(base_size):
+    """rsync-style block size: about sqrt(size), kept between 64 bytes and 64 KB"""
+    return max(64, min(64 * 1024, int(base_size ** 0.5)))
+
+def weak_checksum(block):
+    """rsync weak checksum of a block, returned as the (a, b) pair"""
+    a = sum(block) & 0xffff
+    b = sum((len(block) - i) * x for i, x in enumerate(block)) & 0xffff
+    return a, b
+
+def make_delta(base, target, block_size):
+    """
+    Compute rsync-style ops that rebuild target from base.
+    Ops are ('C', first_block, count) copies of whole base blocks or ('L', data) literals.
+    """
+    blocks = {}
+    for i in range(len(base) // block_size):
+        a, b = weak_checksum(base[i * block_size:(i + 1) * block_size])
+        blocks.setdefault(a | (b << 16), []).append(i)
+
+    ops = []
+    n = len(target)
+    if not blocks or n < block_size:
+        return [('L', target)] if target else []
+
+    literal_start = 0
+    pos = 0
+    a, b = weak_checksum(target[:block_size])
+    while pos + block_size <= n:
+        match = None
+        candidates = blocks.get(a | (b << 16))
+        if candidates:
+            window = target[pos:pos + block_size]
+            for i in candidates:
+                if base[i * block_size:(i + 1) * block_size] == window:
+                    match = i
+                    break
+
+        if match is not None:
+            if literal_start < pos:
+                ops.append(('L', target[literal_start:pos]))
+            if ops and ops[-1][0] == 'C' and ops[-1][1] + ops[-1][2] == match:
+                ops[-1] = ('C', ops[-1][1], ops[-1][2] + 1)
+            else:
+                ops.append(('C', match, 1))
+            pos += block_size
+            literal_start = pos
+            if pos + block_size <= n:
+                a, b = weak_checksum(target[pos:pos + block_size])
+        else:
+            # Roll the window forward by one byte
+            if pos + block_size < n:
+                out_byte = target[pos]
+                in_byte = target[pos + block_size]
+                a = (a - out_byte + in_byte) & 0xffff
+                b = (b - block_size * out_byte + a) & 0xffff
+            pos += 1
+
+    if literal_start < n:
+        ops.append(('L', target[literal_start:]))
+    return ops
+
+def encode_delta(base_digest, depth, chain_bytes, ops, block_size):
+    """Serialize delta ops: a small plain header followed by zlib-compressed ops"""
+    body = bytearray()
+    for op in ops:
+        if op[0] == 'C':
+            body += b'C' + DELTA_COPY.pack(op[1], op[2])
+        else:
+            body += b'L' + DELTA_LITERAL.pack(len(op[1])) + op[1]
+    body = zlib.compress(bytes(body), 6)
+    header_size = 68 + DELTA_HEADER.size
+    header = DELTA_MAGIC + base_digest.encode('ascii') + DELTA_HEADER.pack(
+        depth, block_size, chain_bytes + header_size + len(body))
+    return header + body
+
+def decode_delta_header(data):
+    """Return (base_digest, depth, block_size, chain_bytes) of an encoded delta"""
+    if data[:4] != DELTA_MAGIC:
+        raise ValueError("Not a delta object")
+    base_digest = data[4:68].decode('ascii')
+    depth, block_size, chain_bytes = DELTA_HEADER.unpack_from(data, 68)
+    return base_digest, depth, block_size, chain_bytes
+
+def apply_delta(base, data):
+    """Rebuild the target bytes from base and an encoded delta"""
+    block_size = decode_delta_header(data)[2]
+    body = zlib.decompress(data[68 + DELTA_HEADER.size:])
+    parts = []
+    pos = 0
+    while pos < len(body):
+        op = body[pos:pos + 1]
+        pos += 1
+        if op == b'C':
+            first, count = DELTA_COPY.unpack_from(body, pos)
+            pos += DELTA_COPY.size
+            parts.append(base[first * block_size:(first + count) * block_size])
+        else:
+            (length,) = DELTA_LITERAL.unpack_from(body, pos)
+            pos += DELTA_LITERAL.size
+            parts.append(body[pos:pos + length])
+            pos += length
+    return b''.join(parts)
+
+def synchronized(method):
+    """Run a method while holding self.lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class ObjectStore:
+    """
+    Content-addressed backup store.
+    Every file is stored once as a blob named by its sha256 digest and every
+    snapshot is a small JSON manifest listing (path, size, digest) entries.
+
+    In delta mode a changed file may instead be stored as an rsync-style delta
+    against the same path in the previous snapshot. A chain ends in a full
+    keyframe blob once it reaches keyframe_interval links or its deltas add up
+    to more than the file itself, so restoring any object applies at most
+    keyframe_interval - 1 deltas and reads at most about twice its size.
+
+    refs.json keeps a reference count per object (snapshot entries plus deltas
+    based on it) and the total stored bytes, so deleting a snapshot only touches
+    the objects it references.
+
+    With compress_level 1-9 full blobs are zlib-compressed into zobjects/ as they
+    are streamed in (never via an uncompressed temp copy) and inflated as they are
+    streamed out, so one file restores without reading anything else.
+    """
+    def __init__(self, root, engine=None, delta=False, keyframe_interval=64,
+                 delta_max_size=4 * 1024 * 1024, delta_max_ratio=0.5, hash_cache=None, compress_level=0):
+        self.root = root
+        self.engine = engine or CopyEngine()
+        self.hash_cache = hash_cache
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.delta_max_size = delta_max_size
+        self.delta_max_ratio = delta_max_ratio
+        self.compress_level = compress_level
+        self.objects_dir = os.path.join(root, 'objects')
+        self.zobjects_dir = os.path.join(root, 'zobjects')
+        self.deltas_dir = os.path.join(root, 'deltas')
+        self.snapshots_dir = os.path.join(root, 'snapshots')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.head_path = os.path.join(root, 'HEAD')
+        self.refs_path = os.path.join(root, 'refs.json')
+        self.refs = None
+        self.lock = threading.RLock()
+        # Serializes the has-object check and blob write of parallel put_file calls
+        self.put_lock = threading.Lock()
+
+    def ensure_dirs(self):
+        """Create the store layout if it does not exist yet"""
+        for path in (self.objects_dir, self.zobjects_dir, self.deltas_dir, self.snapshots_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def object_path(self, digest):
+        """Path of the full blob for a digest, fanned out by its first two characters"""
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def zobject_path(self, digest):
+        """Path of the zlib-compressed full blob for a digest"""
+        return os.path.join(self.zobjects_dir, digest[:2], digest[2:])
+
+    def delta_path(self, digest):
+        """Path of the delta object for a digest"""
+        return os.path.join(self.deltas_dir, digest[:2], digest[2:])
+
+    def find_blob(self, digest):
+        """(path, compressed) of the full blob for a digest, or (None, False) for a delta or missing object"""
+        for path, compressed in ((self.object_path(digest), False), (self.zobject_path(digest), True)):
+            if os.path.exists(path):
+                return path, compressed
+        return None, False
+
+    def has_object(self, digest):
+        return self.find_blob(digest)[0] is not None or os.path.exists(self.delta_path(digest))
+
+    def chain_info(self, digest):
+        """(depth, delta bytes) of an object's chain; (0, 0) for a full blob"""
+        if self.find_blob(digest)[0] is not None:
+            return 0, 0
+        with open(self.delta_path(digest), 'rb') as f:
+            header = decode_delta_header(f.read(68 + DELTA_HEADER.size))
+        return header[1], header[3]
+
+    def chain_depth(self, digest):
+        """Number of deltas applied to rebuild an object (0 for a full blob)"""
+        return self.chain_info(digest)[0]
+
+    def read_object(self, digest):
+        """Return an object's full content, applying its delta chain if needed"""
+        deltas = []
+        while True:
+            blob_path, compressed = self.find_blob(digest)
+            if blob_path is not None:
+                break
+            with open(self.delta_path(digest), 'rb') as f:
+                data = f.read()
+            deltas.append(data)
+            digest = decode_delta_header(data)[0]
+        with open(blob_path, 'rb') as f:
+            content = f.read()
+        if compressed:
+            content = zlib.decompress(content)
+        for data in reversed(deltas):
+            content = apply_delta(content, data)
+        return content
+
+    def open_object(self, digest):
+        """Open an object for streaming reads"""
+        blob_path, compressed = self.find_blob(digest)
+        if blob_path is not None:
+            f = open(blob_path, 'rb')
+            return InflatingReader(f) if compressed else f
+        return io.BytesIO(self.read_object(digest))
+
+    def _store_as_delta(self, src_path, digest, size, base_digest):
+        """
+        Try to store the file at src_path as a delta against base_digest. Returns stored
+        bytes or None. src_path itself is never modified.
+        """
+        if size > self.delta_max_size or not self.has_object(base_digest):
+            return None
+        depth, chain_bytes = self.chain_info(base_digest)
+        depth += 1
+        if depth >= self.keyframe_interval:
+            return None
+
+        base = self.read_object(base_digest)
+        with open(src_path, 'rb') as f:
+            target = f.read()
+        block_size = delta_block_size(len(base))
+        data = encode_delta(base_digest, depth, chain_bytes, make_delta(base, target, block_size), block_size)
+        # A keyframe is cheaper once this delta or the whole chain outgrows the file
+        if len(data) > size * self.delta_max_ratio or decode_delta_header(data)[3] > size:
+            return None
+
+        delta_path = self.delta_path(digest)
+        os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+        tmp_path = os.path.join(self.tmp_dir, f"{os.getpid()}.{threading.get_ident()}.delta.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, delta_path)
+        self.incref(base_digest)
+        return len(data)
+
+    def put_file(self, path, digest=None, on_chunk=None, base_digest=None, on_skip=None):
+        """
+        Store a file's content and return (digest, size, stored_bytes).
+        When the digest is already known (passed in or from the hash cache) and
+        stored, nothing is read and its size goes to on_skip (or on_chunk). Otherwise the
+        file is copied into a temp blob and hashed in the same pass. In delta mode
+        base_digest names the previous version of the file to diff against.
+        stored_bytes is 0 when the content was already in the store.
+        """
+        st = os.stat(path)
+        if digest is None and self.hash_cache is not None:
+            digest = self.hash_cache.lookup(path, st)
+        if digest is not None and self.has_object(digest):
+            size = os.path.getsize(path)
+            report = on_skip or on_chunk
+            if report:
+                report(size)
+            return digest, size, 0
+
+        tmp_path = os.path.join(self.tmp_dir, f"{os.getpid()}.{threading.get_ident()}.tmp")
+        hasher = hashlib.sha256()
+        # A delta candidate stays raw in tmp: the delta is computed from its plain bytes
+        delta_candidate = self.delta and base_digest and st.st_size <= self.delta_max_size
+        try:
+            with open(path, 'rb') as src:
+                if self.compress_level and not delta_candidate:
+                    size, compressed = self.store_stream(src, tmp_path, on_chunk, hasher)
+                else:
+                    size, compressed = self.engine.copy_stream(src, tmp_path, on_chunk, hasher), False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        digest = hasher.hexdigest()
+        if self.hash_cache is not None:
+            self.hash_cache.record(path, digest, st)
+        # Copy workers may bring in the same new content at once; only one may store it
+        with self.put_lock:
+            if self.has_object(digest):
+                os.remove(tmp_path)
+                return digest, size, 0
+
+            if self.delta and base_digest and not compressed:
+                stored = self._store_as_delta(tmp_path, digest, size, base_digest)
+                if stored is not None:
+                    os.remove(tmp_path)
+                    return digest, size, stored
+                if self.compress_level:
+                    compressed = self.compress_file(tmp_path)
+
+            return digest, size, self.place_blob(tmp_path, digest, compressed)
+
+    def store_stream(self, src, tmp_path, on_chunk=None, hasher=None):
+        """
+        Copy a stream into tmp_path through zlib at compress_level, hashing the plain
+        bytes on the way. Returns (plain size, compressed); data whose first chunk
+        doesn't compress is written raw instead.
+        """
+        compressor = None
+        size = 0
+        with open(tmp_path, 'wb') as dst:
+            while True:
+                chunk = src.read(self.engine.chunk_size)
+                if not chunk:
+                    break
+                if size == 0:
+                    sample = chunk[:COMPRESS_PROBE_SIZE]
+                    if len(zlib.compress(sample, self.compress_level)) <= len(sample) * (1 - COMPRESS_MIN_SAVING):
+                        compressor = zlib.compressobj(self.compress_level)
+                size += len(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                dst.write(compressor.compress(chunk) if compressor else chunk)
+                if on_chunk:
+                    on_chunk(len(chunk))
+            if compressor:
+                dst.write(compressor.flush())
+        return size, compressor is not None
+
+    def compress_file(self, tmp_path):
+        """Compress a small raw temp blob in place if that pays off. Returns whether it did."""
+        with open(tmp_path, 'rb') as f:
+            data = f.read()
+        packed = zlib.compress(data, self.compress_level)
+        if not data or len(packed) > len(data) * (1 - COMPRESS_MIN_SAVING):
+            return False
+        with open(tmp_path, 'wb') as f:
+            f.write(packed)
+        return True
+
+    def place_blob(self, tmp_path, digest, compressed):
+        """Rename a finished temp blob into objects/ or zobjects/. Returns its stored size."""
+        blob_path = self.zobject_path(digest) if compressed else self.object_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        stored = os.path.getsize(tmp_path)
+        move_file(tmp_path, blob_path)
+        return stored
+
+    @traced
+    @synchronized
+    def ingest_tree(self, src_dir, snapshot_id, digests=None, origin="", created=None):
+        """
+        Like create_snapshot, but files are hardlinked into the store instead of copied
+        where the filesystem allows, so a blob costs a link rather than a data copy.
+        src_dir is consumed, but only once the manifest is written: until then every
+        file in it is untouched, so an interrupted ingest can simply run again.
+        digests: known relative path -> digest map, so files need not be reread
+        """
+        if self.has_snapshot(snapshot_id):
+            # Interrupted after the manifest was written: only the cleanup is left
+            shutil.rmtree(src_dir)
+            return self.load_snapshot(snapshot_id)
+        self.ensure_dirs()
+        # Counted before any object is written so a first-time rebuild cannot count this snapshot twice
+        self.load_refs()
+        digests = digests or {}
+        previous = self.previous_digests() if self.delta else {}
+        dirs, tree_files = scan_tree(src_dir)
+        files = []
+        new_bytes = 0
+        new_raw_bytes = 0
+        # Objects holding freshly written data, flushed before src_dir may go
+        written = []
+        for rel_path, file_path, size, mtime in tree_files:
+            digest = digests.get(rel_path) or hash_file(file_path)
+            if not self.has_object(digest):
+                stored = None
+                if self.delta and previous.get(rel_path):
+                    stored = self._store_as_delta(file_path, digest, size, previous[rel_path])
+                    if stored is not None:
+                        written.append(self.delta_path(digest))
+                if stored is None:
+                    tmp_path = os.path.join(self.tmp_dir, f"{os.getpid()}.{threading.get_ident()}.tmp")
+                    if self.compress_level:
+                        with open(file_path, 'rb') as src:
+                            _, compressed = self.store_stream(src, tmp_path)
+                    else:
+                        link_or_copy(file_path, tmp_path)
+                        compressed = False
+                    stored = self.place_blob(tmp_path, digest, compressed)
+                    written.append(self.zobject_path(digest) if compressed else self.object_path(digest))
+                new_bytes += stored
+                new_raw_bytes += size
+            files.append({'path': rel_path, 'size': size, 'digest': digest, 'mtime': mtime})
+        for path in written:
+            fsync_file(path)
+        manifest = self.write_snapshot(snapshot_id, origin, created, dirs, files, new_bytes, new_raw_bytes,
+                                       durable=True)
+        shutil.rmtree(src_dir)
+        return manifest
+
+    def manifest_path(self, snapshot_id):
+        return os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+
+    def has_snapshot(self, snapshot_id):
+        return os.path.exists(self.manifest_path(snapshot_id))
+
+    @staticmethod
+    def is_store(path):
+        """Whether path holds an object store's HEAD or refs.json (a backup store, never a save)"""
+        return any(os.path.isfile(os.path.join(path, marker)) for marker in ('HEAD', 'refs.json'))
+
+    def new_snapshot_id(self, prefix, when=None):
+        """Build a `<prefix>-YYYYmmdd-HHMMSS` id, suffixed when that second is taken"""
+        when = when or datetime.now()
+        base_id = f"{prefix}-{when.strftime('%Y%m%d-%H%M%S')}"
+        snapshot_id = base_id
+        n = 2
+        while self.has_snapshot(snapshot_id):
+            snapshot_id = f"{base_id}-{n}"
+            n += 1
+        return snapshot_id
+
+    @traced
+    @synchronized
+    def create_snapshot(self, src_dir, snapshot_id, origin="", created=None, tree=None, callback=None,
+                        workers=None):
+        """
+        Store every file under src_dir and write the snapshot manifest. Returns the manifest.
+        tree: a scan_tree(src_dir) result, when the caller already walked the directory
+        callback: called as callback(bytes_done, files_done) while files are stored; a
+        callback.skip(n) attribute, if present, first hears of bytes that needed no reading
+        workers: copy pool size override, 1 stores everything on the calling thread
+        """
+        self.ensure_dirs()
+        # Counted before any object is written so a first-time rebuild cannot count this snapshot twice
+        self.load_refs()
+        dirs, tree_files = tree or scan_tree(src_dir)
+        previous = self.previous_digests() if self.delta else {}
+        # Filled by the copy workers in any order, written to the manifest in tree order
+        results = [None] * len(tree_files)
+        bytes_done = 0
+        files_done = 0
+        progress_lock = threading.Lock()
+
+        def on_chunk(n):
+            nonlocal bytes_done
+            with progress_lock:
+                bytes_done += n
+                if callback:
+                    callback(bytes_done, files_done)
+
+        skip = getattr(callback, 'skip', None)
+
+        def on_skip(n):
+            if skip:
+                skip(n)
+            on_chunk(n)
+
+        def store(i):
+            nonlocal files_done
+            rel_path, file_path, _, mtime = tree_files[i]
+            digest, size, stored = self.put_file(file_path, on_chunk=on_chunk,
+                                                 base_digest=previous.get(rel_path), on_skip=on_skip)
+            results[i] = ({
+                'path': rel_path,
+                'size': size,
+                'digest': digest,
+                'mtime': mtime,
+            }, stored)
+            with progress_lock:
+                files_done += 1
+                if callback:
+                    callback(bytes_done, files_done)
+
+        try:
+            self.engine.run_tasks(self.engine.batches([(size, i) for i, (_, _, size, _) in enumerate(tree_files)]),
+                                  store, workers)
+        except BaseException:
+            # Failed or cancelled: drop the objects only this snapshot would have referenced
+            counts = self.load_refs()['objects']
+            for result in results:
+                if result is not None and result[1] and not counts.get(result[0]['digest']):
+                    self._release_orphan(result[0]['digest'])
+            raise
+        files = [entry for entry, _ in results]
+        new_bytes = sum(stored for _, stored in results)
+        new_raw_bytes = sum(entry['size'] for entry, stored in results if stored)
+
+        return self.write_snapshot(snapshot_id, origin, created, dirs, files, new_bytes, new_raw_bytes)
+
+    def write_snapshot(self, snapshot_id, origin, created, dirs, files, new_bytes, new_raw_bytes=None,
+                       durable=False):
+        """
+        Write a snapshot manifest and make it the delta base for the next one.
+        new_bytes is what the new objects cost on disk, new_raw_bytes their plain size.
+        durable=True fsyncs the manifest before it is renamed into place.
+        """
+        manifest = {
+            'id': snapshot_id,
+            'created': (created or datetime.now()).isoformat(timespec='seconds'),
+            'origin': origin,
+            'dirs': dirs,
+            'files': files,
+            'new_bytes': new_bytes,
+            'new_raw_bytes': new_bytes if new_raw_bytes is None else new_raw_bytes,
+            'pinned': False,
+        }
+        write_json_atomic(self.manifest_path(snapshot_id), manifest, durable)
+        with open(self.head_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot_id)
+        for entry in files:
+            self.incref(entry['digest'])
+        self.load_refs()['bytes'] += new_bytes
+        self.save_refs()
+        return manifest
+
+    @synchronized
+    def set_pinned(self, snapshot_id, pinned=True):
+        """Pin (or unpin) a snapshot so retention never deletes it"""
+        manifest = self.load_snapshot(snapshot_id)
+        manifest['pinned'] = pinned
+        write_json_atomic(self.manifest_path(snapshot_id), manifest)
+        return manifest
+
+    def load_refs(self):
+        """Reference counts and stored byte total, rebuilt from the manifests when missing"""
+        if self.refs is None:
+            try:
+                with open(self.refs_path, 'r', encoding='utf-8') as f:
+                    self.refs = json.load(f)
+            except (OSError, ValueError):
+                self.rebuild_refs()
+        return self.refs
+
+    def rebuild_refs(self):
+        """Recount references from every manifest and delta header (a full scan)"""
+        counts = {}
+        total = 0
+        for snapshot_id in self.list_snapshots():
+            try:
+                manifest = self.load_snapshot(snapshot_id)
+            except (OSError, ValueError):
+                continue
+            for entry in manifest['files']:
+                counts[entry['digest']] = counts.get(entry['digest'], 0) + 1
+        for base_dir in (self.objects_dir, self.zobjects_dir, self.deltas_dir):
+            if not os.path.exists(base_dir):
+                continue
+            for fan in os.listdir(base_dir):
+                for name in os.listdir(os.path.join(base_dir, fan)):
+                    path = os.path.join(base_dir, fan, name)
+                    total += os.path.getsize(path)
+                    if base_dir == self.deltas_dir:
+                        with open(path, 'rb') as f:
+                            base_digest = decode_delta_header(f.read(68 + DELTA_HEADER.size))[0]
+                        counts[base_digest] = counts.get(base_digest, 0) + 1
+        self.refs = {'objects': counts, 'bytes': total}
+        return self.refs
+
+    def save_refs(self):
+        write_json_atomic(self.refs_path, self.load_refs())
+
+    def incref(self, digest):
+        counts = self.load_refs()['objects']
+        counts[digest] = counts.get(digest, 0) + 1
+
+    def decref(self, digest):
+        """Drop one reference; delete the object (and release its delta base) at zero. Returns bytes freed."""
+        refs = self.load_refs()
+        freed = 0
+        while digest is not None:
+            count = refs['objects'].get(digest, 0) - 1
+            if count > 0:
+                refs['objects'][digest] = count
+                break
+            refs['objects'].pop(digest, None)
+            digest, size = self._remove_object(digest)
+            freed += size
+        refs['bytes'] = max(0, refs['bytes'] - freed)
+        return freed
+
+    def _remove_object(self, digest):
+        """Delete an object file. Returns (base digest if it was a delta, bytes freed)."""
+        blob_path, _ = self.find_blob(digest)
+        if blob_path is not None:
+            size = os.path.getsize(blob_path)
+            os.remove(blob_path)
+            return None, size
+        delta_path = self.delta_path(digest)
+        if not os.path.exists(delta_path):
+            return None, 0
+        with open(delta_path, 'rb') as f:
+            base_digest = decode_delta_header(f.read(68 + DELTA_HEADER.size))[0]
+        size = os.path.getsize(delta_path)
+        os.remove(delta_path)
+        return base_digest, size
+
+    def object_size(self, digest):
+        for path in (self.object_path(digest), self.zobject_path(digest), self.delta_path(digest)):
+            if os.path.exists(path):
+                return os.path.getsize(path)
+        return 0
+
+    def estimate_freed(self, snapshot_id, released):
+        """
+        Bytes deleting a snapshot would free, given the references already
+        released by earlier planned deletions (updated in place). Used for dry runs.
+        """
+        counts = self.load_refs()['objects']
+        freed = 0
+        for entry in self.load_snapshot(snapshot_id)['files']:
+            digest = entry['digest']
+            while digest is not None:
+                released[digest] = released.get(digest, 0) + 1
+                if counts.get(digest, 0) - released[digest] > 0:
+                    break
+                freed += self.object_size(digest)
+                digest = self.delta_base(digest)
+        return freed
+
+    def delta_base(self, digest):
+        """Base digest of a delta object, None for full blobs"""
+        delta_path = self.delta_path(digest)
+        if self.find_blob(digest)[0] is not None or not os.path.exists(delta_path):
+            return None
+        with open(delta_path, 'rb') as f:
+            return decode_delta_header(f.read(68 + DELTA_HEADER.size))[0]
+
+    @synchronized
+    def delete_snapshot(self, snapshot_id):
+        """Delete a snapshot and every object only it referenced. Returns bytes freed."""
+        manifest = self.load_snapshot(snapshot_id)
+        self.load_refs()
+        os.remove(self.manifest_path(snapshot_id))
+        freed = sum(self.decref(entry['digest']) for entry in manifest['files'])
+        self.save_refs()
+        return freed
+
+    @synchronized
+    def collect_garbage(self):
+        """
+        Mark and sweep: recount references from the manifests, then delete objects
+        nothing references (left behind by crashes) and stale temp files.
+        Returns bytes freed.
+        """
+        counts = self.rebuild_refs()['objects']
+        freed = 0
+        for base_dir in (self.objects_dir, self.zobjects_dir, self.deltas_dir):
+            if not os.path.exists(base_dir):
+                continue
+            for fan in os.listdir(base_dir):
+                for name in os.listdir(os.path.join(base_dir, fan)):
+                    digest = fan + name
+                    if digest not in counts:
+                        freed += self._release_orphan(digest)
+        if os.path.exists(self.tmp_dir):
+            for name in os.listdir(self.tmp_dir):
+                os.remove(os.path.join(self.tmp_dir, name))
+        self.rebuild_refs()
+        self.save_refs()
+        return freed
+
+    def _release_orphan(self, digest):
+        """Delete an unreferenced object, releasing its delta base as well"""
+        base_digest, freed = self._remove_object(digest)
+        if base_digest is not None and base_digest in self.refs['objects']:
+            freed += self.decref(base_digest)
+        return freed
+
+    def previous_digests(self):
+        """Map of path -> digest in the most recent snapshot, used as delta bases"""
+        try:
+            with open(self.head_path, 'r', encoding='utf-8') as f:
+                head = f.read().strip()
+            manifest = self.load_snapshot(head)
+        except (OSError, ValueError):
+            return {}
+        return {entry['path']: entry['digest'] for entry in manifest['files']}
+
+    def load_snapshot(self, snapshot_id):
+        with open(self.manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list_snapshots(self):
+        """Return all snapshot ids (unsorted)"""
+        if not os.path.exists(self.snapshots_dir):
+            return []
+        return [name[:-5] for name in os.listdir(self.snapshots_dir) if name.endswith('.json')]
+
+    def restore_plan(self, snapshot_id, dst_dir, skip=()):
+        """
+        CopyPlan that writes every file of a snapshot into dst_dir (existing extra files are left alone).
+        Relative paths in skip are left out.
+        """
+        manifest = self.load_snapshot(snapshot_id)
+        plan = CopyPlan()
+        plan.add_dir(dst_dir)
+        for rel_dir in manifest['dirs']:
+            plan.add_dir(os.path.join(dst_dir, *rel_dir.split('/')))
+        for entry in manifest['files']:
+            if entry['path'] in skip:
+                continue
+            dst_path = os.path.join(dst_dir, *entry['path'].split('/'))
+            blob_path = self.object_path(entry['digest'])
+            if os.path.exists(blob_path):
+                src = blob_path
+            else:
+                src = lambda digest=entry['digest']: self.open_object(digest)
+            plan.add_file(src, dst_path, entry['size'], entry.get('mtime'))
+        return plan
+
+    def restore_snapshot(self, snapshot_id, dst_dir, callback=None):
+        """Write every file of a snapshot into dst_dir. Returns the copy stats."""
+        return self.engine.run(self.restore_plan(snapshot_id, dst_dir), callback)
+
+    def verify_snapshot(self, snapshot_id):
+        """Check that every blob referenced by a snapshot exists with the right digest"""
+        manifest = self.load_snapshot(snapshot_id)
+        return all(self.check_object(entry['digest'], entry['size']) for entry in manifest['files'])
+
+    def check_object(self, digest, size=None):
+        """
+        Re-read an object from disk and check it still hashes to its digest (and has
+        the expected size). Blobs are streamed, so memory stays bounded; deltas are
+        small by construction (delta_max_size) and rebuilt in memory.
+        """
+        try:
+            blob_path, compressed = self.find_blob(digest)
+            if blob_path is not None and not compressed:
+                if size is not None and os.path.getsize(blob_path) != size:
+                    return False
+                return hash_file(blob_path) == digest
+            hasher = hashlib.sha256()
+            total = 0
+            with self.open_object(digest) as stream:
+                for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    total += len(chunk)
+        except (OSError, ValueError, zlib.error):
+            return False
+        return (size is None or total == size) and hasher.hexdigest() == digest
+
+class RetentionPolicy:
+    """
+    Which backups to keep: grandfather-father-son time buckets (everything from
+    the last keep_all_for seconds, one per hour up to hourly_for, one per day up
+    to daily_for) plus optional max_count and max_bytes limits.
+    Pinned backups and the newest keep_min backups are never pruned.
+    """
+    def __init__(self, keep_all_for=3600, hourly_for=24 * 3600, daily_for=30 * 24 * 3600,
+                 keep_min=10, max_count=None, max_bytes=None):
+        self.keep_all_for = keep_all_for
+        self.hourly_for = hourly_for
+        self.daily_for = daily_for
+        self.keep_min = keep_min
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+
+    def plan(self, entries, now, store):
+        """
+        Decide what to prune from index entries. Returns [(id, reason, estimated bytes freed)], oldest first.
+        Only manifests of snapshots being pruned are read.
+        """
+        newest_first = sorted(entries, key=lambda entry: (entry['created'], entry['id']), reverse=True)
+        protected = {entry['id'] for entry in newest_first[:self.keep_min]}
+        protected |= {entry['id'] for entry in newest_first if entry.get('pinned')}
+
+        kept = []
+        reasons = {}
+        buckets = set()
+        for entry in newest_first:
+            created = datetime.fromisoformat(entry['created'])
+            age = (now - created).total_seconds()
+            if age < self.hourly_for:
+                bucket = ('hour', created.strftime('%Y%m%d%H'))
+            else:
+                bucket = ('day', created.strftime('%Y%m%d'))
+            if entry['id'] in protected or age < self.keep_all_for:
+                kept.append(entry)
+            elif age >= self.daily_for:
+                reasons[entry['id']] = f"older than {self.daily_for // 86400} days"
+            elif bucket in buckets:
+                reasons[entry['id']] = f"a newer backup is kept for that {bucket[0]}"
+            else:
+                kept.append(entry)
+            buckets.add(bucket)
+
+        # Oldest unprotected survivors go first when a limit is exceeded
+        candidates = [entry for entry in reversed(kept) if entry['id'] not in protected]
+        if self.max_count is not None:
+            while len(kept) > self.max_count and candidates:
+                entry = candidates.pop(0)
+                kept.remove(entry)
+                reasons[entry['id']] = f"over the limit of {self.max_count} backups"
+
+        released = {}
+        by_id = {entry['id']: entry for entry in newest_first}
+        order = sorted(reasons, key=lambda entry_id: (by_id[entry_id]['created'], entry_id))
+        planned = [(entry_id, reasons[entry_id], store.estimate_freed(entry_id, released)) for entry_id in order]
+        if self.max_bytes is not None:
+            remaining = store.load_refs()['bytes'] - sum(freed for _, _, freed in planned)
+            while remaining > self.max_bytes and candidates:
+                entry = candidates.pop(0)
+                freed = store.estimate_freed(entry['id'], released)
+                planned.append((entry['id'], f"over the {format_bytes(self.max_bytes)} budget", freed))
+                remaining -= freed
+        return planned
+
+def tree_digest(entries):
+    """Content hash of a whole tree from its (path, digest) pairs"""
+    digest = hashlib.sha256()
+    for path, file_digest in sorted(entries):
+        digest.update(f"{path}\0{file_digest}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def dir_mtime(path):
+    """mtime_ns of a directory, or None when it does not exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+# Similarity of save files: content-defined chunks -> MinHash signature -> LSH bands
+SIMILARITY_FILE = 'GAME_DATA'
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands of 4 rows: pairs above ~50% similarity collide in some band
+MERSENNE_PRIME = (1 << 61) - 1
+MASK64 = (1 << 64) - 1
+_minhash_tables = None
+
+def minhash_tables():
+    """Gear table for chunking and (a, b) pairs for the MinHash permutations, derived once"""
+    global _minhash_tables
+    if _minhash_tables is None:
+        def value(label, i):
+            return int.from_bytes(hashlib.blake2b(f"{label}{i}".encode(), digest_size=8).digest(), 'little')
+        gear = [value('gear', i) for i in range(256)]
+        permutations = [(value('a', i) % (MERSENNE_PRIME - 1) + 1, value('b', i) % MERSENNE_PRIME)
+                        for i in range(MINHASH_PERMUTATIONS)]
+        _minhash_tables = gear, permutations
+    return _minhash_tables
+
+def content_chunks(data):
+    """
+    Split data at content-defined boundaries (gear rolling hash), so an insertion
+    only changes the chunks around it. Chunks average about 1/128 of the file, at least 64 bytes.
+    """
+    gear, _ = minhash_tables()
+    bits = max(6, min(16, (len(data) // 128).bit_length()))
+    boundary = ((1 << bits) - 1) << (64 - bits)
+    min_size, max_size = (1 << bits) // 4, (1 << bits) * 4
+    chunks = []
+    start = 0
+    h = 0
+    for i, byte in enumerate(data):
+        h = ((h << 1) + gear[byte]) & MASK64
+        length = i + 1 - start
+        if (length >= min_size and not h & boundary) or length >= max_size:
+            chunks.append(data[start:i + 1])
+            start = i + 1
+            h = 0
+    if start < len(data):
+        chunks.append(data[start:])
+    return chunks
+
+def minhash_signature(data):
+    """MinHash of the set of chunk fingerprints of data"""
+    _, permutations = minhash_tables()
+    features = {int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), 'little')
+                for chunk in content_chunks(data)} or {0}
+    return [min((a * x + b) % MERSENNE_PRIME for x in features) for a, b in permutations]
+
+def pack_signature(signature):
+    """Lowest byte of every MinHash slot as one int (b-bit MinHash), so scoring is an XOR and a byte count"""
+    return int.from_bytes(bytes(x & 0xff for x in signature), 'little')
+
+def packed_similarity(a, b):
+    """Jaccard estimate from two packed signatures, corrected for 1-in-256 chance byte matches"""
+    equal = (a ^ b).to_bytes(MINHASH_PERMUTATIONS, 'little').count(0) / MINHASH_PERMUTATIONS
+    return max(0.0, (equal - 1 / 256) / (1 - 1 / 256))
+
+class SimilarityIndex:
+    """
+    LSH buckets over MinHash signatures, keyed by content digest (many backups share one).
+    query() only scores the digests that share a band with the query, each with one
+    XOR of packed signatures, so it stays sub-millisecond with thousands of snapshots.
+    """
+    def __init__(self, bands=LSH_BANDS, checkpoints=True):
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self.buckets = {}
+        self.packed = {}
+        self.sizes = {}
+        # digest -> [(kind, id)] of every entry with that content
+        self.owners = {}
+        # Checkpoints again on their own, so chapter inference never scores backups
+        self.checkpoints = SimilarityIndex(bands, checkpoints=False) if checkpoints else None
+
+    def band_keys(self, signature):
+        return [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def add(self, digest, signature, size, owner):
+        if self.checkpoints is not None and owner[0] == 'checkpoint':
+            self.checkpoints.add(digest, signature, size, owner)
+        if digest not in self.packed:
+            self.packed[digest] = pack_signature(signature)
+            self.sizes[digest] = size
+            for key in self.band_keys(signature):
+                self.buckets.setdefault(key, []).append(digest)
+        self.owners.setdefault(digest, []).append(owner)
+
+    def query(self, signature, limit=5, kinds=None, exclude=()):
+        """[(kind, id, similarity)] of the nearest entries, most similar first"""
+        candidates = set()
+        for key in self.band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        packed = pack_signature(signature)
+        # Rank by matching slot count (inlined: this is the hot loop), convert only the winners
+        width = MINHASH_PERMUTATIONS
+        scored = sorted([((packed ^ self.packed[digest]).to_bytes(width, 'little').count(0), digest)
+                         for digest in candidates], reverse=True)
+        results = []
+        for _, digest in scored:
+            for kind, entry_id in sorted(self.owners[digest]):
+                if (kinds is None or kind in kinds) and entry_id not in exclude:
+                    results.append((kind, entry_id, packed_similarity(packed, self.packed[digest])))
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+    def infer_chapter(self, signature, size, threshold=0.5):
+        """
+        (checkpoint name, similarity, basis) for a save. basis is 'content' when a
+        checkpoint is similar enough; otherwise 'size' names the largest checkpoint
+        no bigger than the save, since saves only grow as the story goes on.
+        None when the save is smaller than every checkpoint.
+        """
+        checkpoints = self.checkpoints
+        nearest = checkpoints.query(signature, limit=1)
+        if nearest and nearest[0][2] >= threshold:
+            return nearest[0][1], nearest[0][2], 'content'
+        best = None
+        for digest, owners in checkpoints.owners.items():
+            for _, entry_id in owners:
+                if checkpoints.sizes[digest] <= size:
+                    if best is None or (checkpoints.sizes[digest], entry_id) > best:
+                        best = (checkpoints.sizes[digest], entry_id)
+        if best is None:
+            return None
+        return best[1], 0.0, 'size'
+
+def chapter_label(chapter):
+    """Short listing tag for an infer_chapter result"""
+    if chapter is None:
+        return ""
+    name, similarity, basis = chapter
+    if basis == 'size':
+        return f"[past {name}]"
+    if similarity >= 0.99:
+        return f"[{name}]"
+    return f"[~{name} {similarity:.0%}]"
+
+class BackupIndex:
+    """
+    On-disk JSON index of every snapshot, legacy backup folder and checkpoint.
+    Each entry records id, kind, created, total_size, file_count, content_hash,
+    origin and ref (what recover/replace is called with). The index is read once,
+    updated in memory by backup/replace/recover and written back atomically.
+    The mtimes of the watched directories are kept so drift can be detected with
+    a few stats instead of a full listing. Entries name the digest of their
+    GAME_DATA, whose similarity fingerprint is kept once per digest.
+    """
+    VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def load(self):
+        """Load the index. Returns False when it is missing, unreadable or from another version."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.data = data
+                return True
+        except (OSError, ValueError):
+            pass
+        self.data = {'version': self.VERSION, 'snapshots': {}, 'checkpoints': {}, 'dir_mtimes': {},
+                     'fingerprints': {}}
+        return False
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_json_atomic(self.path, self.data)
+
+    def entries(self, section):
+        if self.data is None:
+            self.load()
+        return self.data[section]
+
+    def put(self, section, entry):
+        self.entries(section)[entry['id']] = entry
+
+    def remove(self, section, entry_id):
+        self.entries(section).pop(entry_id, None)
+
+    def is_stale(self, dirs):
+        """True when any watched directory changed since it was recorded"""
+        recorded = self.data.get('dir_mtimes', {})
+        return any(recorded.get(key) != dir_mtime(path) for key, path in dirs.items())
+
+    def record_mtimes(self, dirs):
+        self.data['dir_mtimes'] = {key: dir_mtime(path) for key, path in dirs.items()}
+
+    @staticmethod
+    def snapshot_entry(manifest):
+        return {
+            'id': manifest['id'],
+            'kind': 'snapshot',
+            'created': manifest['created'],
+            'total_size': sum(entry['size'] for entry in manifest['files']),
+            'file_count': len(manifest['files']),
+            'content_hash': tree_digest((entry['path'], entry['digest']) for entry in manifest['files']),
+            'game_data': next((entry['digest'] for entry in manifest['files']
+                               if entry['path'] == SIMILARITY_FILE), None),
+            'origin': manifest.get('origin', ''),
+            'ref': manifest['id'],
+            'pinned': manifest.get('pinned', False),
+        }
+
+    @staticmethod
+    def checkpoint_entry(checkpoint):
+        """Index entry for a DirCheckpoint or ZipCheckpoint"""
+        total_size, file_count, created = checkpoint.stats()
+        digests = checkpoint.digests()
+        return {
+            'id': checkpoint.name,
+            'kind': 'checkpoint',
+            'created': created.isoformat(timespec='seconds'),
+            'total_size': total_size,
+            'file_count': file_count,
+            'content_hash': tree_digest(digests.items()),
+            'game_data': digests.get(SIMILARITY_FILE),
+            'origin': checkpoint.origin,
+            'ref': checkpoint.path,
+        }
+
+    @staticmethod
+    def tree_entry(entry_id, kind, src_dir, origin="", hash_cache=None):
+        """Index entry for a plain directory (checkpoint or legacy backup folder)"""
+        _, files = scan_tree(src_dir)
+        digest_of = hash_cache.digest if hash_cache is not None else hash_file
+        digests = {rel_path: digest_of(path) for rel_path, path, _, _ in files}
+        return {
+            'id': entry_id,
+            'kind': kind,
+            'created': datetime.fromtimestamp(os.path.getmtime(src_dir)).isoformat(timespec='seconds'),
+            'total_size': sum(size for _, _, size, _ in files),
+            'file_count': len(files),
+            'content_hash': tree_digest(digests.items()),
+            'game_data': digests.get(SIMILARITY_FILE),
+            'origin': origin,
+            'ref': src_dir,
+        }
+
+class IntegrityLog:
+    """
+    integrity.json in the store: the checksum manifest pinned for each checkpoint
+    folder when it was first seen (snapshots carry theirs in the snapshot manifest,
+    checkpoint zips in their CRCs) and the outcome of the last scrub of every
+    snapshot and checkpoint, so listings and restores can warn about corrupt sources.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def load(self):
+        if self.data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != self.VERSION:
+                    raise ValueError("unknown integrity log version")
+            except (OSError, ValueError):
+                data = {'version': self.VERSION, 'checkpoints': {}, 'results': {}}
+            self.data = data
+        return self.data
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_json_atomic(self.path, self.load())
+
+    def pinned(self, name):
+        """Pinned relative path -> [size, digest] of a checkpoint folder, or None"""
+        return self.load()['checkpoints'].get(name, {}).get('files')
+
+    def pin(self, name, files):
+        self.load()['checkpoints'][name] = {
+            'pinned': datetime.now().isoformat(timespec='seconds'),
+            'files': files,
+        }
+
+    def result(self, kind, entry_id):
+        """Last scrub result of a snapshot or checkpoint: {'state', 'problems', 'checked'} or None"""
+        return self.load()['results'].get(f"{kind}:{entry_id}")
+
+    def record(self, kind, entry_id, problems):
+        result = {
+            'state': 'corrupt' if problems else 'ok',
+            'problems': problems,
+            'checked': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.load()['results'][f"{kind}:{entry_id}"] = result
+        return result
+
+    def forget(self, kind, entry_id):
+        """Drop the scrub result of a deleted entry. Returns whether there was one."""
+        return self.load()['results'].pop(f"{kind}:{entry_id}", None) is not None
+
+    def forget_missing(self, kind, entry_ids):
+        """Drop the results of every entry of kind not in entry_ids"""
+        prefix = f"{kind}:"
+        results = self.load()['results']
+        for key in [key for key in results if key.startswith(prefix) and key[len(prefix):] not in entry_ids]:
+            del results[key]
+
+    def is_corrupt(self, kind, entry_id):
+        result = self.result(kind, entry_id)
+        return result is not None and result['state'] == 'corrupt'
+
+class DirCheckpoint:
+    """A checkpoint stored as a plain directory under checkpoints/"""
+    def __init__(self, name, path, hash_cache):
+        self.name = name
+        self.path = path
+        self.hash_cache = hash_cache
+        self.origin = "shipped checkpoint"
+
+    def digests(self):
+        """Relative path -> digest of every file"""
+        _, files = scan_tree(self.path)
+        return {rel_path: self.hash_cache.digest(path) for rel_path, path, _, _ in files}
+
+    def stats(self):
+        """(total_size, file_count, created datetime)"""
+        _, files = scan_tree(self.path)
+        created = datetime.fromtimestamp(os.path.getmtime(self.path))
+        return sum(size for _, _, size, _ in files), len(files), created
+
+    def read(self, rel_path):
+        with open(os.path.join(self.path, *rel_path.split('/')), 'rb') as f:
+            return f.read()
+
+    def checksum_manifest(self):
+        """Relative path -> [size, digest], pinned in the IntegrityLog the first time the checkpoint is seen"""
+        _, files = scan_tree(self.path)
+        return {rel_path: [size, self.hash_cache.digest(path)] for rel_path, path, size, _ in files}
+
+    def scrub_items(self, pinned):
+        """(size, check) pairs for IntegrityLog scrubs; check() returns a problem or None"""
+        _, files = scan_tree(self.path)
+        present = {rel_path: (path, size) for rel_path, path, size, _ in files}
+        items = [(0, lambda rel_path=rel_path: f"{rel_path}: not in the pinned manifest")
+                 for rel_path in present if rel_path not in pinned]
+
+        def check(rel_path, size, digest):
+            if rel_path not in present:
+                return f"{rel_path}: missing"
+            path, actual = present[rel_path]
+            if actual != size:
+                return f"{rel_path}: {actual} bytes, expected {size}"
+            # Straight from disk: the hash cache would vouch for same-stat bit rot
+            if hash_file(path) != digest:
+                return f"{rel_path}: content does not match its checksum"
+            return None
+
+        items += [(size, lambda entry=(rel_path, size, digest): check(*entry))
+                  for rel_path, (size, digest) in pinned.items()]
+        return items
+
+    def plan(self, dst_dir, skip=()):
+        return CopyPlan.from_tree(self.path, dst_dir, skip=skip)
+
+    def layout(self):
+        """(dirs, files) with files as (rel_path, size, mtime, opener), for write_checkpoint_pack"""
+        dirs, files = scan_tree(self.path)
+        return dirs, [(rel_path, size, mtime, lambda path=path: open(path, 'rb'))
+                      for rel_path, path, size, mtime in files]
+
+def safe_member_path(name):
+    """
+    An archive member name as a clean 'a/b' relative path, or None when it is absolute,
+    has a drive or stream (':') or a '..' component, i.e. could land outside the folder
+    it is restored into.
+    """
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or name.startswith('/') or any(part == '..' or ':' in part for part in parts):
+        return None
+    return '/'.join(parts)
+
+class ZipCheckpointArchive:
+    """
+    A zip holding one folder per checkpoint, e.g. 各章节存档.zip.
+    Only the central directory is read to list checkpoints; members are
+    streamed straight into the destination on restore.
+    """
+    def __init__(self, path, hash_cache):
+        self.path = path
+        self.hash_cache = hash_cache
+        self.zip = None
+        self.checkpoints = None
+
+    @staticmethod
+    def decode_name(info):
+        """
+        Member name as text. Names without the UTF-8 flag were decoded as cp437
+        by zipfile, so re-decode their raw bytes as UTF-8 or GBK (Chinese Windows).
+        """
+        if info.flag_bits & 0x800:
+            return info.filename
+        raw = info.filename.encode('cp437')
+        for encoding in ('utf-8', 'gbk'):
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return info.filename
+
+    def load(self):
+        """Open the zip and group its members by checkpoint folder"""
+        if self.checkpoints is not None:
+            return self.checkpoints
+        import zipfile  # only paid for when a checkpoint zip is actually present
+        try:
+            self.zip = zipfile.ZipFile(self.path)
+        except zipfile.BadZipFile as e:
+            raise OSError(f"not a valid zip file: {e}") from e
+        entries = [(self.decode_name(info).replace('\\', '/'), info) for info in self.zip.infolist()]
+        # Strip a single wrapping folder such as 各章节存档/
+        roots = {name.split('/', 1)[0] for name, _ in entries}
+        if len(roots) == 1 and all('/' in name for name, _ in entries):
+            root = roots.pop() + '/'
+            entries = [(name[len(root):], info) for name, info in entries if len(name) > len(root)]
+
+        grouped = {}
+        for name, info in entries:
+            name = safe_member_path(name)
+            if name is None:
+                # Never restored: it would write outside the save dir
+                continue
+            if '/' not in name:
+                if info.is_dir():
+                    grouped.setdefault(name, [])
+                # Otherwise a loose file next to the checkpoint folders, e.g. 存档位置.txt
+                continue
+            checkpoint, rel_path = name.split('/', 1)
+            grouped.setdefault(checkpoint, []).append((rel_path, info))
+        self.checkpoints = {name: ZipCheckpoint(self, name, members) for name, members in grouped.items()}
+        return self.checkpoints
+
+class ZipCheckpoint:
+    """One checkpoint folder inside a ZipCheckpointArchive"""
+    def __init__(self, archive, name, members):
+        self.archive = archive
+        self.name = name
+        self.members = members
+        self.path = f"{archive.path}!{name}"
+        self.origin = f"checkpoint in {os.path.basename(archive.path)}"
+
+    def files(self):
+        return [(rel_path, info) for rel_path, info in self.members if not info.is_dir()]
+
+    def digests(self):
+        """Relative path -> digest, cached per member by (size, CRC, offset)"""
+        digests = {}
+        for rel_path, info in self.files():
+            key = f"{os.path.abspath(self.archive.path)}!{info.filename}"
+            stamp = [info.file_size, info.CRC, info.header_offset]
+            digest = self.archive.hash_cache.lookup_stamp(key, stamp)
+            if digest is None:
+                hasher = hashlib.sha256()
+                with self.archive.zip.open(info) as member:
+                    for chunk in iter(lambda: member.read(HASH_CHUNK_SIZE), b''):
+                        hasher.update(chunk)
+                digest = hasher.hexdigest()
+                self.archive.hash_cache.record_stamp(key, stamp, digest)
+            digests[rel_path] = digest
+        return digests
+
+    def stats(self):
+        files = self.files()
+        created = max((datetime(*info.date_time) for _, info in files),
+                      default=datetime.fromtimestamp(os.path.getmtime(self.archive.path)))
+        return sum(info.file_size for _, info in files), len(files), created
+
+    def read(self, rel_path):
+        for path, info in self.files():
+            if path == rel_path:
+                return self.archive.zip.read(info)
+        raise FileNotFoundError(f"{rel_path} not in {self.path}")
+
+    def checksum_manifest(self):
+        """None: the CRC-32 of every member, kept by the zip itself, is its checksum manifest"""
+        return None
+
+    def scrub_items(self, pinned=None):
+        """(size, check) pairs that stream every member, so zipfile checks its CRC at the end"""
+        def check(rel_path, info):
+            try:
+                with self.archive.zip.open(info) as member:
+                    while member.read(HASH_CHUNK_SIZE):
+                        pass
+            except Exception as e:  # zipfile.BadZipFile, zlib.error, OSError
+                return f"{rel_path}: {e}"
+            return None
+
+        return [(info.file_size, lambda entry=(rel_path, info): check(*entry)) for rel_path, info in self.files()]
+
+    def layout(self):
+        """(dirs, files) with files as (rel_path, size, mtime, opener), for write_checkpoint_pack"""
+        dirs = [rel_path.rstrip('/') for rel_path, info in self.members if info.is_dir()]
+        return dirs, [(rel_path, info.file_size, time.mktime(info.date_time + (0, 0, -1)),
+                       lambda info=info: self.archive.zip.open(info))
+                      for rel_path, info in self.files()]
+
+    def plan(self, dst_dir, skip=()):
+        plan = CopyPlan()
+        plan.add_dir(dst_dir)
+        for rel_path, info in self.members:
+            dst_path = os.path.join(dst_dir, *rel_path.rstrip('/').split('/'))
+            if info.is_dir():
+                plan.add_dir(dst_path)
+            elif rel_path not in skip:
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                plan.add_file(lambda info=info: self.archive.zip.open(info), dst_path, info.file_size, mtime)
+        return plan
+
+# Packed checkpoint library (.wcpack): a fixed header, then member blobs (raw or zlib),
+# then a JSON index of name -> dirs and files with offset, length, size, sha256 and codec.
+# The header points at the current index and carries its sha256.
+PACK_SUFFIX = '.wcpack'
+PACK_MAGIC = b'WCPK'
+PACK_VERSION = 1
+# magic, version, flags, index offset, index length, index sha256
+PACK_HEADER = struct.Struct('<4sHHQQ32s')
+PACK_HEADER_SIZE = 64
+PACK_READ_CHUNK = 1024 * 1024
+# Compressed members must save at least this fraction, encrypted GAME_DATA never does
+PACK_MIN_SAVING = 0.1
+
+def read_pack_index(f):
+    """Read and check the header and index of an open pack. Returns the index dict."""
+    header = f.read(PACK_HEADER_SIZE)
+    if len(header) < PACK_HEADER.size:
+        raise OSError("not a checkpoint pack: too short")
+    magic, version, _, index_offset, index_length, index_digest = PACK_HEADER.unpack_from(header)
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        raise OSError("not a checkpoint pack of a supported version")
+    f.seek(index_offset)
+    raw = f.read(index_length)
+    if hashlib.sha256(raw).digest() != index_digest:
+        raise OSError("checkpoint pack index is damaged")
+    return json.loads(raw.decode('utf-8'))
+
+def pack_dead_bytes(path):
+    """Bytes of a pack no longer reachable from its index: dropped blobs and superseded indexes"""
+    with open(path, 'rb') as f:
+        index = read_pack_index(f)
+        f.seek(0)
+        index_length = PACK_HEADER.unpack_from(f.read(PACK_HEADER.size))[4]
+    blobs = {(member['offset'], member['length']) for entry in index['checkpoints'].values()
+             for member in entry['files']}
+    live = PACK_HEADER_SIZE + index_length + sum(length for _, length in blobs)
+    return os.path.getsize(path) - live
+
+def write_checkpoint_pack(path, checkpoints, compress=True, keep_removed=False, compact=False):
+    """
+    Create a pack from checkpoints (name -> DirCheckpoint/ZipCheckpoint/PackedCheckpoint),
+    or append them to an existing one. New blobs and a new index go after the current end
+    and only then is the header repointed, in place, so an interrupted append leaves the
+    previous index in force. Content already in the pack is not stored again and
+    checkpoints whose content is unchanged are skipped. Checkpoints missing from
+    checkpoints are dropped from the index unless keep_removed is set.
+    An append never reclaims space; compact=True rewrites the pack with only what its
+    index still uses, into a temp file that replaces it at the end.
+    Returns (names written, names dropped).
+    """
+    if compact and os.path.exists(path):
+        old = PackedCheckpointArchive(path)
+        try:
+            old_names = set(old.load())
+            sources = dict(checkpoints)
+            if keep_removed:
+                for name, checkpoint in old.checkpoints.items():
+                    sources.setdefault(name, checkpoint)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                write_checkpoint_pack(tmp_path, sources, compress)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            old.close()
+        os.replace(tmp_path, path)
+        return sorted(sources), sorted(old_names - set(sources))
+
+    if os.path.exists(path):
+        f = open(path, 'r+b')
+        index = read_pack_index(f)
+    else:
+        f = open(path, 'w+b')
+        f.write(bytes(PACK_HEADER_SIZE))
+        index = {'checkpoints': {}}
+    with f:
+        stored = {member['digest']: member for entry in index['checkpoints'].values()
+                  for member in entry['files']}
+        dropped = [] if keep_removed else sorted(set(index['checkpoints']) - set(checkpoints))
+        for name in dropped:
+            del index['checkpoints'][name]
+        f.seek(0, os.SEEK_END)
+        written = []
+        for name, checkpoint in sorted(checkpoints.items()):
+            digests = checkpoint.digests()
+            old = index['checkpoints'].get(name)
+            if old and {member['path']: member['digest'] for member in old['files']} == digests:
+                continue
+            dirs, files = checkpoint.layout()
+            members = []
+            for rel_path, size, mtime, opener in files:
+                digest = digests[rel_path]
+                if digest not in stored:
+                    with opener() as src:
+                        data = src.read()
+                    codec = 'raw'
+                    if compress and data:
+                        packed = zlib.compress(data, 6)
+                        if len(packed) <= len(data) * (1 - PACK_MIN_SAVING):
+                            data, codec = packed, 'zlib'
+                    stored[digest] = {'offset': f.tell(), 'length': len(data), 'codec': codec}
+                    f.write(data)
+                blob = stored[digest]
+                members.append({'path': rel_path, 'offset': blob['offset'], 'length': blob['length'],
+                                'codec': blob['codec'], 'size': size, 'digest': digest, 'mtime': mtime})
+            _, _, created = checkpoint.stats()
+            index['checkpoints'][name] = {
+                'created': created.isoformat(timespec='seconds'),
+                'dirs': dirs,
+                'files': members,
+            }
+            written.append(name)
+        if not written and not dropped:
+            return written, dropped
+        raw = json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        index_offset = f.tell()
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, index_offset, len(raw), hashlib.sha256(raw).digest()))
+        f.flush()
+        os.fsync(f.fileno())
+    return written, dropped
+
+class PackMember:
+    """Readable stream over one pack member's bytes: a slice of the mapping, no copy of the rest"""
+    def __init__(self, mapped, offset, length):
+        self.view = memoryview(mapped)[offset:offset + length]
+        self.pos = 0
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(len(self.view), self.pos + size)
+        chunk = self.view[self.pos:end].tobytes()
+        self.pos = end
+        return chunk
+
+    def close(self):
+        self.view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PackedCheckpointArchive:
+    """
+    A .wcpack checkpoint library, opened through one read-only mmap. Listing only
+    parses the index; a restore streams just the members it needs.
+    """
+    def __init__(self, path, hash_cache=None):
+        self.path = path
+        self.hash_cache = hash_cache
+        self.mapped = None
+        self.checkpoints = None
+
+    def load(self):
+        if self.checkpoints is not None:
+            return self.checkpoints
+        import mmap
+        with open(self.path, 'rb') as f:
+            index = read_pack_index(f)
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.checkpoints = {name: PackedCheckpoint(self, name, entry)
+                            for name, entry in index['checkpoints'].items()}
+        return self.checkpoints
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        self.checkpoints = None
+
+    def open_member(self, member):
+        stream = PackMember(self.mapped, member['offset'], member['length'])
+        return InflatingReader(stream) if member['codec'] == 'zlib' else stream
+
+class PackedCheckpoint:
+    """One checkpoint inside a PackedCheckpointArchive; its digests come precomputed from the index"""
+    def __init__(self, archive, name, entry):
+        self.archive = archive
+        self.name = name
+        self.entry = entry
+        self.path = f"{archive.path}!{name}"
+        self.origin = f"checkpoint in {os.path.basename(archive.path)}"
+
+    def digests(self):
+        return {member['path']: member['digest'] for member in self.entry['files']}
+
+    def stats(self):
+        files = self.entry['files']
+        return sum(member['size'] for member in files), len(files), datetime.fromisoformat(self.entry['created'])
+
+    def read(self, rel_path):
+        for member in self.entry['files']:
+            if member['path'] == rel_path:
+                with self.archive.open_member(member) as stream:
+                    return stream.read()
+        raise FileNotFoundError(f"{rel_path} not in {self.path}")
+
+    def layout(self):
+        return self.entry['dirs'], [(member['path'], member['size'], member['mtime'],
+                                     lambda member=member: self.archive.open_member(member))
+                                    for member in self.entry['files']]
+
+    def plan(self, dst_dir, skip=()):
+        plan = CopyPlan()
+        plan.add_dir(dst_dir)
+        for rel_dir in self.entry['dirs']:
+            plan.add_dir(os.path.join(dst_dir, *rel_dir.split('/')))
+        for member in self.entry['files']:
+            if member['path'] not in skip:
+                plan.add_file(lambda member=member: self.archive.open_member(member),
+                              os.path.join(dst_dir, *member['path'].split('/')), member['size'], member['mtime'])
+        return plan
+
+    def checksum_manifest(self):
+        """None: the pack index already holds the size and sha256 of every member"""
+        return None
+
+    def scrub_items(self, pinned=None):
+        """(size, check) pairs that stream every member and compare it with the index"""
+        def check(member):
+            hasher = hashlib.sha256()
+            size = 0
+            try:
+                with self.archive.open_member(member) as stream:
+                    for chunk in iter(lambda: stream.read(PACK_READ_CHUNK), b''):
+                        hasher.update(chunk)
+                        size += len(chunk)
+            except (ValueError, zlib.error) as e:
+                return f"{member['path']}: {e}"
+            if size != member['size'] or hasher.hexdigest() != member['digest']:
+                return f"{member['path']}: content does not match its checksum"
+            return None
+
+        return [(member['size'], lambda member=member: check(member)) for member in self.entry['files']]
+
+def open_checkpoint_archive(path, hash_cache):
+    """Checkpoint archive reader for a .wcpack library or a zip"""
+    if path.lower().endswith(PACK_SUFFIX):
+        return PackedCheckpointArchive(path, hash_cache)
+    return ZipCheckpointArchive(path, hash_cache)
+
+def dir_identity(path):
+    """(device, inode) of a directory, or None if it doesn't exist. Changes when it is swapped out."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+def tree_signature(path):
+    """Cheap stat-only fingerprint of a tree: no file is opened"""
+    if not os.path.isdir(path):
+        return None
+    _, files = scan_tree(path)
+    return frozenset((rel_path, size, mtime) for rel_path, _, size, mtime in files)
+
+class PollWatch:
+    """Fallback change source: compares a stat signature of the tree every poll_interval"""
+    name = 'poll'
+
+    def __init__(self, path, poll_interval=2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.signature = tree_signature(path)
+        self.next_poll = time.monotonic() + poll_interval
+
+    def wait(self, timeout):
+        """True once the tree changed, False when timeout passes without a change"""
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self.next_poll:
+                self.next_poll = now + self.poll_interval
+                signature = tree_signature(self.path)
+                if signature != self.signature:
+                    self.signature = signature
+                    return True
+            if now >= deadline:
+                return False
+            time.sleep(min(self.next_poll, deadline) - now)
+
+    def close(self):
+        pass
+
+# inotify(7) event bits
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x800
+IN_CLOEXEC = 0x80000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class InotifyWatch:
+    """Linux change source. Blocks in select() on the inotify fd, so an idle save costs no CPU."""
+    name = 'inotify'
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self.path = path
+        self.watches = {}
+        self.arm()
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def arm(self):
+        """(Re)watch every directory of the tree; inotify itself is not recursive"""
+        for wd in self.watches:
+            self.libc.inotify_rm_watch(self.fd, wd)
+        self.watches = {}
+        self.identity = dir_identity(self.path)
+        if self.identity is None:
+            return
+        self.add_watch(self.path)
+        for dirpath, dirnames, _ in os.walk(self.path):
+            for name in dirnames:
+                self.add_watch(os.path.join(dirpath, name))
+
+    def wait(self, timeout):
+        """True once something under the tree changed, False when timeout passes quietly"""
+        import select
+        if dir_identity(self.path) != self.identity:
+            # The save dir appeared, vanished or was swapped for another directory
+            self.arm()
+            return True
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        changed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self.watches:
+                self.add_watch(os.path.join(self.watches[wd], os.fsdecode(name)))
+            changed = True
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# FindFirstChangeNotification filter bits
+FILE_NOTIFY_CHANGE_FILE_NAME = 0x1
+FILE_NOTIFY_CHANGE_DIR_NAME = 0x2
+FILE_NOTIFY_CHANGE_SIZE = 0x8
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+WAIT_OBJECT_0 = 0
+
+class WindowsChangeWatch:
+    """Windows change source: a change-notification handle on the whole tree"""
+    name = 'win32'
+    notify_filter = (FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_DIR_NAME |
+                     FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE)
+
+    def __init__(self, path):
+        import ctypes
+        from ctypes import wintypes
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+        self.kernel32.FindFirstChangeNotificationW.argtypes = [wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+        self.kernel32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+        self.kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self.kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        self.invalid_handle = wintypes.HANDLE(-1).value
+        self.path = path
+        self.handle = None
+        self.arm()
+
+    def arm(self):
+        self.close()
+        self.identity = dir_identity(self.path)
+        if self.identity is None:
+            return
+        handle = self.kernel32.FindFirstChangeNotificationW(self.path, True, self.notify_filter)
+        if handle in (None, self.invalid_handle):
+            raise OSError(f"FindFirstChangeNotification failed for {self.path}")
+        self.handle = handle
+
+    def wait(self, timeout):
+        """True once something under the tree changed, False when timeout passes quietly"""
+        if dir_identity(self.path) != self.identity:
+            try:
+                self.arm()
+            except OSError:
+                self.handle = None
+            return True
+        if self.handle is None:
+            time.sleep(timeout)
+            return False
+        if self.kernel32.WaitForSingleObject(self.handle, int(timeout * 1000)) != WAIT_OBJECT_0:
+            return False
+        self.kernel32.FindNextChangeNotification(self.handle)
+        return True
+
+    def close(self):
+        if self.handle is not None:
+            self.kernel32.FindCloseChangeNotification(self.handle)
+            self.handle = None
+
+def open_change_source(path, poll_interval=2.0):
+    """The OS notification source for path, or stat polling where none is available"""
+    try:
+        if sys.platform.startswith('linux'):
+            return InotifyWatch(path)
+        if os.name == 'nt':
+            return WindowsChangeWatch(path)
+    except (OSError, AttributeError):
+        pass
+    return PollWatch(path, poll_interval)
+
+class SaveWatcher:
+    """
+    Background auto-snapshots of the live save.
+    A burst of writes is debounced, the tree must then hold still for stable_for
+    seconds, and snapshots are at least min_interval apart: saves landing inside
+    that window are folded into the next snapshot.
+    """
+    # Upper bound on a single blocking wait, so stop() is honoured promptly
+    wait_slice = 0.5
+
+    def __init__(self, manager, debounce=2.0, stable_for=1.0, min_interval=60.0, poll_interval=2.0):
+        self.manager = manager
+        self.debounce = debounce
+        self.stable_for = stable_for
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self.source = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.mute_lock = threading.Lock()
+        self.muted = 0
+        # Bumped by every mute(), so a burst that overlapped one can be recognised afterwards
+        self.mute_generation = 0
+        self.last_snapshot = None
+        self.snapshots = []
+        self.errors = []
+
+    def start(self):
+        """Start watching. Returns the change source in use: inotify, win32 or poll."""
+        self.source = open_change_source(self.manager.game_save_dir, self.poll_interval)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='save-watcher', daemon=True)
+        self.thread.start()
+        return self.source.name
+
+    def stop(self, wait=True):
+        """
+        Stop watching. With wait=False only a snapshot already being written is waited
+        for; the daemon thread is left to notice the stop (or die with the process).
+        """
+        self.stop_event.set()
+        if not wait:
+            with self.manager.lock:
+                return
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.source is not None:
+            self.source.close()
+
+    @contextlib.contextmanager
+    def mute(self):
+        """Ignore changes made inside the block, i.e. the manager's own writes to the save"""
+        with self.mute_lock:
+            self.muted += 1
+            self.mute_generation += 1
+        try:
+            yield
+        finally:
+            with self.mute_lock:
+                self.muted -= 1
+
+    def was_muted(self, generation):
+        """True if a mute() was active or started since generation was read"""
+        with self.mute_lock:
+            return self.muted > 0 or self.mute_generation != generation
+
+    def run(self):
+        while not self.stop_event.is_set():
+            # Read before waiting: events are often only seen after the writer has finished
+            generation = self.mute_generation
+            if not self.source.wait(self.wait_slice):
+                continue
+            if not self.settle():
+                return
+            if self.was_muted(generation):
+                continue
+            self.snapshot()
+
+    def quiet_for(self, seconds):
+        """Absorb change events until none arrive for `seconds`. False if stopped meanwhile."""
+        while True:
+            if self.stop_event.is_set():
+                return False
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                if self.source.wait(min(self.wait_slice, deadline - time.monotonic())):
+                    break
+                if self.stop_event.is_set():
+                    return False
+            else:
+                return True
+
+    def settle(self):
+        """Debounce, honour min_interval, then wait for a stable tree. False if stopped meanwhile."""
+        while True:
+            if not self.quiet_for(self.debounce):
+                return False
+            if self.last_snapshot is None:
+                break
+            remaining = self.last_snapshot + self.min_interval - time.monotonic()
+            if remaining <= 0:
+                break
+            if self.stop_event.wait(remaining):
+                return False
+        # Not mid-write: the stat signature has to hold still across stable_for
+        path = self.manager.game_save_dir
+        signature = tree_signature(path)
+        while True:
+            if self.stop_event.wait(self.stable_for):
+                return False
+            current = tree_signature(path)
+            if current == signature:
+                return True
+            signature = current
+
+    def snapshot(self):
+        manager = self.manager
+        if manager.scheduler is not None and manager.scheduler.alive():
+            # Written at the scheduler's pace and priority; its snapshots are listed there
+            manager.scheduler.request(origin="auto snapshot")
+            self.last_snapshot = time.monotonic()
+            return
+        with manager.lock:
+            ok = manager.backup_savedata(silent=True, origin="auto snapshot", skip_duplicate=True)
+            snapshot_id, error = manager.last_snapshot_id, manager.last_error
+        self.last_snapshot = time.monotonic()
+        if not ok:
+            self.errors.append(error)
+        elif snapshot_id:
+            self.snapshots.append(snapshot_id)
+
+class OperationCancelled(BaseException):
+    """
+    Raised from the progress callback of a cancelled Operation. A BaseException, like
+    KeyboardInterrupt, so the manager's `except Exception` reporting cannot swallow it.
+    """
+
+class Operation:
+    """
+    One backup, replace or recover, observable and cancellable.
+    Subscribers are called on the worker thread with event dicts, each with 'type',
+    'operation' and 'time': queued, started, phase (begin/end with seconds), copy,
+    progress (bytes/files against totals), copy_end, rollback and finished.
+    cancel() stops the copy at its next chunk; a cancelled or failed replace/recover
+    leaves the live save exactly as it was (see SaveDataManager.apply_incoming).
+    join() blocks until it finished, `await operation` does the same from asyncio.
+    """
+    METHODS = {
+        'backup': 'backup_savedata',
+        'replace': 'replace_savedata',
+        'recover': 'recover_savedata',
+    }
+
+    def __init__(self, manager, kind, operation_id, subscribers=(), **options):
+        if kind not in self.METHODS:
+            raise ValueError(f"unknown operation: {kind}")
+        self.manager = manager
+        self.kind = kind
+        self.id = operation_id
+        self.options = options
+        self.subscribers = list(subscribers)
+        # pending, running, done, failed or cancelled
+        self.state = 'pending'
+        self.ok = None
+        self.error = None
+        self.seconds = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def emit(self, event):
+        event = {**event, 'operation': self.id, 'time': time.time()}
+        for callback in list(self.subscribers):
+            callback(event)
+
+    def cancel(self):
+        """Ask the operation to stop. Safe from any thread, and before it started."""
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        """Run on the calling thread (normally the OperationQueue worker). Returns ok."""
+        manager = self.manager
+        if self.cancelled():
+            return self.finish('cancelled', False, 0.0)
+        self.state = 'running'
+        start = time.perf_counter()
+        # One operation (or watcher snapshot, or prune) touches the store and save at a time
+        with manager.lock:
+            manager.operation = self
+            manager.listeners.append(self.emit)
+            try:
+                self.emit({'type': 'started', 'kind': self.kind, 'options': self.options})
+                ok = getattr(manager, self.METHODS[self.kind])(**self.options)
+                state = 'done' if ok else 'failed'
+            except OperationCancelled:
+                ok, state = False, 'cancelled'
+            except Exception as e:
+                manager.fail(f"Error running {self.kind}: {e}")
+                ok, state = False, 'failed'
+            finally:
+                manager.listeners.remove(self.emit)
+                manager.operation = None
+        return self.finish(state, ok, time.perf_counter() - start)
+
+    def finish(self, state, ok, seconds):
+        self.state = state
+        self.ok = ok
+        self.seconds = seconds
+        if state == 'failed':
+            self.error = self.manager.last_error
+        elif state == 'cancelled':
+            self.error = self.manager.last_error = f"{self.kind} cancelled"
+        self.emit({'type': 'finished', 'state': state, 'ok': ok, 'error': self.error, 'seconds': seconds})
+        self.done.set()
+        return ok
+
+    def join(self, timeout=None):
+        """Wait for the operation to finish. Returns ok, or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Short waits keep Ctrl-C deliverable on every platform
+        while not self.done.wait(0.1):
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+        return self.ok
+
+    def __await__(self):
+        import asyncio
+        return asyncio.get_running_loop().run_in_executor(None, self.join).__await__()
+
+class OperationQueue:
+    """
+    Runs a manager's operations back to back, in submission order, on one worker thread.
+    The worker exits when the queue is empty; it is not a daemon, so the process
+    never exits halfway through writing a save.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.condition = threading.Condition()
+        self.pending = []
+        self.current = None
+        self.thread = None
+        self.submitted = 0
+
+    def submit(self, kind, subscribers=(), **options):
+        """Queue an operation. Subscribers passed here see every event, including 'queued'."""
+        with self.condition:
+            self.submitted += 1
+            operation = Operation(self.manager, kind, f"{kind}-{self.submitted}", subscribers, **options)
+            self.pending.append(operation)
+            position = len(self.pending) + (self.current is not None)
+            operation.emit({'type': 'queued', 'kind': kind, 'position': position})
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='operations')
+                self.thread.start()
+        return operation
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    self.condition.notify_all()
+                    return
+                operation = self.current = self.pending.pop(0)
+            try:
+                operation.run()
+            except Exception as e:
+                # A failing subscriber must not strand its joiners or the rest of the queue
+                operation.state, operation.ok, operation.error = 'failed', False, str(e)
+                operation.done.set()
+            finally:
+                with self.condition:
+                    self.current = None
+
+    def busy(self):
+        """True while an operation is running or waiting to run"""
+        with self.condition:
+            return bool(self.pending) or self.current is not None
+
+    def cancel_all(self):
+        """Cancel the running operation and everything still queued"""
+        with self.condition:
+            for operation in self.pending + [self.current]:
+                if operation is not None:
+                    operation.cancel()
+
+    def join(self):
+        """Wait until the queue is empty and idle"""
+        with self.condition:
+            while self.thread is not None:
+                self.condition.wait(0.1)
+
+class JsonEventLog:
+    """Event subscriber writing one JSON object per line; progress at most every interval seconds"""
+    def __init__(self, stream=None, interval=0.5):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.next_progress = 0.0
+
+    def __call__(self, event):
+        if event['type'] == 'progress':
+            now = time.monotonic()
+            if now < self.next_progress:
+                return
+            self.next_progress = now + self.interval
+        self.stream.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+# Default pace of background backups; the game keeps the rest of the disk
+BACKGROUND_BACKUP_RATE = 16 * 1024 * 1024
+# ioprio_set(2) syscall numbers by machine
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'arm64': 30, 'armv7l': 314}
+
+def lower_thread_priority():
+    """
+    Drop the calling thread to background CPU and disk priority where the OS has a
+    per-thread setting. Returns the names of what was applied, possibly none.
+    """
+    applied = []
+    try:
+        import ctypes
+    except ImportError:
+        return applied
+    if os.name == 'nt':
+        kernel32 = ctypes.windll.kernel32
+        # THREAD_MODE_BACKGROUND_BEGIN: low CPU, I/O and memory priority for this thread only
+        if kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 0x00010000):
+            applied.append('background-mode')
+    elif sys.platform.startswith('linux'):
+        import platform
+        try:
+            # Linux keeps nice values per thread, and who=0 is the calling one
+            os.setpriority(os.PRIO_PROCESS, 0, 19)
+            applied.append('nice')
+        except OSError:
+            pass
+        number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+        # ioprio_set(IOPRIO_WHO_PROCESS, this thread, IOPRIO_CLASS_IDLE): disk time nobody else wants
+        if number is not None and ctypes.CDLL(None).syscall(number, 1, 0, 3 << 13) == 0:
+            applied.append('ioprio-idle')
+    elif sys.platform == 'darwin':
+        libc = ctypes.CDLL(None)
+        # setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE)
+        if hasattr(libc, 'setiopolicy_np') and libc.setiopolicy_np(0, 1, 3) == 0:
+            applied.append('iopolicy-throttle')
+    return applied
+
+class BackupThrottle:
+    """
+    Paces background backups: at most rate bytes/s (None for no limit), and while
+    the save tree's stat signature keeps changing, i.e. the game is writing it, the
+    copy stops until it has held still for stable_for seconds. should_stop is polled
+    throughout; once it is true the backup is abandoned with OperationCancelled.
+    """
+    # Longest single sleep, so a stop or a waiting operation is noticed promptly
+    wait_slice = 0.1
+
+    def __init__(self, save_dir, rate=None, stable_for=1.0, check_interval=0.5, should_stop=None):
+        self.save_dir = save_dir
+        self.rate = rate
+        self.stable_for = stable_for
+        self.check_interval = check_interval
+        self.should_stop = should_stop or (lambda: False)
+        self.signature = None
+        self.changed = False
+        self.started = 0.0
+        self.next_check = 0.0
+        self.skipped = 0
+        # Seconds spent waiting for the game to finish writing, over all backups
+        self.paused = 0.0
+
+    def wait(self, seconds):
+        deadline = time.monotonic() + seconds
+        while True:
+            if self.should_stop():
+                raise OperationCancelled("background backup")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(self.wait_slice, remaining))
+
+    def wait_until_stable(self):
+        """Block until the save tree holds still for stable_for seconds; it is the state to back up"""
+        signature = tree_signature(self.save_dir)
+        while True:
+            self.wait(self.stable_for)
+            current = tree_signature(self.save_dir)
+            if current == signature:
+                break
+            signature = current
+        self.signature = signature
+        return signature
+
+    def wrap(self, callback):
+        """Progress callback for one backup: passes progress on, then paces and pauses it"""
+        self.started = time.monotonic()
+        self.next_check = self.started + self.check_interval
+        self.skipped = 0
+
+        def paced(bytes_done, files_done):
+            if callback:
+                callback(bytes_done, files_done)
+            self.pace(bytes_done - self.skipped)
+
+        def skip(n):
+            # Already stored content is not read, so it doesn't count against the rate
+            self.skipped += n
+        paced.skip = skip
+        return paced
+
+    def pace(self, bytes_read):
+        now = time.monotonic()
+        if now >= self.next_check:
+            current = tree_signature(self.save_dir)
+            cost = time.monotonic() - now
+            if current != self.signature:
+                self.changed = True
+                self.wait_until_stable()
+                waited = time.monotonic() - now
+                self.paused += waited
+                # Time spent paused earns no rate credit
+                self.started += waited
+            now = time.monotonic()
+            # On big trees keep the stat walks to a few percent of the backup
+            self.next_check = now + max(self.check_interval, cost * 20)
+        due = self.started + bytes_read / self.rate if self.rate else now
+        self.wait(max(0.0, due - now))
+
+class BackupScheduler:
+    """
+    Periodic (every interval seconds) and deferred (request()) backups, run one at a
+    time on a low-priority thread and paced by a BackupThrottle. Pending requests
+    collapse into one job, since they would all back up the same live state, and a
+    run is skipped outright when the tree's stat signature hasn't changed since the
+    last one. A background backup gives way to any queued or running operation and
+    is tried again retry_delay seconds later.
+    """
+    def __init__(self, manager, interval=None, rate=BACKGROUND_BACKUP_RATE, stable_for=1.0,
+                 retry_delay=5.0, low_priority=True):
+        self.manager = manager
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.low_priority = low_priority
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # The pending job: when it is due and the origins of the requests folded into it
+        self.due = None
+        self.origins = []
+        self.next_periodic = None
+        self.last_signature = None
+        self.throttle = BackupThrottle(manager.game_save_dir, rate, stable_for, should_stop=self.should_yield)
+        self.priority = []
+        self.requested = 0
+        self.coalesced = 0
+        self.preempted = 0
+        self.snapshots = []
+        self.errors = []
+
+    def start(self):
+        self.stop_event.clear()
+        if self.interval:
+            self.next_periodic = time.monotonic() + self.interval
+        self.thread = threading.Thread(target=self.run, name='backup-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """Stop scheduling; a backup in progress is abandoned at its next chunk"""
+        with self.condition:
+            self.stop_event.set()
+            self.condition.notify_all()
+        if wait and self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def request(self, delay=0.0, origin="scheduled backup"):
+        """Ask for a backup in delay seconds. A pending one absorbs it, keeping the earlier time."""
+        with self.condition:
+            self.requested += 1
+            self._defer(delay, origin)
+
+    def _defer(self, delay, origin):
+        due = time.monotonic() + delay
+        if self.due is not None:
+            self.coalesced += 1
+            due = min(due, self.due)
+        self.due = due
+        if origin not in self.origins:
+            self.origins.append(origin)
+        self.condition.notify_all()
+
+    def should_yield(self):
+        return self.stop_event.is_set() or self.manager.operations.busy()
+
+    def run(self):
+        if self.low_priority:
+            self.priority = lower_thread_priority()
+        while True:
+            with self.condition:
+                if self.stop_event.is_set():
+                    return
+                now = time.monotonic()
+                if self.next_periodic is not None and now >= self.next_periodic:
+                    self.next_periodic = now + self.interval
+                    self._defer(0.0, "periodic backup")
+                if self.due is None or self.due > now:
+                    wake = [t for t in (self.due, self.next_periodic) if t is not None]
+                    self.condition.wait(min(wake) - now if wake else None)
+                    continue
+                origins, self.due, self.origins = self.origins, None, []
+            self.run_backup("; ".join(origins))
+
+    def run_backup(self, origin):
+        manager = self.manager
+        try:
+            signature = self.throttle.wait_until_stable()
+            if signature is not None and signature == self.last_signature:
+                return
+            self.throttle.changed = False
+            with manager.lock:
+                ok = manager.backup_savedata(silent=True, origin=origin, skip_duplicate=True,
+                                             throttle=self.throttle)
+                snapshot_id, error = manager.last_snapshot_id, manager.last_error
+        except OperationCancelled:
+            if not self.stop_event.is_set():
+                # An operation needs the save: back up again once it has had its turn
+                with self.condition:
+                    self.preempted += 1
+                    self._defer(self.retry_delay, origin)
+            return
+        except Exception as e:
+            # E.g. the game swapped a file out mid-scan: note it and try again, never let the thread die
+            self.errors.append(f"Error in background backup: {e}")
+            with self.condition:
+                self._defer(self.retry_delay, origin)
+            return
+        if not ok:
+            self.errors.append(error)
+            return
+        if snapshot_id:
+            self.snapshots.append(snapshot_id)
+        if self.throttle.changed:
+            # The game wrote the save mid-backup: also capture the state it settled in
+            with self.condition:
+                self._defer(0.0, origin)
+        else:
+            self.last_signature = signature
+
+    def stats(self):
+        return {
+            'priority': self.priority,
+            'requested': self.requested,
+            'coalesced': self.coalesced,
+            'preempted': self.preempted,
+            'paused_seconds': round(self.throttle.paused, 3),
+            'snapshots': self.snapshots,
+            'errors': self.errors,
+        }
 
-class TerminalUI:
-    @staticmethod
-    def clear_screen():
-        """Clear the terminal screen"""
-        print(CLEAR_SCREEN, end='')
+# Upper bounds (seconds) of the operation latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
 
-    @staticmethod
-    def draw_header(text):
-        """Draw a decorated header with animated bars"""
-        width = os.get_terminal_size().columns
-        print(GREEN + "=" * width + RESET)
-        
-        # Center the text
-        padding = (width - len(text)) // 2
-        print(GREEN + " " * padding + BRIGHT_GREEN + text + RESET)
-        print(GREEN + "=" * width + RESET)
+def prometheus_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
 
-    @staticmethod
-    def draw_progress_bar(progress, message="", speed=""):
-        """Draw a progress bar with message"""
-        # Move cursor up two lines and clear previous progress display
-        print(f"\033[2A\r{CLEAR_LINE}", end='')
-        print(CLEAR_LINE, end='')
-        
-        width = os.get_terminal_size().columns - 20  # Leave space for percentage
-        filled = int(width * progress / 100)
-        bar = f"{GREEN}>{BRIGHT_GREEN}{'=' * filled}{GREEN}{'-' * (width - filled)}{RESET}"
-        percentage = f"{progress:5.1f}%"
-        
-        # Print the new progress state without extra newlines
-        print(f"{GREEN}> {message}{RESET}")
-        print(f"{GREEN}> {percentage} [{bar}] {speed}{RESET}", end='\r', flush=True)
+class OperationMetrics:
+    """
+    Persistent counters and latency histograms of backup/replace/recover: runs by
+    result, bytes copied versus skipped or deduplicated, and the backup count and
+    store size. The totals are kept in metrics.json and exported in the Prometheus
+    text format for a textfile collector. Recording only updates memory; both files
+    are rewritten atomically by a background thread.
+    """
+    VERSION = 1
 
-    @staticmethod
-    def print_menu():
-        """Print the main menu"""
-        print(f"\n{GREEN}Game Savedata Manager")
-        print(f"{BRIGHT_GREEN}1. 替换现有存档为指定存档")
-        print("2. 备份当前存档")
-        print("3. 恢复备份存档")
-        print(f"4. 退出{RESET}")
+    def __init__(self, state_path, export_path, save_dir):
+        self.state_path = state_path
+        self.export_path = export_path
+        self.save_dir = save_dir
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.data = None
+        self.writer = None
+        self.pending = False
+        self.write_error = None
+
+    def load(self):
+        if self.data is None:
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != self.VERSION:
+                    raise ValueError("unknown metrics version")
+            except (OSError, ValueError):
+                data = {'version': self.VERSION, 'operations': {}, 'bytes': {}, 'latency': {},
+                        'last': {}, 'gauges': {}}
+            self.data = data
+        return self.data
+
+    def begin(self, operation):
+        """Start recording one run; add() calls on this thread count towards it until finish()"""
+        record = {'operation': operation, 'start': time.perf_counter(), 'bytes': {}}
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(record)
+        return record
+
+    def add(self, **byte_counts):
+        """Add bytes to the innermost running record, e.g. add(copied=n, skipped=m)"""
+        stack = getattr(self.local, 'stack', None)
+        if stack:
+            counts = stack[-1]['bytes']
+            for kind, value in byte_counts.items():
+                counts[kind] = counts.get(kind, 0) + value
+
+    def finish(self, record, result, **gauges):
+        seconds = time.perf_counter() - record['start']
+        self.local.stack.remove(record)
+        operation = record['operation']
+        with self.lock:
+            data = self.load()
+            key = f"{operation}|{result}"
+            data['operations'][key] = data['operations'].get(key, 0) + 1
+            for kind, value in record['bytes'].items():
+                key = f"{operation}|{kind}"
+                data['bytes'][key] = data['bytes'].get(key, 0) + value
+            if result != 'cancelled':
+                latency = data['latency'].setdefault(
+                    operation, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if seconds <= bound:
+                        latency['buckets'][i] += 1
+                latency['sum'] += seconds
+                latency['count'] += 1
+            data['last'][operation] = time.time()
+            data['gauges'].update({name: value for name, value in gauges.items() if value is not None})
+            self.pending = True
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_loop, name="metrics")
+                self.writer.start()
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.writer = None
+                    return
+                self.pending = False
+                state = json.dumps(self.data, indent=1)
+                exposition = self.render(self.data)
+            try:
+                for path, text in ((self.state_path, state), (self.export_path, exposition)):
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                    write_text_atomic(path, text)
+                self.write_error = None
+            except OSError as e:
+                self.write_error = e
+
+    def flush(self):
+        """Wait for the background write of everything recorded so far"""
+        writer = self.writer
+        if writer is not None:
+            writer.join()
+
+    def render(self, data):
+        """The Prometheus text exposition of a metrics state"""
+        base = {'save_dir': self.save_dir}
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{prometheus_labels({**base, **labels})} {value}")
+
+        family('savedata_operations_total', 'counter', "Backup, replace and recover runs by result.",
+               [('', dict(zip(('operation', 'result'), key.split('|'))), count)
+                for key, count in sorted(data['operations'].items())])
+        family('savedata_bytes_total', 'counter',
+               "Bytes copied, or skipped as unchanged or deduplicated, by operation.",
+               [('', dict(zip(('operation', 'kind'), key.split('|'))), count)
+                for key, count in sorted(data['bytes'].items())])
+        samples = []
+        for operation, latency in sorted(data['latency'].items()):
+            for bound, count in zip(LATENCY_BUCKETS, latency['buckets']):
+                samples.append(('_bucket', {'operation': operation, 'le': repr(bound)}, count))
+            samples.append(('_bucket', {'operation': operation, 'le': '+Inf'}, latency['count']))
+            samples.append(('_sum', {'operation': operation}, round(latency['sum'], 6)))
+            samples.append(('_count', {'operation': operation}, latency['count']))
+        family('savedata_operation_duration_seconds', 'histogram', "Wall time of finished operations.", samples)
+        family('savedata_last_operation_timestamp_seconds', 'gauge', "Unix time an operation last finished.",
+               [('', {'operation': operation}, round(when, 3)) for operation, when in sorted(data['last'].items())])
+        gauges = data['gauges']
+        if 'backups' in gauges:
+            family('savedata_backups', 'gauge', "Backups in the store.", [('', {}, gauges['backups'])])
+        if 'store_bytes' in gauges:
+            family('savedata_store_bytes', 'gauge', "Bytes the backup store takes on disk.",
+                   [('', {}, gauges['store_bytes'])])
+        return '\n'.join(lines) + '\n'
+
+def metered(operation):
+    """Count every call of a SaveDataManager operation, its result and latency in self.metrics"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            record = self.metrics.begin(operation)
+            result = 'failed'
+            try:
+                ok = method(self, *args, **kwargs)
+                result = 'ok' if ok else 'failed'
+                return ok
+            except OperationCancelled:
+                result = 'cancelled'
+                raise
+            finally:
+                self.metrics.finish(record, result, **self.metric_gauges())
+        return wrapper
+    return decorate
+
+# The checkpoint zip shipped with the program; other zips next to it are never read
+CHECKPOINT_ZIP_NAME = '各章节存档.zip'
+
+def default_checkpoint_archives():
+    """The checkpoint zip and packs shipped next to the script or exe (各章节存档.zip, checkpoints.wcpack)"""
+    app_path = get_app_path()
+    return sorted(os.path.join(app_path, name) for name in os.listdir(app_path)
+                  if name == CHECKPOINT_ZIP_NAME or name.lower().endswith(PACK_SUFFIX))
 
 def get_app_path():
     """Get the application base path, works for both script and frozen exe"""
@@ -99,143 +3581,1725 @@ def get_app_path():
         return os.path.dirname(os.path.abspath(__file__))
 
 class SaveDataManager:
-    def __init__(self, progress_steps=50, progress_interval=0.05):
+    def __init__(self, progress_interval=0.05, game_save_dir=None, checkpoints_dir=None, store_dir=None,
+                 storage_mode="delta", swap_mode="overlay", checkpoint_archives=None, retention=None,
+                 quiet=False, copy_workers=None, verify_restores=True, compress_level=0,
+                 metrics_file=None, preload_cache_bytes=64 * 1024 * 1024):
         self.user_profile = os.path.expandvars('%UserProfile%')
-        self.game_save_dir = os.path.join(
+        self.game_save_dir = game_save_dir or os.path.join(
             self.user_profile,
             'AppData',
             'LocalLow',
             'GameCreatorNeko',
             'WomanCommunication'
         )
+        # Backups live next to the save dir, e.g. LocalLow/GameCreatorNeko
+        self.backup_root = os.path.dirname(self.game_save_dir)
+        self.backup_prefix = os.path.basename(self.game_save_dir)
         # self.checkpoints_dir = os.path.join(os.path.dirname(__file__), 'checkpoints')
-        self.checkpoints_dir = os.path.join(get_app_path(), 'checkpoints')
+        self.checkpoints_dir = checkpoints_dir or os.path.join(get_app_path(), 'checkpoints')
+        # copy_workers=None sizes the copy pool per operation, 1 copies serially.
+        self.engine = CopyEngine(workers=copy_workers)
+        store_dir = store_dir or os.path.join(self.backup_root, STORE_DIR_NAME)
+        self.hash_cache = HashCache(os.path.join(store_dir, 'hashcache.json'))
+        # storage_mode "delta" keeps changed files as deltas against the previous backup,
+        # compress_level 1-9 deflates new full blobs (0 stores them as-is)
+        self.store = ObjectStore(store_dir, self.engine, delta=(storage_mode == "delta"),
+                                 hash_cache=self.hash_cache, compress_level=compress_level)
+        if checkpoint_archives is None:
+            checkpoint_archives = default_checkpoint_archives()
+        self.checkpoint_archives = [open_checkpoint_archive(path, self.hash_cache) for path in checkpoint_archives]
+        # Retention runs in the background after each backup; pass retention=False to keep everything
+        self.retention = RetentionPolicy() if retention is None else retention
+        self.prune_thread = None
+        self.prune_error = None
+        # Checkpoint and recent backup contents preloaded while the menu waits; 0 turns it off
+        self.content_cache = ContentCache(preload_cache_bytes) if preload_cache_bytes else None
+        self.preload_thread = None
+        # The index is shared with the background prune thread
+        self.lock = self.store.lock
+        # "overlay" copies over the live save, "atomic" stages a copy and swaps it in with renames
+        self.swap_mode = swap_mode
+        self.swap_journal_path = os.path.join(store_dir, 'swap.json')
+        # Human-readable reasons for work skipped by the last operation
+        self.skipped = []
+        # quiet=True never touches the terminal UI (headless/scripted use)
+        self.quiet = quiet
+        self.last_error = None
+        self.last_snapshot_id = None
+        # Snapshot holding the save as of the last backup: the one written, or the identical one skip_duplicate found
+        self.last_backup_id = None
+        # Stats of the last copy into the save, including the strategy used per file
+        self.last_copy = None
+        # Plain bytes, stored bytes, ratio and throughput of the last backup or recover
+        self.last_transfer = None
+        # Wall time per phase (hash, backup, copy, swap, index, ...) accumulated across operations
+        self.timings = {}
+        self.index = BackupIndex(os.path.join(self.store.root, 'index.json'))
+        # Pinned checkpoint manifests and scrub results; verify_restores rereads every restored file
+        self.integrity = IntegrityLog(os.path.join(self.store.root, 'integrity.json'))
+        self.verify_restores = verify_restores
+        # Operation counters and latency histograms, exported for a Prometheus textfile collector
+        self.metrics = OperationMetrics(os.path.join(self.store.root, 'metrics.json'),
+                                        metrics_file or os.path.join(self.store.root, 'metrics.prom'),
+                                        self.game_save_dir)
+        # SimilarityIndex over the index's GAME_DATA fingerprints, built on first use
+        self.similarity = None
+        # Auto-snapshot watcher on the live save, see start_watcher
+        self.watcher = None
+        # BackupScheduler for throttled background backups, once start_scheduler() is called
+        self.scheduler = None
         self.ui = TerminalUI()
-        self.progress = ProgressDisplay(progress_steps, progress_interval)
+        self.progress = ProgressDisplay(progress_interval)
+        # Event subscribers (see Operation); the terminal UI is one of them unless quiet
+        self.listeners = [] if quiet else [lambda event: self.progress.handle(self.ui, event)]
+        # The Operation running right now, whose cancel() the copy callbacks honour
+        self.operation = None
+        self.operations = OperationQueue(self)
 
+    @traced
     def copy_with_progress(self, src_dir, dst_dir):
             """Copy directory contents with visual progress display"""
-            if not os.path.exists(dst_dir):
-                os.makedirs(dst_dir)
+            return self.run_plan_with_progress(CopyPlan.from_tree(src_dir, dst_dir))
 
-            # Start progress display
-            self.progress.start(self.ui, "正在初始化世界...")
+    @traced
+    def run_plan_with_progress(self, plan, message="正在初始化世界..."):
+            """Execute a CopyPlan, reporting real byte/file progress as events. Returns the copy stats."""
+            with self.copy_events(message, plan.total_bytes, len(plan.files)) as callback:
+                self.last_copy = self.engine.run(plan, callback)
+            return self.last_copy
 
-            # Start a thread to copy files
-            def copy_files():
-                shutil.copytree(src_dir, dst_dir, dirs_exist_ok=True)
-            
-            copy_thread = threading.Thread(target=copy_files)
-            copy_thread.start()
+    def submit(self, kind, subscribers=(), **options):
+        """Queue a backup/replace/recover as an Operation, e.g. submit('replace', checkpoint_name=...)"""
+        return self.operations.submit(kind, subscribers, **options)
 
-            # Update progress bar until copy is complete
-            while copy_thread.is_alive() and not self.progress.is_complete():
-                self.progress.update(self.ui, "正在初始化世界...")
-            
-            # Wait for copy to complete
-            copy_thread.join()
-            
-            # Ensure progress bar reaches 100%
-            while not self.progress.is_complete():
-                self.progress.update(self.ui, "正在初始化世界...")
-            
-            # Print final newline
-            print()
+    def emit(self, event_type, **fields):
+        if not self.listeners:
+            return
+        event = {'type': event_type, **fields}
+        for listener in list(self.listeners):
+            listener(event)
+
+    def check_cancelled(self):
+        operation = self.operation
+        if operation is not None and operation.cancelled():
+            raise OperationCancelled(operation.id)
+
+    @contextlib.contextmanager
+    def copy_events(self, message, total_bytes, total_files, visible=True):
+        """
+        Bracket a copy with 'copy' and 'copy_end' events and yield its progress callback,
+        or None when nobody listens. The callback raises OperationCancelled once the
+        running operation is cancelled.
+        """
+        callback = None
+        if self.listeners:
+            def callback(bytes_done, files_done):
+                self.check_cancelled()
+                self.emit('progress', bytes=bytes_done, files=files_done,
+                          total_bytes=total_bytes, total_files=total_files)
+
+        self.emit('copy', message=message, total_bytes=total_bytes, total_files=total_files, visible=visible)
+        start = time.perf_counter()
+        try:
+            yield callback
+        except BaseException:
+            self.emit('copy_end', aborted=True, seconds=time.perf_counter() - start)
+            raise
+        TRACER.add(bytes=total_bytes, files=total_files)
+        self.emit('copy_end', aborted=False, bytes=total_bytes, files=total_files,
+                  seconds=time.perf_counter() - start)
+
+    def say(self, message):
+        """Print a status line unless running headless"""
+        if not self.quiet:
+            print(f"{GREEN}{message}{RESET}")
+
+    def fail(self, message, silent=False):
+        """Report an error and keep it in self.last_error for scripted callers"""
+        self.last_error = message
+        if not silent:
+            self.say(message)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Add the wall time of a block to self.timings[name]"""
+        self.emit('phase', name=name, state='begin')
+        start = time.perf_counter()
+        try:
+            with TRACER.span(name):
+                yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            self.emit('phase', name=name, state='end', seconds=seconds)
+
+    def skip(self, reason):
+        """Record (and later report) a piece of work that was skipped"""
+        self.skipped.append(reason)
 
-    def backup_savedata(self, silent=False):
-        """Backup current savedata. If silent=True, don't show any messages."""
+    def report_skips(self):
+        for reason in self.skipped:
+            self.say(f"Skipped: {reason}")
+
+    @traced
+    def tree_digests(self, src_dir, sizes=None):
+        """
+        Map of relative path -> digest for a directory, read through the hash cache.
+        sizes, if given, is filled with relative path -> size.
+        """
+        if not os.path.isdir(src_dir):
+            return {}
+        _, files = scan_tree(src_dir)
+        if sizes is not None:
+            sizes.update((rel_path, size) for rel_path, _, size, _ in files)
+        digests = {rel_path: self.hash_cache.digest(path) for rel_path, path, _, _ in files}
+        self.hash_cache.save()
+        return digests
+
+    def remember_digests(self, digests):
+        """Record the digests of files just written into the live save so they are not reread"""
+        for rel_path, digest in digests.items():
+            path = os.path.join(self.game_save_dir, *rel_path.split('/'))
+            if os.path.isfile(path):
+                self.hash_cache.record(path, digest)
+        self.hash_cache.save()
+
+    def find_snapshot_with_content(self, content_hash):
+        """Newest indexed snapshot whose tree content hash equals content_hash, or None"""
+        self.refresh_index()
+        matches = [entry for entry in self.index.entries('snapshots').values()
+                   if entry['kind'] == 'snapshot' and entry['content_hash'] == content_hash]
+        if not matches:
+            return None
+        return max(matches, key=lambda entry: (entry['created'], entry['id']))['id']
+
+    @traced
+    @metered('backup')
+    def backup_savedata(self, silent=False, origin=None, skip_duplicate=False, throttle=None):
+        """
+        Backup current savedata. If silent=True, don't show any messages.
+        With skip_duplicate=True no snapshot is written when an identical one already exists.
+        throttle: a BackupThrottle pacing a background backup, which then copies on this thread only
+        The new snapshot id is kept in self.last_snapshot_id, and in self.last_backup_id
+        along with the id of an identical snapshot that made skip_duplicate skip the backup.
+        """
+        self.last_snapshot_id = None
+        self.last_backup_id = None
+        self.last_transfer = None
         if not os.path.exists(self.game_save_dir):
-            if not silent:
-                print(f"{GREEN}No savedata found to backup!{RESET}")
+            self.fail("No savedata found to backup!", silent)
             return False
         
         try:
-            timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-            backup_dir = f"{self.game_save_dir}-{timestamp}"
+            # Catch up with outside changes first so the incremental update below stays exact
+            with self.phase('index'):
+                self.refresh_index()
+            if skip_duplicate:
+                with self.phase('hash'):
+                    live = self.tree_digests(self.game_save_dir)
+                    existing = self.find_snapshot_with_content(tree_digest(live.items()))
+                if existing:
+                    self.skip(f"backup of the current save (identical to {existing})")
+                    self.last_backup_id = existing
+                    return True
+
+            snapshot_id = self.store.new_snapshot_id(self.backup_prefix)
+            origin = origin or "manual backup"
             
-            if silent:
-                # Just copy without progress display
-                shutil.copytree(self.game_save_dir, backup_dir)
-            else:
-                self.copy_with_progress(self.game_save_dir, backup_dir)
-                print(f"{GREEN}Successfully backed up savedata to: {backup_dir}{RESET}")
+            with self.phase('backup'):
+                tree = scan_tree(self.game_save_dir)
+                total_bytes = sum(size for _, _, size, _ in tree[1])
+                start = time.perf_counter()
+                # A silent backup still reports progress (and can be cancelled), it just isn't drawn
+                with self.copy_events("正在初始化世界...", total_bytes, len(tree[1]), visible=not silent) as callback:
+                    if throttle is not None:
+                        callback = throttle.wrap(callback)
+                    manifest = self.store.create_snapshot(self.game_save_dir, snapshot_id, origin=origin,
+                                                          tree=tree, callback=callback,
+                                                          workers=1 if throttle is not None else None)
+                transfer = self.record_transfer('backup', manifest['new_raw_bytes'], manifest['new_bytes'],
+                                                time.perf_counter() - start)
+                self.metrics.add(copied=manifest['new_raw_bytes'],
+                                 deduplicated=total_bytes - manifest['new_raw_bytes'])
+            with self.phase('index'):
+                self.index_snapshot(manifest)
+            self.last_snapshot_id = self.last_backup_id = snapshot_id
+            self.schedule_prune()
+            if not silent:
+                self.say(f"Successfully backed up savedata as: {snapshot_id}")
+                if self.store.compress_level and transfer['bytes']:
+                    self.say(self.describe_transfer(transfer))
             return True
         except Exception as e:
-            if not silent:
-                print(f"{GREEN}Error backing up savedata: {str(e)}{RESET}")
+            self.fail(f"Error backing up savedata: {str(e)}", silent)
             return False
 
-    def replace_savedata(self, checkpoint_name):
-        checkpoint_path = os.path.join(self.checkpoints_dir, checkpoint_name)
+    @traced
+    @metered('replace')
+    @synchronized
+    def replace_savedata(self, checkpoint_name, force=False):
+        checkpoint = self.find_checkpoint(checkpoint_name)
         
-        if not os.path.exists(checkpoint_path):
-            print(f"{GREEN}Checkpoint '{checkpoint_name}' not found!{RESET}")
+        if checkpoint is None:
+            self.fail(f"Checkpoint '{checkpoint_name}' not found!")
+            return False
+        if not force and self.integrity.is_corrupt('checkpoint', checkpoint_name):
+            self.fail(f"Checkpoint '{checkpoint_name}' failed verification; pass force to restore it anyway")
             return False
         
         try:
-            # Silently backup existing data
-            self.backup_savedata(silent=True)
-            
-            if not os.path.exists(self.game_save_dir):
-                os.makedirs(self.game_save_dir)
-            
-            self.copy_with_progress(checkpoint_path, self.game_save_dir)
-            print(f"{GREEN}Successfully replaced savedata with checkpoint: {checkpoint_name}{RESET}")
+            with self.phase('hash'):
+                incoming = checkpoint.digests()
+            copied = self.apply_incoming(incoming, checkpoint_name, checkpoint.plan,
+                                         origin=f"before replacing with {checkpoint_name}")
+            self.report_skips()
+            if copied:
+                self.say(f"Successfully replaced savedata with checkpoint: {checkpoint_name}")
+            else:
+                self.say(f"Savedata already matches checkpoint: {checkpoint_name}")
             return True
         except Exception as e:
-            print(f"{GREEN}Error replacing savedata: {str(e)}{RESET}")
+            self.fail(f"Error replacing savedata: {str(e)}")
             return False
 
-    def recover_savedata(self, backup_path):
-        if not os.path.exists(backup_path):
-            print(f"{GREEN}Backup directory not found: {backup_path}{RESET}")
+    @traced
+    @metered('recover')
+    @synchronized
+    def recover_savedata(self, backup_ref, force=False):
+        """
+        Recover savedata from a snapshot id in the store or a legacy backup directory.
+        Holds the lock throughout, like replace_savedata, so a prune started by the
+        pre-backup only runs once the source and the rollback target are no longer needed.
+        """
+        is_snapshot = self.store.has_snapshot(backup_ref)
+        if not is_snapshot and not os.path.isdir(backup_ref):
+            self.fail(f"Backup not found: {backup_ref}")
+            return False
+        if not force and is_snapshot and self.integrity.is_corrupt('snapshot', backup_ref):
+            self.fail(f"Backup {backup_ref} failed verification; pass force to restore it anyway")
             return False
         
+        self.last_transfer = None
         try:
-            # Silently backup existing data
-            self.backup_savedata(silent=True)
-            
-            if not os.path.exists(self.game_save_dir):
-                os.makedirs(self.game_save_dir)
-            
-            self.copy_with_progress(backup_path, self.game_save_dir)
-            print(f"{GREEN}Successfully recovered savedata from: {backup_path}{RESET}")
+            backup_name = os.path.basename(backup_ref)
+            if is_snapshot:
+                incoming = {entry['path']: entry['digest']
+                            for entry in self.store.load_snapshot(backup_ref)['files']}
+                plan_for = lambda dst_dir, skip: self.store.restore_plan(backup_ref, dst_dir, skip=skip)
+            else:
+                with self.phase('hash'):
+                    incoming = self.tree_digests(backup_ref)
+                plan_for = lambda dst_dir, skip: CopyPlan.from_tree(backup_ref, dst_dir, skip=skip)
+            copied = self.apply_incoming(incoming, backup_name, plan_for,
+                                         origin=f"before recovering {backup_name}")
+            self.report_skips()
+            if copied and is_snapshot:
+                transfer = self.record_transfer('recover', self.last_copy['bytes'],
+                                                self.stored_size(backup_ref, self.last_copy['bytes']),
+                                                self.last_copy['seconds'])
+                if self.store.compress_level or transfer['ratio'] < 1:
+                    self.say(self.describe_transfer(transfer))
+            if copied:
+                self.say(f"Successfully recovered savedata from: {backup_ref}")
+            else:
+                self.say(f"Savedata already matches backup: {backup_name}")
             return True
         except Exception as e:
-            print(f"{GREEN}Error recovering savedata: {str(e)}{RESET}")
+            self.fail(f"Error recovering savedata: {str(e)}")
             return False
 
-    def list_checkpoints(self):
-        checkpoints = []
+    def metric_gauges(self):
+        """Backup count and store size as last seen in memory, for the exported metrics"""
+        entries = self.index.data['snapshots'] if self.index.data is not None else None
+        refs = self.store.refs
+        return {'backups': len(entries) if entries is not None else None,
+                'store_bytes': refs['bytes'] if refs is not None else None}
+
+    def record_transfer(self, kind, plain_bytes, stored_bytes, seconds):
+        """Keep the ratio and throughput of a backup/recover in self.last_transfer and emit it"""
+        self.last_transfer = {
+            'kind': kind,
+            'bytes': plain_bytes,
+            'stored_bytes': stored_bytes,
+            'ratio': stored_bytes / plain_bytes if plain_bytes else 1.0,
+            'seconds': seconds,
+            'throughput': plain_bytes / seconds if seconds else None,
+        }
+        self.emit('transfer', **self.last_transfer)
+        return self.last_transfer
+
+    @staticmethod
+    def describe_transfer(transfer):
+        rate = f" at {format_bytes(transfer['throughput'])}/s" if transfer['throughput'] else ""
+        verb = "Stored" if transfer['kind'] == 'backup' else "Restored"
+        return (f"{verb} {format_bytes(transfer['bytes'])} as {format_bytes(transfer['stored_bytes'])} "
+                f"({transfer['ratio']:.0%}){rate}")
+
+    def stored_size(self, snapshot_id, plain_bytes):
+        """On-disk size of plain_bytes of a snapshot, scaled by the snapshot's overall stored/plain ratio"""
+        sizes = {entry['digest']: entry['size'] for entry in self.store.load_snapshot(snapshot_id)['files']}
+        plain = sum(sizes.values())
+        if not plain:
+            return plain_bytes
+        stored = sum(self.store.object_size(digest) for digest in sizes)
+        return round(plain_bytes * stored / plain)
+
+    @traced
+    def extract_file(self, snapshot_id, rel_path, dst_path):
+        """
+        Write one file of a backup to dst_path, streaming it out of the store
+        without restoring anything else. Returns the bytes written, or None.
+        The file is written next to dst_path and only renamed over it once it
+        matches its checksum, so a failed extract leaves an existing dst_path as it was.
+        """
+        if not self.store.has_snapshot(snapshot_id):
+            self.fail(f"Backup not found: {snapshot_id}")
+            return None
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        entry = next((entry for entry in self.store.load_snapshot(snapshot_id)['files']
+                      if entry['path'] == rel_path), None)
+        if entry is None:
+            self.fail(f"{rel_path} is not in backup {snapshot_id}")
+            return None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+            part_path = dst_path + '.part'
+            hasher = hashlib.sha256()
+            try:
+                with self.store.open_object(entry['digest']) as src:
+                    size = self.engine.copy_stream(src, part_path, hasher=hasher)
+                if hasher.hexdigest() != entry['digest']:
+                    raise ValueError("content does not match its checksum")
+                os.utime(part_path, (entry['mtime'], entry['mtime']))
+                os.replace(part_path, dst_path)
+            except BaseException:
+                # Never leave a truncated or wrong file behind
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            return size
+        except (OSError, ValueError, zlib.error) as e:
+            self.fail(f"Error extracting {rel_path}: {str(e)}")
+            return None
+
+    @traced
+    def apply_incoming(self, incoming, label, plan_for, origin):
+        """
+        Make the live save hold the incoming tree, backing up the current save first.
+        incoming: relative path -> digest of the tree being restored
+        plan_for: plan_for(dst_dir, skip) returns the CopyPlan that writes it into dst_dir
+        Returns False when nothing had to be copied.
+        """
+        if self.content_cache is not None:
+            source_plan = plan_for
+            plan_for = lambda dst_dir, skip: self.content_cache.apply(
+                source_plan(dst_dir, skip), dst_dir, incoming)
+        self.skipped = []
+        self.last_copy = None
+        live_sizes = {}
+        with self.phase('hash'):
+            live = self.tree_digests(self.game_save_dir, live_sizes)
+        atomic = self.swap_mode == "atomic"
+        unchanged = {path for path, digest in incoming.items() if live.get(path) == digest}
+        self.metrics.add(skipped=sum(live_sizes[path] for path in unchanged))
+        # An overlay only has to match the incoming files, a swap has to match exactly
+        identical = live == incoming if atomic else live and len(unchanged) == len(incoming)
+        if identical:
+            self.skip(f"copy of {label} (the current save already matches it)")
+            return False
+
+        if atomic:
+            with self.watcher_muted():
+                self.staged_swap(plan_for, origin, incoming)
+        else:
+            # Silently backup existing data; it is also what a failed copy rolls back to
+            existed = os.path.isdir(self.game_save_dir)
+            if not self.backup_savedata(silent=True, origin=origin, skip_duplicate=True) and existed:
+                raise OSError(f"could not back up the current save first ({self.last_error})")
+            # The backup just taken (or matched), not a lookup by the earlier hash: the game may
+            # have written in between. Without it a failed copy could not be undone, so don't start.
+            prior = self.last_backup_id
+            if existed and prior is None:
+                raise OSError("no backup of the current save to roll back to")
+            
+            with self.watcher_muted():
+                try:
+                    if not os.path.exists(self.game_save_dir):
+                        os.makedirs(self.game_save_dir)
+
+                    if unchanged:
+                        self.skip(f"{len(unchanged)} file(s) already identical in the current save")
+                    with self.phase('copy'):
+                        self.run_plan_with_progress(plan_for(self.game_save_dir, unchanged))
+                    self.read_back(self.game_save_dir, incoming, skip=unchanged)
+                except BaseException:
+                    self.roll_back(prior)
+                    raise
+        self.metrics.add(copied=self.last_copy['bytes'] if self.last_copy else 0)
+        with self.phase('hash'):
+            self.remember_digests(incoming)
+        return True
+
+    @traced
+    def roll_back(self, snapshot_id):
+        """
+        Put the live save back exactly as snapshot_id recorded it, after a copy over it
+        failed or was cancelled: files and dirs it lacks are removed, changed files are
+        rewritten and mtimes restored. snapshot_id None means there was no live save
+        and the copy created the dir, so it is removed; apply_incoming never passes None
+        when a save existed.
+        """
+        self.emit('rollback', snapshot=snapshot_id)
+        with self.phase('rollback'):
+            if snapshot_id is None:
+                if os.path.exists(self.game_save_dir):
+                    shutil.rmtree(self.game_save_dir)
+                return
+            manifest = self.store.load_snapshot(snapshot_id)
+            wanted = {entry['path']: entry for entry in manifest['files']}
+            wanted_dirs = set(manifest['dirs'])
+            dirs, files = scan_tree(self.game_save_dir)
+            unchanged = set()
+            for rel_path, path, _, mtime in files:
+                entry = wanted.get(rel_path)
+                if entry is None:
+                    os.remove(path)
+                elif self.hash_cache.digest(path) == entry['digest']:
+                    unchanged.add(rel_path)
+                    if entry.get('mtime') is not None and mtime != entry['mtime']:
+                        os.utime(path, (entry['mtime'], entry['mtime']))
+            # Deepest first, so a dir is empty by the time it is removed
+            for rel_dir in reversed(dirs):
+                if rel_dir not in wanted_dirs:
+                    os.rmdir(os.path.join(self.game_save_dir, *rel_dir.split('/')))
+            self.hash_cache.save()
+            # No progress callback: a rollback itself is never cancelled
+            self.engine.run(self.store.restore_plan(snapshot_id, self.game_save_dir, skip=unchanged))
+
+    @traced
+    def read_back(self, dst_dir, digests, skip=()):
+        """
+        Reread the files just restored into dst_dir and compare them with the digests
+        they were restored from, so a damaged source or a short write never passes as
+        a good restore. Raises OSError naming the mismatches.
+        """
+        if not self.verify_restores:
+            return
+        items = []
+        for rel_path, digest in digests.items():
+            if rel_path in skip:
+                continue
+            path = os.path.join(dst_dir, *rel_path.split('/'))
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            items.append((size, (rel_path, path, digest)))
+        bad = []
+
+        def check(item):
+            rel_path, path, digest = item
+            try:
+                ok = hash_file(path) == digest
+            except OSError:
+                ok = False
+            if not ok:
+                bad.append(rel_path)
+
+        with self.phase('verify'):
+            self.engine.run_tasks(self.engine.batches(items), check)
+        if bad:
+            raise OSError(f"read-back verification failed for {len(bad)} file(s): {', '.join(sorted(bad)[:5])}")
+
+    def pin_checkpoint(self, checkpoint):
+        """The checkpoint's pinned checksum manifest, pinning its current content the first time"""
+        pinned = self.integrity.pinned(checkpoint.name)
+        if pinned is None:
+            pinned = checkpoint.checksum_manifest()
+            if pinned is not None:
+                self.integrity.pin(checkpoint.name, pinned)
+        return pinned
+
+    @traced
+    def scrub(self, backups=True, checkpoints=True):
+        """
+        Verify snapshots and checkpoints against their checksum manifests, rereading
+        everything from disk on the copy pool. An object shared by several snapshots is
+        checked once and files are streamed, so memory stays bounded. Returns
+        {'backups': {id: result}, 'checkpoints': {name: result}} with IntegrityLog results.
+        """
+        results = {'backups': {}, 'checkpoints': {}}
+        with self.phase('verify'):
+            if backups:
+                manifests = {}
+                problems = {}
+                for snapshot_id in sorted(self.store.list_snapshots()):
+                    try:
+                        manifests[snapshot_id] = self.store.load_snapshot(snapshot_id)
+                    except (OSError, ValueError):
+                        problems[snapshot_id] = ["manifest: unreadable"]
+                sizes = {entry['digest']: entry['size']
+                         for manifest in manifests.values() for entry in manifest['files']}
+                good = {}
+
+                def check_object(digest):
+                    good[digest] = self.store.check_object(digest, sizes[digest])
+
+                self.engine.run_tasks(self.engine.batches([(size, digest) for digest, size in sizes.items()]),
+                                      check_object)
+                for snapshot_id, manifest in manifests.items():
+                    problems[snapshot_id] = [f"{entry['path']}: stored object missing or damaged"
+                                             for entry in manifest['files'] if not good[entry['digest']]]
+                for snapshot_id in sorted(problems):
+                    results['backups'][snapshot_id] = self.integrity.record('snapshot', snapshot_id,
+                                                                            problems[snapshot_id])
+
+            if checkpoints:
+                sources = self.checkpoint_sources()
+                problems = {name: [] for name in sources}
+                items = [(size, (name, check)) for name, checkpoint in sources.items()
+                         for size, check in checkpoint.scrub_items(self.pin_checkpoint(checkpoint))]
+
+                def check_file(item):
+                    name, check = item
+                    problem = check()
+                    if problem:
+                        problems[name].append(problem)
+
+                self.engine.run_tasks(self.engine.batches(items), check_file)
+                for name in sorted(problems):
+                    results['checkpoints'][name] = self.integrity.record('checkpoint', name,
+                                                                         sorted(problems[name]))
+            self.integrity.save()
+        return results
+
+    def start_watcher(self, **options):
+        """Snapshot the live save automatically when the game writes it. Returns the change source name."""
+        self.stop_watcher()
+        self.watcher = SaveWatcher(self, **options)
+        return self.watcher.start()
+
+    def stop_watcher(self, wait=True):
+        if self.watcher is not None:
+            self.watcher.stop(wait)
+            self.watcher = None
+
+    def start_scheduler(self, **options):
+        """Run periodic and deferred backups in the background, throttled; the watcher hands its snapshots to it"""
+        self.stop_scheduler()
+        self.scheduler = BackupScheduler(self, **options)
+        self.scheduler.start()
+        return self.scheduler
+
+    def stop_scheduler(self, wait=True):
+        if self.scheduler is not None:
+            self.scheduler.stop(wait)
+            self.scheduler = None
+
+    def watcher_muted(self):
+        """Keep the watcher from snapshotting our own restores into the live save"""
+        return self.watcher.mute() if self.watcher else contextlib.nullcontext()
+
+    def swap_paths(self):
+        """(staging, parked) siblings of the live save, always on its filesystem"""
+        return f"{self.game_save_dir}.staging", f"{self.game_save_dir}.parked"
+
+    def write_swap_journal(self, journal):
+        os.makedirs(self.store.root, exist_ok=True)
+        write_json_atomic(self.swap_journal_path, journal)
+
+    @traced
+    def staged_swap(self, plan_for, origin, incoming=None):
+        """
+        Replace the live save without ever leaving it half-written:
+        stage the incoming tree in a sibling dir, rename the live dir aside as the
+        pre-backup, rename the staged dir into place, then move the parked files
+        into the store. Every step is journaled for recover_interrupted_swap.
+        The parked dir is hashed after the rename, not before staging, since the
+        game may have written the save in between.
+        """
+        staging, parked = self.swap_paths()
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        try:
+            with self.phase('copy'):
+                self.run_plan_with_progress(plan_for(staging, ()))
+            if incoming is not None:
+                self.read_back(staging, incoming)
+        except BaseException:
+            # The live save was never touched: dropping the partial copy is the whole rollback
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # Until the parked dir is hashed, a recovery keeps it and hashes it itself
+        journal = {
+            'phase': 'staged',
+            'live': self.game_save_dir,
+            'staging': staging,
+            'parked': parked,
+            'keep_parked': True,
+            'snapshot_id': self.store.new_snapshot_id(self.backup_prefix),
+            'origin': origin,
+            'digests': {},
+        }
+        self.write_swap_journal(journal)
+
+        try:
+            with self.phase('swap'):
+                if os.path.exists(self.game_save_dir):
+                    os.rename(self.game_save_dir, parked)
+                    with self.phase('hash'):
+                        parked_digests = self.tree_digests(parked)
+                    existing = None
+                    if parked_digests:
+                        existing = self.find_snapshot_with_content(tree_digest(parked_digests.items()))
+                        if existing:
+                            self.skip(f"backup of the current save (identical to {existing})")
+                    journal.update(phase='parked', keep_parked=existing is None, digests=parked_digests)
+                    self.write_swap_journal(journal)
+                os.rename(staging, self.game_save_dir)
+        except OSError:
+            # Put the old save back and drop the staged copy
+            if os.path.exists(parked) and not os.path.exists(self.game_save_dir):
+                os.rename(parked, self.game_save_dir)
+            shutil.rmtree(staging, ignore_errors=True)
+            os.remove(self.swap_journal_path)
+            raise
+        journal['phase'] = 'swapped'
+        self.write_swap_journal(journal)
+        with self.phase('backup'):
+            self.finish_swap(journal)
+
+    def finish_swap(self, journal):
+        """Turn the parked live dir into a snapshot (or drop it if it duplicates one) and close the journal"""
+        parked = journal['parked']
+        if os.path.exists(parked):
+            if journal['keep_parked']:
+                self.refresh_index()
+                manifest = self.store.ingest_tree(parked, journal['snapshot_id'], journal['digests'],
+                                                  origin=journal['origin'])
+                self.index_snapshot(manifest)
+                self.schedule_prune()
+            else:
+                shutil.rmtree(parked)
+        if os.path.exists(self.swap_journal_path):
+            os.remove(self.swap_journal_path)
+
+    def recover_interrupted_swap(self):
+        """
+        Finish or roll back a swap that was interrupted, e.g. by a crash or power loss.
+        Returns a short description of what was done, or None when there was nothing to do.
+        """
+        staging, parked = self.swap_paths()
+        try:
+            with open(self.swap_journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            journal = None
+
+        if journal is None:
+            # Leftovers without a journal: never drop a parked save, only a staged copy
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            if not os.path.exists(parked):
+                return None
+            journal = {
+                'parked': parked,
+                'keep_parked': True,
+                'snapshot_id': self.store.new_snapshot_id(self.backup_prefix),
+                'origin': "recovered after an interrupted swap",
+                'digests': {},
+            }
+            self.finish_swap(journal)
+            return "kept a parked save from an interrupted swap as a backup"
+
+        if not os.path.exists(self.game_save_dir) and os.path.exists(staging):
+            # The staged tree was complete before the live dir was moved aside
+            os.rename(staging, self.game_save_dir)
+            self.finish_swap(journal)
+            return "finished an interrupted swap"
+        if journal['phase'] == 'staged':
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            os.remove(self.swap_journal_path)
+            return "rolled back an interrupted swap"
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        self.finish_swap(journal)
+        return "finished an interrupted swap"
+
+    def index_dirs(self):
+        """Directories whose mtime tells the index it may have drifted"""
+        dirs = {
+            'snapshots': self.store.snapshots_dir,
+            'checkpoints': self.checkpoints_dir,
+            'backup_root': self.backup_root,
+        }
+        for archive in self.checkpoint_archives:
+            dirs[f"archive:{archive.path}"] = archive.path
+        return dirs
+
+    @traced
+    @synchronized
+    def refresh_index(self):
+        """Load the index once and self-heal with a rescan when it is missing or has drifted"""
+        if self.index.data is None and not self.index.load():
+            self.rescan_index()
+        elif self.index.is_stale(self.index_dirs()):
+            self.rescan_index()
+
+    @synchronized
+    def rescan_index(self):
+        """Rebuild the index from the store manifests, legacy folders and checkpoints"""
+        old_checkpoints = self.index.entries('checkpoints')
+        self.index.data['snapshots'] = {}
+        self.index.data['checkpoints'] = {}
+        for snapshot_id in self.store.list_snapshots():
+            try:
+                self.index.put('snapshots', BackupIndex.snapshot_entry(self.store.load_snapshot(snapshot_id)))
+            except (OSError, ValueError, KeyError):
+                # A half-written or damaged manifest is not offered for recovery
+                continue
+        for backup_dir in self.list_legacy_backups():
+            self.index.put('snapshots', BackupIndex.tree_entry(
+                os.path.basename(backup_dir), 'legacy', backup_dir, "legacy backup folder", self.hash_cache))
+        for name, checkpoint in self.checkpoint_sources().items():
+            self.pin_checkpoint(checkpoint)
+            entry = BackupIndex.checkpoint_entry(checkpoint)
+            # Keep fields other features attached to an unchanged checkpoint
+            old = old_checkpoints.get(name)
+            if old and old.get('content_hash') == entry['content_hash']:
+                entry = {**old, **entry}
+            self.index.put('checkpoints', entry)
+        # Fingerprints are per content, so they survive a rescan while something still uses them
+        in_use = {entry.get('game_data') for section in ('snapshots', 'checkpoints')
+                  for entry in self.index.entries(section).values()}
+        fingerprints = self.index.data.setdefault('fingerprints', {})
+        for digest in set(fingerprints) - in_use:
+            del fingerprints[digest]
+        # Backups deleted outside the manager must not leave a result a new backup could inherit
+        self.integrity.forget_missing('snapshot', self.index.entries('snapshots'))
+        self.integrity.forget_missing('checkpoint', self.index.entries('checkpoints'))
+        self.save_index()
+        self.integrity.save()
+
+    def checkpoint_sources(self):
+        """
+        Every available checkpoint by name. Folders under checkpoints/ win over
+        zip members of the same name; zips are only read through their central directory.
+        """
+        sources = {}
+        for archive in self.checkpoint_archives:
+            try:
+                sources.update(archive.load())
+            except OSError as e:
+                self.fail(f"Error reading checkpoint archive {archive.path}: {str(e)}")
         if os.path.exists(self.checkpoints_dir):
-            checkpoints = [d for d in os.listdir(self.checkpoints_dir) 
-                         if os.path.isdir(os.path.join(self.checkpoints_dir, d))]
-            checkpoints.sort()
-        return checkpoints
+            for name in os.listdir(self.checkpoints_dir):
+                path = os.path.join(self.checkpoints_dir, name)
+                if os.path.isdir(path):
+                    sources[name] = DirCheckpoint(name, path, self.hash_cache)
+        return sources
+
+    def find_checkpoint(self, checkpoint_name):
+        """Resolve a checkpoint name to its source, or None"""
+        path = os.path.join(self.checkpoints_dir, checkpoint_name)
+        if os.path.isdir(path):
+            return DirCheckpoint(checkpoint_name, path, self.hash_cache)
+        return self.checkpoint_sources().get(checkpoint_name)
+
+    def save_index(self):
+        # Entries changed, so the similarity buckets are rebuilt on next use
+        self.similarity = None
+        self.index.record_mtimes(self.index_dirs())
+        self.index.save()
+        self.hash_cache.save()
+
+    @synchronized
+    def index_snapshot(self, manifest):
+        """Add a freshly written snapshot to the index without rescanning"""
+        self.index.put('snapshots', BackupIndex.snapshot_entry(manifest))
+        self.save_index()
+        # A new snapshot reusing a deleted one's id starts unscrubbed
+        if self.integrity.forget('snapshot', manifest['id']):
+            self.integrity.save()
+
+    @traced
+    @synchronized
+    def prune_backups(self, dry_run=False):
+        """
+        Apply the retention policy. Returns [(id, reason, bytes freed)]; with
+        dry_run=True nothing is deleted and the byte counts are estimates.
+        """
+        if not self.retention:
+            return []
+        self.refresh_index()
+        entries = [entry for entry in self.index.entries('snapshots').values() if entry['kind'] == 'snapshot']
+        planned = self.retention.plan(entries, datetime.now(), self.store)
+        if dry_run:
+            return planned
+        pruned = []
+        for snapshot_id, reason, _ in planned:
+            freed = self.store.delete_snapshot(snapshot_id)
+            self.index.remove('snapshots', snapshot_id)
+            self.integrity.forget('snapshot', snapshot_id)
+            pruned.append((snapshot_id, reason, freed))
+        if pruned:
+            self.save_index()
+            self.integrity.save()
+        return pruned
+
+    def schedule_prune(self):
+        """Prune in a background thread unless one is already running"""
+        if not self.retention or (self.prune_thread and self.prune_thread.is_alive()):
+            return
+        self.prune_thread = threading.Thread(target=self._background_prune, name="prune")
+        self.prune_thread.start()
+
+    def start_preload(self, recent_backups=3):
+        """
+        Load the checkpoints and the newest backups into the content cache in a
+        background thread (unless one is still running), so the next replace or
+        recover writes from memory. Best effort: anything unreadable is skipped.
+        """
+        if self.content_cache is None or (self.preload_thread and self.preload_thread.is_alive()):
+            return
+        self.preload_thread = threading.Thread(target=self.preload, args=(recent_backups,),
+                                               name="preload", daemon=True)
+        self.preload_thread.start()
+
+    @traced
+    def preload(self, recent_backups=3):
+        """Fill the content cache, checkpoints first. Returns the number of files loaded."""
+        cache = self.content_cache
+        loaded = 0
 
+        def load(digest, size, opener):
+            nonlocal loaded
+            if digest is None or digest in cache or not cache.wants(size):
+                return
+            with opener() as stream:
+                data = stream.read()
+            # A file that changed since it was hashed must not be served under the old digest
+            if hashlib.sha256(data).hexdigest() == digest:
+                cache.put(digest, data)
+                loaded += 1
+
+        try:
+            checkpoints = list(self.checkpoint_sources().values())
+        except OSError:
+            checkpoints = []
+        for checkpoint in checkpoints:
+            try:
+                digests = checkpoint.digests()
+                for rel_path, size, _, opener in checkpoint.layout()[1]:
+                    load(digests.get(rel_path), size, opener)
+            except (OSError, ValueError, KeyError, zlib.error):
+                continue
+        try:
+            snapshots = sorted((entry for entry in list(self.index.entries('snapshots').values())
+                                if entry['kind'] == 'snapshot'),
+                               key=lambda entry: (entry['created'], entry['id']), reverse=True)
+        except (OSError, ValueError, RuntimeError):
+            snapshots = []
+        for entry in snapshots[:recent_backups]:
+            try:
+                for file in self.store.load_snapshot(entry['id'])['files']:
+                    load(file['digest'], file['size'], lambda digest=file['digest']: self.store.open_object(digest))
+            except (OSError, ValueError, KeyError, zlib.error):
+                continue
+        return loaded
+
+    def _background_prune(self):
+        try:
+            self.prune_backups()
+            self.prune_error = None
+        except Exception as e:
+            self.prune_error = e
+
+    @synchronized
+    def pin_backup(self, snapshot_id, pinned=True):
+        """Protect a backup from retention (or release it)"""
+        manifest = self.store.set_pinned(snapshot_id, pinned)
+        self.refresh_index()
+        self.index.put('snapshots', BackupIndex.snapshot_entry(manifest))
+        self.save_index()
+
+    def game_data_bytes(self, entry):
+        """GAME_DATA content of an index entry"""
+        if entry['kind'] == 'snapshot':
+            return self.store.read_object(entry['game_data'])
+        if entry['kind'] == 'checkpoint':
+            checkpoint = self.find_checkpoint(entry['id'])
+            if checkpoint is None:
+                raise FileNotFoundError(f"Checkpoint '{entry['id']}' not found")
+            return checkpoint.read(SIMILARITY_FILE)
+        with open(os.path.join(entry['ref'], SIMILARITY_FILE), 'rb') as f:
+            return f.read()
+
+    def fingerprint(self, digest, load):
+        """{'size', 'minhash'} of some GAME_DATA content, computed once per digest and kept in the index"""
+        fingerprints = self.index.data.setdefault('fingerprints', {})
+        if digest not in fingerprints:
+            data = load()
+            fingerprints[digest] = {'size': len(data), 'minhash': minhash_signature(data)}
+        return fingerprints[digest]
+
+    @synchronized
+    def similarity_index(self):
+        """SimilarityIndex of every checkpoint and backup, fingerprinting new content first"""
+        self.refresh_index()
+        if self.similarity is not None:
+            return self.similarity
+        known = len(self.index.data.setdefault('fingerprints', {}))
+        similarity = SimilarityIndex()
+        for section, kind in (('checkpoints', 'checkpoint'), ('snapshots', 'backup')):
+            for entry in self.index.entries(section).values():
+                digest = entry.get('game_data')
+                if not digest:
+                    continue
+                try:
+                    fingerprint = self.fingerprint(digest, lambda entry=entry: self.game_data_bytes(entry))
+                except (OSError, ValueError, zlib.error):
+                    continue
+                similarity.add(digest, fingerprint['minhash'], fingerprint['size'], (kind, entry['id']))
+        if len(self.index.data['fingerprints']) != known:
+            self.save_index()
+        self.similarity = similarity
+        return similarity
+
+    def find_similar(self, ref=None, limit=5):
+        """
+        Nearest checkpoints and backups to a backup id, checkpoint name or (ref=None)
+        the live save, plus its inferred chapter. None when there is no GAME_DATA to compare.
+        """
+        similarity = self.similarity_index()
+        if ref is None:
+            path = os.path.join(self.game_save_dir, SIMILARITY_FILE)
+            if not os.path.isfile(path):
+                return None
+            digest = self.hash_cache.digest(path)
+
+            def load():
+                with open(path, 'rb') as f:
+                    return f.read()
+        else:
+            entry = self.index.entries('snapshots').get(ref) or self.index.entries('checkpoints').get(ref)
+            if entry is None or not entry.get('game_data'):
+                return None
+            digest = entry['game_data']
+            load = lambda: self.game_data_bytes(entry)
+        fingerprint = self.fingerprint(digest, load)
+        return {
+            'neighbors': similarity.query(fingerprint['minhash'], limit, exclude={ref}),
+            'chapter': similarity.infer_chapter(fingerprint['minhash'], fingerprint['size']),
+        }
+
+    def backup_chapters(self):
+        """Backup id -> inferred chapter (see SimilarityIndex.infer_chapter)"""
+        similarity = self.similarity_index()
+        fingerprints = self.index.data['fingerprints']
+        chapters = {}
+        for entry in self.index.entries('snapshots').values():
+            fingerprint = fingerprints.get(entry.get('game_data'))
+            if fingerprint:
+                chapters[entry['id']] = similarity.infer_chapter(fingerprint['minhash'], fingerprint['size'])
+        return chapters
+
+    @traced
+    def list_checkpoints(self):
+        self.refresh_index()
+        return sorted(self.index.entries('checkpoints'))
+
+    def list_legacy_backups(self):
+        """Timestamped `WomanCommunication-*` copy folders made before the object store existed"""
+        if not os.path.isdir(self.backup_root):
+            return []
+        prefix = f"{self.backup_prefix}-"
+        candidates = (os.path.join(self.backup_root, name) for name in os.listdir(self.backup_root)
+                      if name.startswith(prefix))
+        return [b for b in candidates if os.path.isdir(b)]
+
+    @traced
+    @synchronized
     def list_backups(self):
-        backup_pattern = os.path.join(
-            self.user_profile,
-            'AppData',
-            'LocalLow',
-            'GameCreatorNeko',
-            'WomanCommunication-*'
-        )
-        backups = glob.glob(backup_pattern)
-        return sorted([(os.path.basename(b), b) for b in backups], reverse=True)
+        """Return (name, ref) pairs, newest first. ref is passed to recover_savedata."""
+        self.refresh_index()
+        # Copied under the lock: a background prune removes entries while holding it
+        entries = sorted(list(self.index.entries('snapshots').values()),
+                         key=lambda entry: (entry['created'], entry['id']), reverse=True)
+        return [(entry['id'], entry['ref']) for entry in entries]
+
+    def migrate_legacy_backups(self):
+        """
+        Fold legacy backup folders into the object store.
+        A folder is only deleted after its manifest is written and every blob verifies.
+        Returns the number of folders migrated.
+        """
+        migrated = 0
+        legacy_backups = sorted(self.list_legacy_backups())
+        if legacy_backups:
+            self.refresh_index()
+        for backup_dir in legacy_backups:
+            snapshot_id = os.path.basename(backup_dir)
+            try:
+                if not self.store.has_snapshot(snapshot_id):
+                    import re
+                    match = re.search(r'-(\d{8}-\d{6})$', snapshot_id)
+                    if match:
+                        created = datetime.strptime(match.group(1), '%Y%m%d-%H%M%S')
+                    else:
+                        created = datetime.fromtimestamp(os.path.getmtime(backup_dir))
+                    self.store.create_snapshot(backup_dir, snapshot_id,
+                                               origin="migrated from legacy backup folder",
+                                               created=created)
+                if self.store.verify_snapshot(snapshot_id):
+                    shutil.rmtree(backup_dir)
+                    self.index_snapshot(self.store.load_snapshot(snapshot_id))
+                    migrated += 1
+            except Exception as e:
+                self.fail(f"Error migrating backup {backup_dir}: {str(e)}")
+        return migrated
     
 
+# Exit codes of the scripted command line
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+
+# Default store folder, created next to the save dir
+STORE_DIR_NAME = 'SavedataManager'
+
+# Save roots for the fleet-* commands, as os.pathsep-separated paths or glob patterns
+SAVE_ROOTS_ENV = 'SAVEDATA_MANAGER_ROOTS'
+FLEET_ACTIONS = ('backup', 'replace', 'verify')
+
+def is_store_path(path):
+    """Whether path is a backup store or inside one, so a glob never picks a store up as a save root"""
+    while True:
+        if ObjectStore.is_store(path):
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+def expand_save_roots(patterns):
+    """
+    Existing save dirs matched by paths or glob patterns, in order and without duplicates.
+    Backup stores matched by a glob are left out.
+    """
+    import glob  # only the fleet commands need it
+    roots = []
+    seen = set()
+    for pattern in patterns:
+        pattern = os.path.expanduser(os.path.expandvars(pattern))
+        magic = glob.has_magic(pattern)
+        for path in sorted(glob.glob(pattern)) if magic else [pattern]:
+            path = os.path.abspath(path)
+            key = os.path.normcase(path)
+            if not os.path.isdir(path) or key in seen or (magic and is_store_path(path)):
+                continue
+            seen.add(key)
+            roots.append(path)
+    return roots
+
+def fleet_root_key(root):
+    """A file name for a root: its basename plus a hash of its full path"""
+    key = hashlib.sha256(os.path.normcase(root).encode('utf-8')).hexdigest()[:12]
+    return f"{os.path.basename(root)}-{key}"
+
+def fleet_store_dir(store_parent, root):
+    """
+    A root's store: by default the one the menu uses for it (SavedataManager next to
+    the root), or a per-root folder inside store_parent when one is given.
+    """
+    if store_parent is None:
+        return os.path.join(os.path.dirname(root), STORE_DIR_NAME)
+    return os.path.join(store_parent, fleet_root_key(root))
+
+def check_fleet_stores(roots, store_parent=None):
+    """Raise ValueError when two roots would share a store, or a store would sit inside a root"""
+    owners = {}
+    for root in roots:
+        store_dir = os.path.normcase(os.path.abspath(fleet_store_dir(store_parent, root)))
+        if store_dir in owners:
+            raise ValueError(f"{owners[store_dir]} and {root} resolve to the same backup store {store_dir}; "
+                             "pass --store-dir to give each root its own store")
+        owners[store_dir] = root
+    for store_dir, owner in owners.items():
+        for root in roots:
+            root_key = os.path.normcase(root)
+            try:
+                inside = os.path.commonpath([store_dir, root_key]) == root_key
+            except ValueError:
+                inside = False  # different drives
+            if inside:
+                raise ValueError(f"the backup store of {owner} would be inside save root {root}")
+
+def fleet_task(root, action, target=None, settings=None):
+    """
+    Run one action against one save root with its own manager. Module level and
+    returning a plain dict, so it works on a process pool as well as a thread pool.
+    """
+    settings = dict(settings or {})
+    store_dir = fleet_store_dir(settings.pop('store_parent', None), root)
+    metrics_dir = settings.pop('metrics_dir', None)
+    if metrics_dir:
+        # One textfile per root in a shared collector dir, named like its store
+        settings['metrics_file'] = os.path.join(metrics_dir, fleet_root_key(root) + '.prom')
+    start = time.perf_counter()
+    summary = {'root': root, 'action': action, 'ok': False, 'error': None}
+    try:
+        manager = SaveDataManager(game_save_dir=root, store_dir=store_dir, quiet=True, **settings)
+        summary['swap_recovery'] = manager.recover_interrupted_swap()
+        if action == 'backup':
+            ok = manager.backup_savedata(origin=target or "fleet backup")
+            summary['backup_id'] = manager.last_snapshot_id
+            summary['transfer'] = manager.last_transfer
+        elif action == 'replace':
+            ok = manager.replace_savedata(target)
+            summary['copied_files'] = manager.last_copy['files'] if manager.last_copy else 0
+        else:
+            # Every stored backup must still read back to its digests
+            results = manager.scrub(checkpoints=False)['backups']
+            corrupt = [snapshot_id for snapshot_id, result in results.items() if result['state'] == 'corrupt']
+            live = manager.tree_digests(root)
+            summary.update(snapshots=len(results), corrupt=corrupt,
+                           live_backup=manager.find_snapshot_with_content(tree_digest(live.items())))
+            ok = not corrupt
+            if corrupt:
+                manager.fail(f"{len(corrupt)} corrupt backup(s)")
+        summary['ok'] = ok
+        summary['error'] = None if ok else manager.last_error
+        summary['skipped'] = manager.skipped
+        summary['timings'] = {name: round(seconds, 6) for name, seconds in manager.timings.items()}
+    except Exception as e:
+        summary['error'] = str(e)
+    else:
+        # A process pool worker may exit without waiting for the background write
+        manager.metrics.flush()
+    summary['seconds'] = round(time.perf_counter() - start, 6)
+    return summary
+
+def run_fleet(roots, action, target=None, settings=None, jobs=None, processes=False):
+    """
+    Run an action against every root in parallel, at most `jobs` at a time, so the
+    whole fleet takes about as long as its slowest root. Returns the per-root
+    summaries in root order.
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    if action not in FLEET_ACTIONS:
+        raise ValueError(f"unknown fleet action: {action}")
+    if not roots:
+        return []
+    check_fleet_stores(roots, (settings or {}).get('store_parent'))
+    # Mostly disk-bound, so threads default to ThreadPoolExecutor's sizing; processes to one per CPU
+    default_jobs = (os.cpu_count() or 1) + (0 if processes else 4)
+    jobs = max(1, min(jobs or default_jobs, len(roots)))
+    settings = dict(settings or {})
+    if settings.get('copy_workers') is None:
+        # Share the default copy pool size between the roots running at once
+        settings['copy_workers'] = max(1, ((os.cpu_count() or 1) + 4) // jobs)
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=jobs) as pool:
+        futures = [pool.submit(fleet_task, root, action, target, settings) for root in roots]
+        return [future.result() for future in futures]
+
+def build_arg_parser():
+    """Argument parser for the headless command line"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='savedata_manager',
+        description="Game savedata manager. Run without arguments for the interactive menu; "
+                    "subcommands run headless and print one JSON result.")
+    parser.add_argument('--save-dir', help="live save directory (default: the game's LocalLow folder)")
+    parser.add_argument('--save-root', action='append', dest='save_roots', metavar='PATH_OR_GLOB',
+                        help="save dir for the fleet-* commands, may be repeated and use globs "
+                             f"(default: ${SAVE_ROOTS_ENV}, {os.pathsep}-separated)")
+    parser.add_argument('--checkpoints-dir', help="checkpoint folder (default: ./checkpoints)")
+    parser.add_argument('--checkpoint-archive', action='append', dest='checkpoint_archives', metavar='ZIP',
+                        help="checkpoint zip or .wcpack, may be repeated (default: both next to this program)")
+    parser.add_argument('--store-dir', help="backup store directory (default: next to the save directory); "
+                                             "for fleet-* the parent of one store per root, needed when "
+                                             "roots share a parent directory")
+    parser.add_argument('--storage-mode', choices=['delta', 'full'], default='delta')
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=0, metavar='0-9',
+                        help="deflate new backup objects at this zlib level (default 0: store as-is)")
+    parser.add_argument('--atomic', action='store_true', help="replace/recover with a staged atomic swap")
+    parser.add_argument('--no-retention', action='store_true', help="never prune old backups")
+    parser.add_argument('--workers', type=int, help="parallel copy workers (default: auto, 1 = serial)")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="where to export operation metrics in the Prometheus text format "
+                             "(default: metrics.prom in the store); for fleet-* a collector dir "
+                             "that gets one .prom file per root")
+    parser.add_argument('--no-read-back', action='store_true',
+                        help="don't reread restored files to check them against their checksums")
+    parser.add_argument('--events', action='store_true',
+                        help="stream backup/replace/recover progress events to stderr as JSON lines")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="trace the command: per-phase time, bytes, files and file-system calls, written "
+                             "as Chrome trace JSON (chrome://tracing, Perfetto), or a cProfile dump if PATH "
+                             "ends in .prof/.pstats")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup = subparsers.add_parser('backup', help="back up the live save")
+    backup.add_argument('--origin', help="note stored with the backup")
+    replace = subparsers.add_parser('replace', help="replace the live save with a checkpoint")
+    replace.add_argument('checkpoint')
+    replace.add_argument('--force', action='store_true', help="restore even if it failed verification")
+    recover = subparsers.add_parser('recover', help="restore a backup by id")
+    recover.add_argument('backup_id')
+    recover.add_argument('--force', action='store_true', help="restore even if it failed verification")
+    extract = subparsers.add_parser('extract', help="write one file of a backup without restoring the rest")
+    extract.add_argument('backup_id')
+    extract.add_argument('path', help="path of the file inside the save, e.g. GAME_DATA")
+    extract.add_argument('--output', help="where to write it (default: its file name in the current dir)")
+    listing = subparsers.add_parser('list', help="list backups and checkpoints")
+    listing.add_argument('--kind', choices=['all', 'backups', 'checkpoints'], default='all')
+    verify = subparsers.add_parser('verify', help="scrub backups and checkpoints against their checksums")
+    verify.add_argument('--kind', choices=['all', 'backups', 'checkpoints'], default='all')
+    prune = subparsers.add_parser('prune', help="apply the retention policy")
+    prune.add_argument('--dry-run', action='store_true')
+    pin = subparsers.add_parser('pin', help="protect a backup from retention")
+    pin.add_argument('backup_id')
+    unpin = subparsers.add_parser('unpin', help="release a pinned backup")
+    unpin.add_argument('backup_id')
+    similar = subparsers.add_parser('similar', help="nearest checkpoints/backups and the inferred chapter")
+    similar.add_argument('ref', nargs='?', help="backup id or checkpoint name (default: the live save)")
+    similar.add_argument('--limit', type=int, default=5)
+    watch = subparsers.add_parser('watch', help="snapshot the live save whenever the game writes it")
+    watch.add_argument('--debounce', type=float, default=2.0, help="quiet seconds that end a burst of writes")
+    watch.add_argument('--stable-for', type=float, default=1.0, help="seconds the tree must hold still")
+    watch.add_argument('--min-interval', type=float, default=60.0, help="minimum seconds between snapshots")
+    watch.add_argument('--poll-interval', type=float, default=2.0, help="stat polling period when no OS notifications")
+    watch.add_argument('--duration', type=float, help="stop after this many seconds (default: until Ctrl-C)")
+    schedule = subparsers.add_parser('schedule', help="run throttled, low-priority backups in the background")
+    schedule.add_argument('--interval', type=float, default=900.0, help="seconds between periodic backups (0: none)")
+    schedule.add_argument('--rate', type=float, default=BACKGROUND_BACKUP_RATE / (1024 * 1024),
+                          help="copy rate limit in MiB/s (0: unlimited)")
+    schedule.add_argument('--watch', action='store_true', help="also back up after every burst of game writes")
+    schedule.add_argument('--stable-for', type=float, default=1.0, help="seconds the tree must hold still")
+    schedule.add_argument('--normal-priority', action='store_true', help="don't lower CPU/disk priority")
+    schedule.add_argument('--duration', type=float, help="stop after this many seconds (default: until Ctrl-C)")
+    for action, help_text in (('backup', "back up every save root"),
+                              ('replace', "replace every save root with a checkpoint"),
+                              ('verify', "check every stored backup of every save root")):
+        fleet = subparsers.add_parser(f'fleet-{action}', help=help_text + " in parallel")
+        if action == 'replace':
+            fleet.add_argument('checkpoint')
+        fleet.add_argument('--jobs', type=int, help="roots processed at once (default: CPU count + 4, or CPU count with --processes)")
+        fleet.add_argument('--processes', action='store_true', help="use a process pool instead of threads")
+    return parser
+
+def manager_from_args(args):
+    """Headless SaveDataManager configured from parsed arguments"""
+    return SaveDataManager(
+        game_save_dir=args.save_dir,
+        checkpoints_dir=args.checkpoints_dir,
+        checkpoint_archives=args.checkpoint_archives,
+        store_dir=args.store_dir,
+        storage_mode=args.storage_mode,
+        swap_mode="atomic" if args.atomic else "overlay",
+        retention=False if args.no_retention else None,
+        quiet=True,
+        copy_workers=args.workers,
+        verify_restores=not args.no_read_back,
+        compress_level=args.compress_level,
+        metrics_file=args.metrics_file,
+    )
+
+def chapter_json(chapter):
+    if chapter is None:
+        return None
+    name, similarity, basis = chapter
+    return {'checkpoint': name, 'similarity': round(similarity, 4), 'basis': basis}
+
+def copy_strategies(manager):
+    """Relative path -> copy strategy for the files the last replace/recover wrote"""
+    if not manager.last_copy:
+        return {}
+    # An atomic swap copies into the staging dir first
+    roots = [manager.game_save_dir, manager.swap_paths()[0]]
+    result = {}
+    for dst, strategy in sorted(manager.last_copy['strategy_by_file'].items()):
+        root = next((root for root in roots if dst.startswith(root + os.sep)), manager.game_save_dir)
+        result[os.path.relpath(dst, root).replace(os.sep, '/')] = strategy
+    return result
+
+def run_operation_command(manager, args, kind, **options):
+    """Run a backup/replace/recover as an Operation; Ctrl-C cancels it. Returns (ok, state)."""
+    subscribers = [JsonEventLog()] if args.events else []
+    operation = manager.submit(kind, subscribers, **options)
+    try:
+        operation.join()
+    except KeyboardInterrupt:
+        operation.cancel()
+        operation.join()
+    return operation.ok, operation.state
+
+def run_command(manager, args):
+    """Run one subcommand. Returns (exit code, result dict)."""
+    if args.command == 'backup':
+        ok, state = run_operation_command(manager, args, 'backup', origin=args.origin)
+        return (EXIT_OK if ok else EXIT_FAILED), {'backup_id': manager.last_snapshot_id, 'state': state,
+                                                  'transfer': manager.last_transfer}
+
+    if args.command == 'replace':
+        if manager.find_checkpoint(args.checkpoint) is None:
+            manager.fail(f"Checkpoint '{args.checkpoint}' not found!")
+            return EXIT_NOT_FOUND, {'checkpoint': args.checkpoint}
+        ok, state = run_operation_command(manager, args, 'replace', checkpoint_name=args.checkpoint,
+                                          force=args.force)
+        return (EXIT_OK if ok else EXIT_FAILED), {'checkpoint': args.checkpoint, 'state': state,
+                                                  'copy_strategies': copy_strategies(manager)}
+
+    if args.command == 'recover':
+        if not manager.store.has_snapshot(args.backup_id) and not os.path.isdir(args.backup_id):
+            manager.fail(f"Backup not found: {args.backup_id}")
+            return EXIT_NOT_FOUND, {'backup_id': args.backup_id}
+        ok, state = run_operation_command(manager, args, 'recover', backup_ref=args.backup_id,
+                                          force=args.force)
+        return (EXIT_OK if ok else EXIT_FAILED), {'backup_id': args.backup_id, 'state': state,
+                                                  'copy_strategies': copy_strategies(manager),
+                                                  'transfer': manager.last_transfer}
+
+    if args.command == 'extract':
+        if not manager.store.has_snapshot(args.backup_id):
+            manager.fail(f"Backup not found: {args.backup_id}")
+            return EXIT_NOT_FOUND, {'backup_id': args.backup_id}
+        rel_path = args.path.replace('\\', '/').strip('/')
+        if rel_path not in {entry['path'] for entry in manager.store.load_snapshot(args.backup_id)['files']}:
+            manager.fail(f"{rel_path} is not in backup {args.backup_id}")
+            return EXIT_NOT_FOUND, {'backup_id': args.backup_id, 'path': args.path}
+        output = args.output or os.path.basename(rel_path)
+        start = time.perf_counter()
+        size = manager.extract_file(args.backup_id, rel_path, output)
+        if size is None:
+            return EXIT_FAILED, {'backup_id': args.backup_id, 'path': args.path}
+        return EXIT_OK, {'backup_id': args.backup_id, 'path': args.path, 'output': os.path.abspath(output),
+                         'bytes': size, 'seconds': round(time.perf_counter() - start, 6)}
+
+    if args.command == 'list':
+        result = {}
+        with manager.phase('index'):
+            manager.refresh_index()
+            if args.kind in ('all', 'backups'):
+                entries = manager.index.entries('snapshots')
+                chapters = manager.backup_chapters()
+                result['backups'] = [{**entries[backup_id], 'chapter': chapter_json(chapters.get(backup_id)),
+                                      'integrity': manager.integrity.result('snapshot', backup_id)}
+                                     for backup_id, _ in manager.list_backups()]
+            if args.kind in ('all', 'checkpoints'):
+                entries = manager.index.entries('checkpoints')
+                result['checkpoints'] = [{**entries[name], 'integrity': manager.integrity.result('checkpoint', name)}
+                                         for name in manager.list_checkpoints()]
+        return EXIT_OK, result
+
+    if args.command == 'verify':
+        results = manager.scrub(backups=args.kind in ('all', 'backups'),
+                                checkpoints=args.kind in ('all', 'checkpoints'))
+        corrupt = [f"{kind}/{name}" for kind, section in results.items()
+                   for name, outcome in section.items() if outcome['state'] == 'corrupt']
+        if corrupt:
+            manager.fail(f"{len(corrupt)} corrupt: {', '.join(corrupt)}")
+        return (EXIT_FAILED if corrupt else EXIT_OK), results
+
+    if args.command == 'prune':
+        with manager.phase('prune'):
+            planned = manager.prune_backups(dry_run=args.dry_run)
+        return EXIT_OK, {
+            'dry_run': args.dry_run,
+            'pruned': [{'id': backup_id, 'reason': reason, 'bytes_freed': freed}
+                       for backup_id, reason, freed in planned],
+        }
+
+    if args.command == 'similar':
+        with manager.phase('similar'):
+            found = manager.find_similar(args.ref, args.limit)
+        if found is None:
+            manager.fail(f"No {SIMILARITY_FILE} found for {args.ref or 'the live save'}")
+            return EXIT_NOT_FOUND, {'ref': args.ref}
+        return EXIT_OK, {
+            'ref': args.ref,
+            'chapter': chapter_json(found['chapter']),
+            'neighbors': [{'kind': kind, 'id': entry_id, 'similarity': round(similarity, 4)}
+                          for kind, entry_id, similarity in found['neighbors']],
+        }
+
+    if args.command in ('pin', 'unpin'):
+        if not manager.store.has_snapshot(args.backup_id):
+            manager.fail(f"Backup not found: {args.backup_id}")
+            return EXIT_NOT_FOUND, {'backup_id': args.backup_id}
+        manager.pin_backup(args.backup_id, args.command == 'pin')
+        return EXIT_OK, {'backup_id': args.backup_id, 'pinned': args.command == 'pin'}
+
+    if args.command == 'schedule':
+        scheduler = manager.start_scheduler(interval=args.interval or None,
+                                            rate=args.rate * 1024 * 1024 if args.rate else None,
+                                            stable_for=args.stable_for, low_priority=not args.normal_priority)
+        backend = manager.start_watcher(stable_for=args.stable_for) if args.watch else None
+        try:
+            scheduler.stop_event.wait(args.duration)
+        except KeyboardInterrupt:
+            pass
+        manager.stop_watcher()
+        manager.stop_scheduler()
+        return (EXIT_FAILED if scheduler.errors else EXIT_OK), {'watch_backend': backend, **scheduler.stats()}
+
+    if args.command == 'watch':
+        backend = manager.start_watcher(debounce=args.debounce, stable_for=args.stable_for,
+                                        min_interval=args.min_interval, poll_interval=args.poll_interval)
+        watcher = manager.watcher
+        try:
+            watcher.stop_event.wait(args.duration)
+        except KeyboardInterrupt:
+            pass
+        manager.stop_watcher()
+        return (EXIT_FAILED if watcher.errors else EXIT_OK), {
+            'backend': backend,
+            'snapshots': watcher.snapshots,
+            'errors': watcher.errors,
+        }
+
+    return EXIT_USAGE, {}
+
+def run_fleet_cli(args, start):
+    """
+    fleet-* commands: one manager per save root, each with its own store next to it
+    (or under --store-dir). Returns (exit code, output dict) for run_cli to print.
+    """
+    patterns = args.save_roots or [p for p in os.environ.get(SAVE_ROOTS_ENV, '').split(os.pathsep) if p]
+    roots = expand_save_roots(patterns)
+    action = args.command[len('fleet-'):]
+    settings = {
+        'checkpoints_dir': args.checkpoints_dir,
+        'checkpoint_archives': args.checkpoint_archives,
+        'store_parent': args.store_dir,
+        'storage_mode': args.storage_mode,
+        'swap_mode': "atomic" if args.atomic else "overlay",
+        'retention': False if args.no_retention else None,
+        'copy_workers': args.workers,
+        'verify_restores': not args.no_read_back,
+        'compress_level': args.compress_level,
+        'metrics_dir': args.metrics_file,
+    }
+    error = None
+    if not roots:
+        code, summaries, error = EXIT_USAGE, [], f"no save roots matched (use --save-root or ${SAVE_ROOTS_ENV})"
+    else:
+        try:
+            check_fleet_stores(roots, args.store_dir)
+        except ValueError as e:
+            code, summaries, error = EXIT_USAGE, [], str(e)
+    if error is None:
+        summaries = run_fleet(roots, action, getattr(args, 'checkpoint', None), settings,
+                              jobs=args.jobs, processes=args.processes)
+        failed = [summary['root'] for summary in summaries if not summary['ok']]
+        code = EXIT_FAILED if failed else EXIT_OK
+        if failed:
+            error = f"{len(failed)} of {len(roots)} root(s) failed"
+    output = {
+        'command': args.command,
+        'ok': code == EXIT_OK,
+        'exit_code': code,
+        'result': {
+            'roots': summaries,
+            'succeeded': sum(summary['ok'] for summary in summaries),
+            'failed': sum(not summary['ok'] for summary in summaries),
+        },
+        'error': error,
+        'total_seconds': round(time.perf_counter() - start, 6),
+    }
+    return code, output
+
+class ProfileSession:
+    """
+    Tracing for one run. The spans are written as Chrome trace JSON, or, when the
+    path ends in .prof or .pstats, a cProfile dump of every thread is written instead
+    (open it with pstats or snakeviz).
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.cprofile = path.lower().endswith(('.prof', '.pstats'))
+        self.profilers = []
+
+    def start(self):
+        TRACER.enable()
+        if self.cprofile:
+            import cProfile
+            profiler = cProfile.Profile()
+            self.profilers.append(profiler)
+            # Threads started from now on (operation worker, copy pool) get their own profiler
+            threading.setprofile(self.profile_thread)
+            profiler.enable()
+
+    def profile_thread(self, frame, event, arg):
+        import cProfile
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # Python 3.12+ profiles every thread from the first profiler
+        with TRACER.lock:
+            self.profilers.append(profiler)
+
+    def stop(self):
+        """Stop tracing and write the output. Returns the span summary for the JSON result."""
+        TRACER.disable()
+        if self.cprofile:
+            import pstats
+            threading.setprofile(None)
+            for profiler in self.profilers:
+                profiler.disable()
+            pstats.Stats(*self.profilers).dump_stats(self.path)
+        else:
+            TRACER.write_chrome_trace(self.path)
+        return {'path': self.path, 'format': 'cprofile' if self.cprofile else 'chrome-trace',
+                'spans': {name: {key: round(value, 6) if isinstance(value, float) else value
+                                 for key, value in total.items()}
+                          for name, total in TRACER.summary().items()}}
+
+@contextlib.contextmanager
+def profiling(path):
+    """Run a block under a ProfileSession when path is set. Yields a dict the summary lands in."""
+    result = {}
+    if not path:
+        yield result
+        return
+    session = ProfileSession(path)
+    session.start()
+    try:
+        yield result
+    finally:
+        result.update(session.stop())
+
+def run_cli(argv):
+    """Headless entry point: no screen clearing, menus or progress bars, one JSON document on stdout"""
+    args = build_arg_parser().parse_args(argv)
+    start = time.perf_counter()
+    if args.command.startswith('fleet-'):
+        with profiling(args.profile) as profile:
+            code, output = run_fleet_cli(args, start)
+        if profile:
+            output['profile'] = profile
+        print(json.dumps(output, ensure_ascii=False))
+        return code
+    with profiling(args.profile) as profile:
+        manager = manager_from_args(args)
+        startup = {}
+        with manager.phase('startup'):
+            startup['swap_recovery'] = manager.recover_interrupted_swap()
+            # Never deleted without asking; the menu offers to migrate them
+            startup['legacy_backups'] = manager.list_legacy_backups()
+
+        manager.skipped = []
+        try:
+            code, result = run_command(manager, args)
+        except Exception as e:
+            manager.last_error = str(e)
+            code, result = EXIT_FAILED, {}
+
+    output = {
+        'command': args.command,
+        'ok': code == EXIT_OK,
+        'exit_code': code,
+        'result': result,
+        'skipped': manager.skipped,
+        'error': None if code == EXIT_OK else manager.last_error,
+        'startup': startup,
+        'timings': {name: round(seconds, 6) for name, seconds in manager.timings.items()},
+        'total_seconds': round(time.perf_counter() - start, 6),
+    }
+    if profile:
+        output['profile'] = profile
+    print(json.dumps(output, ensure_ascii=False))
+    return code
+
+# Set to a .json/.prof path to trace the interactive program the way --profile traces a command
+PROFILE_ENV = 'SAVEDATA_MANAGER_PROFILE'
+
+# Set by build.py --bench-startup to exit as soon as the first menu is drawn
+STARTUP_PROBE_ENV = 'SAVEDATA_MANAGER_STARTUP_PROBE'
+
 def main():
     # Enable ANSI escape sequences on Windows
     if os.name == 'nt':
         os.system('color')
     
-    manager = SaveDataManager()
-    
+    with profiling(os.environ.get(PROFILE_ENV)):
+        manager = SaveDataManager()
+        swap_recovery = manager.recover_interrupted_swap()
+        if swap_recovery:
+            print(f"{GREEN}Startup check: {swap_recovery}.{RESET}")
+        confirm_legacy_migration(manager)
+        # Resize notifications can only be hooked here; operations draw from a worker thread
+        TERMINAL.install()
+        try:
+            menu_loop(manager)
+        finally:
+            # Exiting: don't sit out the watcher's current wait, just let a running snapshot finish
+            manager.stop_watcher(wait=False)
+            manager.stop_scheduler()
+
+def run_operation(manager, kind, **options):
+    """Run an operation from the menu and wait for it; Ctrl-C cancels it and rolls the save back"""
+    operation = manager.submit(kind, **options)
+    try:
+        return operation.join()
+    except KeyboardInterrupt:
+        operation.cancel()
+        operation.join()
+    if operation.state == 'cancelled':
+        print(f"{GREEN}Cancelled, the save was left as it was.{RESET}")
+    return operation.ok
+
+def integrity_label(manager, kind, entry_id):
+    return " [CORRUPT]" if manager.integrity.is_corrupt(kind, entry_id) else ""
+
+def confirm_if_corrupt(manager, kind, entry_id):
+    """Warn before restoring something that failed verification. Returns force, or None if the user backs out."""
+    if not manager.integrity.is_corrupt(kind, entry_id):
+        return False
+    for problem in manager.integrity.result(kind, entry_id)['problems'][:5]:
+        print(f"{GREEN}  {problem}{RESET}")
+    answer = input(f"{GREEN}This failed verification and may be damaged. Restore it anyway? (y/N): {RESET}")
+    if answer.strip().lower() != 'y':
+        print(f"{GREEN}Not restored.{RESET}")
+        return None
+    return True
+
+def confirm_legacy_migration(manager):
+    """Offer to fold legacy backup folders into the store, which deletes them; otherwise leave them be"""
+    legacy_backups = manager.list_legacy_backups()
+    if not legacy_backups:
+        return
+    print(f"{GREEN}Found {len(legacy_backups)} legacy backup folder(s) in {manager.backup_root}.{RESET}")
+    answer = input(f"{GREEN}Move them into the backup store? The folders are deleted once verified. (y/N): {RESET}")
+    if answer.strip().lower() != 'y':
+        print(f"{GREEN}Left in place; they are still listed as backups.{RESET}")
+        return
+    migrated = manager.migrate_legacy_backups()
+    print(f"{GREEN}Migrated {migrated} legacy backup folder(s) into the backup store.{RESET}")
+
+def menu_loop(manager):
     while True:
         manager.ui.clear_screen()
         manager.ui.draw_header("世界断点检查程序")
         manager.ui.print_menu()
+        if os.environ.get(STARTUP_PROBE_ENV):
+            # build.py --bench-startup: the menu is on screen, stop the clock here
+            return
+        # Warm the content cache while the user reads the menu
+        manager.start_preload()
+        if manager.scheduler is None:
+            # Started once the first menu is up, so they never delay it. Auto snapshots go
+            # through the scheduler, so they never compete with the game for the disk
+            manager.start_scheduler()
+            manager.start_watcher()
         
         choice = input(f"\n{GREEN}Enter your choice (1-4): {RESET}")
         
@@ -245,26 +5309,28 @@ def main():
         if choice == "1":
             checkpoints = manager.list_checkpoints()
             if not checkpoints:
-                print(f"{GREEN}No checkpoints found! Please ensure checkpoints are in the './checkpoints' directory.{RESET}")
+                print(f"{GREEN}No checkpoints found! Please ensure checkpoints are in the './checkpoints' directory or a zip next to this program.{RESET}")
                 continue
             
             print(f"\n{GREEN}Available checkpoints:")
             for i, checkpoint in enumerate(checkpoints):
-                print(f"{BRIGHT_GREEN}{i+1}. {checkpoint}{RESET}")
+                print(f"{BRIGHT_GREEN}{i+1}. {checkpoint}{integrity_label(manager, 'checkpoint', checkpoint)}{RESET}")
             
             try:
                 idx = int(input(f"\n{GREEN}Select checkpoint number: {RESET}")) - 1
                 if 0 <= idx < len(checkpoints):
-                    manager.ui.clear_screen()
-                    manager.ui.draw_header("世界断点检查程序")
-                    manager.replace_savedata(checkpoints[idx])
+                    force = confirm_if_corrupt(manager, 'checkpoint', checkpoints[idx])
+                    if force is not None:
+                        manager.ui.clear_screen()
+                        manager.ui.draw_header("世界断点检查程序")
+                        run_operation(manager, 'replace', checkpoint_name=checkpoints[idx], force=force)
                 else:
                     print(f"{GREEN}Invalid selection!{RESET}")
             except ValueError:
                 print(f"{GREEN}Invalid input! Please enter a number.{RESET}")
         
         elif choice == "2":
-            manager.backup_savedata()
+            run_operation(manager, 'backup')
         
         elif choice == "3":
             backups = manager.list_backups()
@@ -272,16 +5338,20 @@ def main():
                 print(f"{GREEN}No backups found!{RESET}")
                 continue
             
+            chapters = manager.backup_chapters()
             print(f"\n{GREEN}Available backups:")
             for i, (backup_name, _) in enumerate(backups):
-                print(f"{BRIGHT_GREEN}{i+1}. {backup_name}{RESET}")
+                print(f"{BRIGHT_GREEN}{i+1}. {backup_name} {chapter_label(chapters.get(backup_name))}"
+                      f"{integrity_label(manager, 'snapshot', backup_name)}{RESET}")
             
             try:
                 idx = int(input(f"\n{GREEN}Select backup number: {RESET}")) - 1
                 if 0 <= idx < len(backups):
-                    manager.ui.clear_screen()
-                    manager.ui.draw_header("世界断点检查程序")
-                    manager.recover_savedata(backups[idx][1])
+                    force = confirm_if_corrupt(manager, 'snapshot', backups[idx][1])
+                    if force is not None:
+                        manager.ui.clear_screen()
+                        manager.ui.draw_header("世界断点检查程序")
+                        run_operation(manager, 'recover', backup_ref=backups[idx][1], force=force)
                 else:
                     print(f"{GREEN}Invalid selection!{RESET}")
             except ValueError:
@@ -297,4 +5367,10 @@ def main():
         input(f"\n{GREEN}Press Enter to continue...{RESET}")
 
 if __name__ == "__main__":
+    if getattr(sys, 'frozen', False):
+        # fleet-* --processes starts workers by re-running the exe
+        import multiprocessing
+        multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
\ No newline at end of file
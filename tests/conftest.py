@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import savedata_manager as sm
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    """Factory for a quiet manager on a temp save dir, store and checkpoints folder"""
+    save_dir = tmp_path / 'LocalLow' / 'WomanCommunication'
+    checkpoints_dir = tmp_path / 'checkpoints'
+    store_dir = tmp_path / 'store'
+    save_dir.mkdir(parents=True)
+    checkpoints_dir.mkdir()
+
+    def make(**options):
+        settings = dict(game_save_dir=str(save_dir), checkpoints_dir=str(checkpoints_dir),
+                        store_dir=str(store_dir), checkpoint_archives=[], retention=False,
+                        quiet=True, preload_cache_bytes=0)
+        settings.update(options)
+        return sm.SaveDataManager(**settings)
+
+    return make
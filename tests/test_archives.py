@@ -0,0 +1,40 @@
+import os
+import zipfile
+
+import pytest
+
+import savedata_manager as sm
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('chapter/GAME_DATA', 'chapter/GAME_DATA'),
+    ('chapter//sub/./GAME_DATA', 'chapter/sub/GAME_DATA'),
+    ('chapter/', 'chapter'),
+    ('../GAME_DATA', None),
+    ('chapter/../../GAME_DATA', None),
+    ('/etc/passwd', None),
+    ('C:/Windows/GAME_DATA', None),
+    ('chapter/GAME_DATA:stream', None),
+    ('', None),
+    ('./', None),
+])
+def test_safe_member_path(name, expected):
+    assert sm.safe_member_path(name) == expected
+
+
+def test_zip_archive_skips_unsafe_members(tmp_path):
+    path = str(tmp_path / 'checkpoints.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('chapter/GAME_DATA', b'good')
+        archive.writestr('chapter/../../escape', b'bad')
+        archive.writestr('/absolute/GAME_DATA', b'bad')
+        archive.writestr('other/C:/GAME_DATA', b'bad')
+        archive.writestr('notes.txt', b'loose file')
+    checkpoints = sm.ZipCheckpointArchive(path, sm.HashCache(str(tmp_path / 'hashes.json'))).load()
+    assert sorted(checkpoints) == ['chapter']
+    assert [rel_path for rel_path, _ in checkpoints['chapter'].files()] == ['GAME_DATA']
+
+    dst_dir = str(tmp_path / 'restored')
+    sm.CopyEngine().run(checkpoints['chapter'].plan(dst_dir))
+    assert os.listdir(dst_dir) == ['GAME_DATA']
+    assert not os.path.exists(tmp_path / 'escape')
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import savedata_manager as sm
+from conftest import write
+
+
+def test_fleet_uses_the_menu_store(make_manager):
+    manager = make_manager(store_dir=None)
+    root = manager.game_save_dir
+    assert sm.fleet_store_dir(None, root) == manager.store.root
+    assert sm.fleet_store_dir('/stores', root) == os.path.join('/stores', sm.fleet_root_key(root))
+
+
+def test_sibling_roots_need_a_store_dir(tmp_path):
+    roots = [str(tmp_path / 'Game1'), str(tmp_path / 'Game2')]
+    with pytest.raises(ValueError, match='--store-dir'):
+        sm.check_fleet_stores(roots)
+    sm.check_fleet_stores(roots, str(tmp_path / 'stores'))
+
+
+def test_globs_skip_stores_by_marker(tmp_path):
+    write(str(tmp_path / 'Game' / 'GAME_DATA'), b'save')
+    write(str(tmp_path / 'SavedataManager' / 'readme.txt'), b'not a store yet')
+    write(str(tmp_path / 'backups' / 'refs.json'), b'{}')
+    write(str(tmp_path / 'backups' / 'snapshots' / 'x.json'), b'{}')
+    roots = sm.expand_save_roots([str(tmp_path / '*'), str(tmp_path / 'backups' / '*')])
+    assert roots == [str(tmp_path / 'Game'), str(tmp_path / 'SavedataManager')]
@@ -0,0 +1,30 @@
+import os
+
+import savedata_manager as sm
+from conftest import write
+
+
+def make_legacy(manager):
+    backup_dir = os.path.join(manager.backup_root, f"{manager.backup_prefix}-20250101-120000")
+    write(os.path.join(backup_dir, 'GAME_DATA'), b'legacy')
+    return backup_dir
+
+
+def test_declining_leaves_legacy_folders(make_manager, monkeypatch):
+    manager = make_manager()
+    backup_dir = make_legacy(manager)
+    monkeypatch.setattr('builtins.input', lambda prompt: 'n')
+    sm.confirm_legacy_migration(manager)
+    assert os.path.isdir(backup_dir)
+    assert manager.list_backups() == [(os.path.basename(backup_dir), backup_dir)]
+
+
+def test_confirming_migrates_and_deletes(make_manager, monkeypatch):
+    manager = make_manager()
+    backup_dir = make_legacy(manager)
+    monkeypatch.setattr('builtins.input', lambda prompt: 'y')
+    sm.confirm_legacy_migration(manager)
+    snapshot_id = os.path.basename(backup_dir)
+    assert not os.path.exists(backup_dir)
+    assert manager.store.verify_snapshot(snapshot_id)
+    assert [backup_id for backup_id, _ in manager.list_backups()] == [snapshot_id]
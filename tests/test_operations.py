@@ -0,0 +1,66 @@
+import os
+
+import savedata_manager as sm
+from conftest import write, read
+
+
+def setup_replace(make_manager, **options):
+    manager = make_manager(**options)
+    live_path = os.path.join(manager.game_save_dir, 'GAME_DATA')
+    write(live_path, b'live progress' * 1000)
+    write(os.path.join(manager.game_save_dir, 'extra', 'settings'), b'live settings')
+    write(os.path.join(manager.checkpoints_dir, 'chapter', 'GAME_DATA'), b'checkpoint' * 100000)
+    write(os.path.join(manager.checkpoints_dir, 'chapter', 'added'), b'only in the checkpoint')
+    return manager, live_path
+
+
+def live_tree(manager):
+    return {rel_path: read(path) for rel_path, path, _, _ in sm.scan_tree(manager.game_save_dir)[1]}
+
+
+def test_cancel_mid_replace_rolls_back_to_pre_backup(make_manager):
+    manager, live_path = setup_replace(make_manager, swap_mode='overlay')
+    before = live_tree(manager)
+    events = []
+
+    def cancel_on_copy(event):
+        events.append(event)
+        if event['type'] == 'phase' and event['name'] == 'copy' and event['state'] == 'begin':
+            operation.cancel()
+
+    operation = manager.operations.submit('replace', subscribers=[cancel_on_copy], checkpoint_name='chapter')
+    assert operation.join(timeout=30) is False
+    assert operation.state == 'cancelled'
+
+    assert live_tree(manager) == before
+    rollbacks = [event for event in events if event['type'] == 'rollback']
+    assert [event['snapshot'] for event in rollbacks] == [manager.last_backup_id]
+    assert manager.store.has_snapshot(manager.last_backup_id)
+
+
+def test_failed_copy_rolls_back_a_write_made_after_hashing(make_manager):
+    """The rollback target is the pre-backup itself, not a backup matching the earlier hash"""
+    manager, live_path = setup_replace(make_manager, swap_mode='overlay')
+    assert manager.backup_savedata(silent=True)
+    older = manager.last_backup_id
+    tree_digests = manager.tree_digests
+
+    def hash_then_game_writes(*args, **kwargs):
+        digests = tree_digests(*args, **kwargs)
+        if args and args[0] == manager.game_save_dir:
+            write(live_path, b'written by the game')
+        return digests
+
+    def failing_copy(plan, *args, **kwargs):
+        write(live_path, b'half copied')
+        raise OSError("disk full")
+
+    manager.tree_digests = hash_then_game_writes
+    manager.run_plan_with_progress = failing_copy
+    assert not manager.replace_savedata('chapter')
+
+    assert manager.last_backup_id != older
+    assert read(live_path) == b'written by the game'
+    assert not os.path.exists(os.path.join(manager.game_save_dir, 'added'))
+    assert read(os.path.join(manager.game_save_dir, 'extra', 'settings')) == b'live settings'
+
@@ -0,0 +1,60 @@
+import os
+from datetime import datetime, timedelta
+
+import savedata_manager as sm
+from conftest import write
+
+NOW = datetime(2026, 1, 31, 12, 0, 0)
+
+
+def make_backups(tmp_path, ages_in_days, pinned=()):
+    """A store with one snapshot per age, oldest first; returns (store, index entries)"""
+    store = sm.ObjectStore(str(tmp_path / 'store'))
+    src_dir = str(tmp_path / 'save')
+    entries = []
+    for i, days in enumerate(ages_in_days):
+        write(os.path.join(src_dir, 'GAME_DATA'), b'backup %d' % i)
+        snapshot_id = f'snap-{i}'
+        store.create_snapshot(src_dir, snapshot_id, created=NOW - timedelta(days=days))
+        if snapshot_id in pinned:
+            store.set_pinned(snapshot_id)
+        entries.append(sm.BackupIndex.snapshot_entry(store.load_snapshot(snapshot_id)))
+    return store, entries
+
+
+def planned_ids(policy, store, entries):
+    return [snapshot_id for snapshot_id, _, _ in policy.plan(entries, NOW, store)]
+
+
+def test_old_backups_are_pruned_oldest_first(tmp_path):
+    store, entries = make_backups(tmp_path, [40, 35, 5, 1])
+    policy = sm.RetentionPolicy(keep_min=0)
+    assert planned_ids(policy, store, entries) == ['snap-0', 'snap-1']
+
+
+def test_keep_min_protects_the_newest(tmp_path):
+    store, entries = make_backups(tmp_path, [40, 39, 38, 37])
+    policy = sm.RetentionPolicy(keep_min=2)
+    assert planned_ids(policy, store, entries) == ['snap-0', 'snap-1']
+
+
+def test_pinned_backups_are_never_pruned(tmp_path):
+    store, entries = make_backups(tmp_path, [40, 39, 38, 37], pinned={'snap-0'})
+    policy = sm.RetentionPolicy(keep_min=1, max_count=1)
+    assert planned_ids(policy, store, entries) == ['snap-1', 'snap-2']
+
+
+def test_one_backup_per_day_is_kept(tmp_path):
+    hour = 1 / 24
+    store, entries = make_backups(tmp_path, [3 + 3 * hour, 3 + 2 * hour, 3 + hour, 2])
+    policy = sm.RetentionPolicy(keep_min=0)
+    # The newest of the three backups from that day survives
+    assert planned_ids(policy, store, entries) == ['snap-0', 'snap-1']
+
+
+def test_max_count_and_freed_estimate(tmp_path):
+    store, entries = make_backups(tmp_path, [0.5, 0.4, 0.3, 0.2])
+    policy = sm.RetentionPolicy(keep_min=0, keep_all_for=24 * 3600, max_count=2)
+    planned = policy.plan(entries, NOW, store)
+    assert [snapshot_id for snapshot_id, _, _ in planned] == ['snap-0', 'snap-1']
+    assert [freed for _, _, freed in planned] == [len(b'backup 0'), len(b'backup 1')]
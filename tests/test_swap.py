@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+import savedata_manager as sm
+from conftest import write, read
+
+
+def setup_checkpoint(manager, name, data):
+    write(os.path.join(manager.checkpoints_dir, name, 'GAME_DATA'), data)
+
+
+def test_atomic_replace_parks_live_save_as_backup(make_manager):
+    manager = make_manager(swap_mode='atomic')
+    write(os.path.join(manager.game_save_dir, 'GAME_DATA'), b'live' * 100)
+    setup_checkpoint(manager, 'chapter', b'checkpoint' * 100)
+
+    assert manager.replace_savedata('chapter')
+    assert read(os.path.join(manager.game_save_dir, 'GAME_DATA')) == b'checkpoint' * 100
+    backup_id = manager.list_backups()[0][0]
+    assert manager.store.verify_snapshot(backup_id)
+    assert not os.path.exists(manager.swap_journal_path)
+
+
+def test_live_write_during_staging_is_kept(make_manager):
+    """The game writing the save between planning and the swap must not lose that write"""
+    manager = make_manager(swap_mode='atomic')
+    live_path = os.path.join(manager.game_save_dir, 'GAME_DATA')
+    write(live_path, b'old progress')
+    # An older backup with the content the live save has when the replace is planned
+    assert manager.backup_savedata(silent=True)
+    setup_checkpoint(manager, 'chapter', b'checkpoint')
+
+    stage = manager.run_plan_with_progress
+
+    def stage_then_write(plan, *args, **kwargs):
+        result = stage(plan, *args, **kwargs)
+        write(live_path, b'NEW PROGRESS')
+        return result
+
+    manager.run_plan_with_progress = stage_then_write
+    assert manager.replace_savedata('chapter')
+
+    newest = manager.list_backups()[0][0]
+    manifest = manager.store.load_snapshot(newest)
+    assert [entry['path'] for entry in manifest['files']] == ['GAME_DATA']
+    assert manager.store.read_object(manifest['files'][0]['digest']) == b'NEW PROGRESS'
+    results = manager.scrub(checkpoints=False)['backups']
+    assert all(result['state'] == 'ok' for result in results.values())
+
+
+def interrupted_swap(manager, phase):
+    """Leave the store and save dir as a crash during the given swap phase would"""
+    staging, parked = manager.swap_paths()
+    live_digests = manager.tree_digests(manager.game_save_dir)
+    write(os.path.join(staging, 'GAME_DATA'), b'incoming')
+    journal = {
+        'phase': 'staged',
+        'live': manager.game_save_dir,
+        'staging': staging,
+        'parked': parked,
+        'keep_parked': True,
+        'snapshot_id': manager.store.new_snapshot_id(manager.backup_prefix),
+        'origin': "test swap",
+        'digests': {},
+    }
+    if phase in ('parked', 'swapped', 'parked-unjournaled'):
+        os.rename(manager.game_save_dir, parked)
+        if phase != 'parked-unjournaled':
+            journal.update(phase='parked', digests=live_digests)
+    if phase == 'swapped':
+        os.rename(staging, manager.game_save_dir)
+        journal['phase'] = 'swapped'
+    manager.write_swap_journal(journal)
+    return journal
+
+
+@pytest.mark.parametrize('phase, live, kept', [
+    ('staged', b'live', False),
+    ('parked-unjournaled', b'incoming', True),
+    ('parked', b'incoming', True),
+    ('swapped', b'incoming', True),
+])
+def test_recover_interrupted_swap(make_manager, phase, live, kept):
+    manager = make_manager(swap_mode='atomic')
+    write(os.path.join(manager.game_save_dir, 'GAME_DATA'), b'live')
+    journal = interrupted_swap(manager, phase)
+
+    assert manager.recover_interrupted_swap()
+    staging, parked = manager.swap_paths()
+    assert read(os.path.join(manager.game_save_dir, 'GAME_DATA')) == live
+    assert not os.path.exists(staging)
+    assert not os.path.exists(parked)
+    assert not os.path.exists(manager.swap_journal_path)
+    assert manager.store.has_snapshot(journal['snapshot_id']) == kept
+    if kept:
+        manifest = manager.store.load_snapshot(journal['snapshot_id'])
+        assert manager.store.read_object(manifest['files'][0]['digest']) == b'live'
+        assert manager.store.verify_snapshot(journal['snapshot_id'])
+
+
+def test_recover_parked_save_without_journal(make_manager):
+    manager = make_manager(swap_mode='atomic')
+    staging, parked = manager.swap_paths()
+    write(os.path.join(parked, 'GAME_DATA'), b'parked')
+    write(os.path.join(staging, 'GAME_DATA'), b'staged')
+
+    assert manager.recover_interrupted_swap()
+    assert not os.path.exists(staging)
+    assert not os.path.exists(parked)
+    backup_id = manager.list_backups()[0][0]
+    manifest = manager.store.load_snapshot(backup_id)
+    assert manager.store.read_object(manifest['files'][0]['digest']) == b'parked'
+
+
+def test_nothing_to_recover(make_manager):
+    assert make_manager().recover_interrupted_swap() is None